@@ -1,20 +1,24 @@
 #!/usr/bin/python3
+import time
+# Taken before anything else is imported, so that the startup timings include the imports
+IMPORTS_STARTED_AT = time.perf_counter()
 from os import path
 import sys
 from multiprocessing import Process, Queue
 import argparse
 import logging
 import logging.handlers
-import watchtower
+import sqlite3
+from queue import Empty
 
-from get_aws_secrets import get_secret, write_secrets_to_env_file
-from location_finder import get_latitude_and_longitude, get_location
+from get_aws_secrets import get_secrets_cache
 from environment_variable import EnvironmentVariable
-from select_location_gui import SelectLocationGUI
 from display.display_tag_id_gui import DisplayTagIdGUI
+from display.generate_shipment_id import generate_shipment_id
 from tag_reader.tag_reader import TagReader
 from tag_reader.tag_reader_enums import TagReaderEnums
 from tag_reader.random_number_generator import RandomNumberGenerator
+from tag_reader.tag_ring_buffer import TagRingBuffer
 from weighing_scale.weighing_scale import WeighingScale
 from weighing_scale.weighing_scale_enums import WeighingScaleEnums
 from weighing_scale.weighing_scale_test import WeighingScaleTest
@@ -22,16 +26,32 @@ from barcode_scanner.barcode_scanner_enums import BarcodeScannerEnums
 from display.display_enums import DisplayEnums
 from barcode_scanner.barcode_scanner_reader import BarcodeScannerReader
 from barcode_scanner.barcode_scanner_reader_test import BarcodeScannerReaderTest
-from upload_carton_details import upload_carton_details
-from decode_carton_type import decode_epc_tags_into_product_details, get_carton_pack_type
+from carton.carton_job import CartonPipeline
+from carton.carton_job_enums import CartonJobState
+from carton.carton_type_speculator import CartonTypeSpeculator
 from common_enums import CommonEnums
-from exceptions import ApiError, UnknownCartonTypeError
+from make_api_request import MakeApiRequest
+from station_config import load_station_config
+from process_supervisor import ProcessSupervisor
+from startup_timer import StartupTimer
+from upload_sender.upload_journal import UploadJournal, get_upload_journal_path
+from upload_sender.upload_sender import UploadSender
+from upload_sender.upload_sender_enums import UploadSenderEnums
+from message_bus.message_dispatcher import MessageDispatcher
+from message_bus.messages import decode_message, ScanMessage, ResetMessage, QuitMessage, GetCartonTypeMessage, \
+    UploadMessage, CloseShipmentMessage, ApiProcessingMessage, ApiCompletedMessage, ApiErrorMessage, \
+    TagsAvailableMessage, DoneReadingTagsMessage, ScanCompleteMessage, WeightValueReadMessage, \
+    CartonBarcodeScanValueMessage, BarcodeScannerPermissionErrorMessage, CartonTypeDecidedMessage, \
+    CartonTypeFailedMessage, UploadSentMessage, UploadRetryingMessage, UploadRejectedMessage, HeartbeatMessage
 
 # This method is used to configure the watchtower handler which will be used to
 # log the events to AWS CloudWatch
 
 
 def listener_configurer():
+    # watchtower imports boto3, which takes long enough to hold up the startup of the station.
+    # Only the logging listener process needs it
+    import watchtower
     try:
         with open(filename, 'r') as f:
             system_location = f.readline()
@@ -89,6 +109,51 @@ def close_queues(queues_to_close):
 def close_processes(processes_to_close):
     for process in processes_to_close:
         process.join()
+
+def show_pipeline_status(display_queue, carton_pipeline):
+    display_queue.put({
+        'type': DisplayEnums.SHOW_PIPELINE_STATUS.value,
+        'data': carton_pipeline.get_status()
+    })
+
+def show_current_job(display_queue, carton_job):
+    """This method shows what has been collected for the carton at the station on a display that was restarted"""
+    if carton_job.carton_code != '':
+        display_queue.put({
+            'type': DisplayEnums.SHOW_SCANNED_BARCODE.value,
+            'data': {
+                'barcode': carton_job.carton_code
+            }
+        })
+    if carton_job.carton_weight != 0:
+        display_queue.put({
+            'type': DisplayEnums.SHOW_WEIGHT.value,
+            'data': {
+                'weight': carton_job.carton_weight
+            }
+        })
+    if len(carton_job.tags) > 0:
+        display_queue.put({
+            'type': DisplayEnums.SHOW_NUMBER_OF_TAGS.value,
+            'data': {
+                'tags': len(carton_job.tags)
+            }
+        })
+    if carton_job.carton_pack_type is not None:
+        display_queue.put({
+            'type': DisplayEnums.SHOW_CARTON_TYPE.value,
+            'data': {
+                'carton_type': carton_job.carton_pack_type
+            }
+        })
+
+def prewarm_barcode_scanner(barcode_scanner_queue, upload_journal):
+    barcode_scanner_queue.put({
+        'type': BarcodeScannerEnums.PREWARM_CARTON_CODES.value,
+        'data': {
+            'carton_codes': upload_journal.get_carton_codes_by_barcode()
+        }
+    })
         
 
 
@@ -107,25 +172,27 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description='Start the RFID process in either dev or prod mode')
     parser.add_argument('--env', action='store', type=str, dest='environment')
+    parser.add_argument('--capture', action='store', type=str, dest='capture_path',
+                        help='Record the raw bytes read from the RFID readers to this file')
 
     # Parse the environment from command line
-    environment = parser.parse_args().environment
+    arguments = parser.parse_args()
+    environment = arguments.environment
 
-    # Get the secrets from AWS and write them to a file
-    secrets = None
-    while secrets is None:
-        try:
-            print('Trying to get secrets')
-            secrets = get_secret(environment)
-            print(secrets)
-        except Exception as e:
-            raise e
-    
+    startup_timer = StartupTimer(IMPORTS_STARTED_AT)
+    startup_timer.mark('imports')
+
+    # The secrets fetched by an earlier run are written to the .env file straight away and
+    # fetched again in the background once they are old. Only a station that has never
+    # fetched them waits for Secrets Manager, and the child processes start in the meantime
+    secrets_cache = get_secrets_cache(environment)
     try:
-        write_secrets_to_env_file(secrets=secrets)
+        if secrets_cache.load() is False:
+            print('Fetching the secrets from Secrets Manager in the background')
     except Exception as e:
         print(e)
         sys.exit(1)
+    startup_timer.mark('secrets')
 
     # This variable will determine whether the location should be checked or not
     should_check_location = False
@@ -154,6 +221,10 @@ if __name__ == "__main__":
     # Start GPS process and allow user to select location only if
     # location has not already been set
     if should_check_location is True:
+        # These are only needed the first time the station starts, the GPS device is read through pyserial
+        from location_finder import get_latitude_and_longitude, get_location
+        from select_location_gui import SelectLocationGUI
+
         # Create a boolean to check if the location has been picked by the user
         has_location_been_picked = False
 
@@ -178,6 +249,8 @@ if __name__ == "__main__":
 
         # Pass data between the various processes
         location_data = gps_queue.get()
+        # The locations are looked up through the API, which needs the secrets
+        secrets_cache.wait_until_ready()
         possible_locations = get_location(location_data)
         select_location_gui_queue.put(possible_locations)
 
@@ -194,6 +267,12 @@ if __name__ == "__main__":
         # Stop processes and clear the list
         close_processes(processes)
         processes.clear()
+        startup_timer.mark('location')
+
+    # Fetch the authentication token in the background while the processes start up, the
+    # child processes pick it up from the shared token cache. Without secrets there is no
+    # token to fetch, so this waits until they have been fetched
+    secrets_cache.when_ready(MakeApiRequest.prefetch_authentication_token)
 
     # Create a queue and process for logging purposes
     logging_queue = Queue(-1)
@@ -208,207 +287,390 @@ if __name__ == "__main__":
 
     # Start the worker process that will implement all required handlers
     worker_configurer(logging_queue)
+    startup_timer.mark('logging')
+
+    # Every child process below is started by the supervisor, which starts a new one in its
+    # place if it dies or stops sending heartbeats. The queues outlive the processes
+    process_supervisor = ProcessSupervisor()
 
-    # Create the GUI and associated queue to allow the user to view the scanned tags
+    # Create the GUI and associated queue to allow the user to view the scanned tags. The
+    # shipment ID is kept here, so that a display that is restarted carries on with the same one
+    current_shipment_id = generate_shipment_id()
     display_tag_id_gui_queue = Queue()
-    display_tag_id_gui_process = DisplayTagIdGUI(
-        display_tag_id_gui_queue, main_queue)
-    processes.append(display_tag_id_gui_process)
+    process_supervisor.add('display', lambda: DisplayTagIdGUI(display_tag_id_gui_queue, main_queue, current_shipment_id))
     queues.append(display_tag_id_gui_queue)
 
+    # The tags read are passed to this process through shared memory, the main queue only
+    # carries a short message once there are new ones
+    tag_ring_buffer = TagRingBuffer(load_station_config()['tag_stream']['ring_buffer_capacity'])
+
     # Decide based on the environment variable passed in which process to launch
     # Either the tag reader process or the random number generator process
     if environment == EnvironmentVariable.PRODUCTION.value:
         read_tags_queue = Queue()
-        read_tags_process = TagReader(read_tags_queue, main_queue)
-        processes.append(read_tags_process)
+        process_supervisor.add('tag_reader', lambda: TagReader(
+            read_tags_queue, main_queue, tag_ring_buffer, capture_path=arguments.capture_path))
         queues.append(read_tags_queue)
 
         weighing_queue = Queue()
-        weighing_process = WeighingScale(weighing_queue, main_queue)
-        processes.append(weighing_process)
+        process_supervisor.add('weighing_scale', lambda: WeighingScale(weighing_queue, main_queue))
         queues.append(weighing_queue)
 
         barcode_scanner_queue = Queue()
-        barcode_scanner_process = BarcodeScannerReader(barcode_scanner_queue, main_queue)
-        processes.append(barcode_scanner_process)
-        queues.append(barcode_scanner_queue)       
+        process_supervisor.add('barcode_scanner', lambda: BarcodeScannerReader(barcode_scanner_queue, main_queue))
+        queues.append(barcode_scanner_queue)
     elif environment == EnvironmentVariable.DEVELOPMENT.value:
         read_tags_queue = Queue()
-        read_tags_process = RandomNumberGenerator(read_tags_queue, main_queue)
-        processes.append(read_tags_process)
+        process_supervisor.add('tag_reader', lambda: RandomNumberGenerator(read_tags_queue, main_queue, tag_ring_buffer))
         queues.append(read_tags_queue)
 
         weighing_queue = Queue()
-        weighing_process = WeighingScaleTest(weighing_queue, main_queue)
-        processes.append(weighing_process)
+        process_supervisor.add('weighing_scale', lambda: WeighingScaleTest(weighing_queue, main_queue))
         queues.append(weighing_queue)
 
         barcode_scanner_queue = Queue()
-        barcode_scanner_process = BarcodeScannerReaderTest(barcode_scanner_queue, main_queue)
-        processes.append(barcode_scanner_process)
+        process_supervisor.add('barcode_scanner', lambda: BarcodeScannerReaderTest(barcode_scanner_queue, main_queue))
         queues.append(barcode_scanner_queue)
     else:
         raise Exception('Unknown input for --env argument')
 
-    for process in processes:
-        process.start()
+    # Create the process that uploads the cartons written to the upload journal
+    upload_sender_queue = Queue()
+    process_supervisor.add('upload_sender', lambda: UploadSender(upload_sender_queue, main_queue))
+    queues.append(upload_sender_queue)
+
+    process_supervisor.start()
+    startup_timer.mark('child processes')
+
+    # Cartons left in the journal by the last run are picked up by the upload sender
+    upload_journal = UploadJournal(get_upload_journal_path())
+
+    # Every carton is a job of its own. A finished carton is handed over to the upload
+    # sender and the station starts on the next carton while it is being uploaded
+    carton_pipeline = CartonPipeline(upload_journal)
+    show_pipeline_status(display_tag_id_gui_queue, carton_pipeline)
+
+    # The cartons in the journal are the ones most likely to be scanned again, so their
+    # carton codes are handed to the barcode scanner up front
+    prewarm_barcode_scanner(barcode_scanner_queue, upload_journal)
+
+    # Decodes the tags into product details in the background while the scan is running
+    carton_type_speculator = CartonTypeSpeculator(main_queue)
+    startup_timer.mark('main process state')
+
+    # Every message the main process receives is routed to its handler below
+    main_dispatcher = MessageDispatcher()
+
+    @main_dispatcher.handles(ScanMessage)
+    def handle_scan(message):
+        # Everytime the user hits scan, start a fresh read
+        carton_pipeline.current_job.start_scan()
+        carton_type_speculator.reset()
+        show_pipeline_status(display_tag_id_gui_queue, carton_pipeline)
+        # The tags of an earlier scan that are still in the tag ring buffer are told apart by the scan ID
+        read_tags_queue.put({
+            'type': TagReaderEnums.START_READING_TAGS.value,
+            'data': {
+                'scan_id': carton_type_speculator.scan_id
+            }
+        })
+        weighing_queue.put(WeighingScaleEnums.START_WEIGHING.value)
+
+    @main_dispatcher.handles(ResetMessage)
+    def handle_reset(message):
+        # The barcode is cleared on the display as well, so it has to be scanned again
+        carton_pipeline.start_new_job()
+        carton_type_speculator.reset()
+        carton_type_speculator.set_carton_code(None)
+        show_pipeline_status(display_tag_id_gui_queue, carton_pipeline)
+        read_tags_queue.put(TagReaderEnums.CLEAR_TAG_DATA.value)
+
+    @main_dispatcher.handles(ApiProcessingMessage)
+    def handle_api_processing(message):
+        display_tag_id_gui_queue.put(CommonEnums.API_PROCESSING.value)
+
+    @main_dispatcher.handles(ApiCompletedMessage)
+    def handle_api_completed(message):
+        display_tag_id_gui_queue.put(CommonEnums.API_COMPLETED.value)
+
+    def read_tag_ring_buffer(write_index):
+        """This method adds the tags of the current scan written to the tag ring buffer up to write_index"""
+        carton_job = carton_pipeline.current_job
+
+        # Add the newly read tags to the set of tags to upload, which keeps them unique
+        # The tags stay as raw EPC bytes until they are sent to the API
+        new_epcs = [
+            epc for epc, scan_id, _, _ in tag_ring_buffer.read(write_index)
+            if scan_id == carton_type_speculator.scan_id
+        ]
+        if len(new_epcs) == 0:
+            return
+        carton_job.tags.update(new_epcs)
+        # Tags are decoded into product details in the background as they come in
+        carton_type_speculator.add_epcs(new_epcs)
+        display_tag_id_gui_queue.put({
+            'type': DisplayEnums.SHOW_NUMBER_OF_TAGS.value,
+            'data': {
+                'tags': len(carton_job.tags)
+            }
+        })
+
+    @main_dispatcher.handles(TagsAvailableMessage)
+    def handle_tags_available(message):
+        read_tag_ring_buffer(message.write_index)
+
+    @main_dispatcher.handles(DoneReadingTagsMessage)
+    def handle_done_reading_tags(message):
+        # Every tag of the scan is in the tag ring buffer by the time the scan is done
+        read_tag_ring_buffer(message.write_index)
+        # The end of a scan that has since been reset is ignored
+        if message.scan_id != carton_type_speculator.scan_id:
+            return
+        carton_job = carton_pipeline.current_job
+        if len(carton_job.tags) != message.tag_count:
+            logging.getLogger('main').log(
+                logging.ERROR, f"The scan read {message.tag_count} tags but {len(carton_job.tags)} reached the main process")
+
+        # Ask for the carton type now that the final list of tags is known. Most of the
+        # tags have already been decoded in the background while the scan was running
+        if carton_job.is_carton_type_requested is True:
+            carton_job.is_carton_type_requested = False
+            carton_type_speculator.request_carton_type()
+
+    @main_dispatcher.handles(CartonTypeDecidedMessage)
+    def handle_carton_type_decided(message):
+        # A result of a scan that has since been reset is ignored
+        if message.scan_id != carton_type_speculator.scan_id:
+            return
+        carton_job = carton_pipeline.current_job
+        carton_job.set_carton_type(message.carton_type)
+        display_tag_id_gui_queue.put({
+            'type': DisplayEnums.SHOW_CARTON_TYPE.value,
+            'data': {
+                'carton_type': carton_job.carton_pack_type
+            }
+        })
+        display_tag_id_gui_queue.put(CommonEnums.API_COMPLETED.value)
+        show_pipeline_status(display_tag_id_gui_queue, carton_pipeline)
+
+    @main_dispatcher.handles(CartonTypeFailedMessage)
+    def handle_carton_type_failed(message):
+        if message.scan_id != carton_type_speculator.scan_id:
+            return
+        carton_pipeline.current_job.set_carton_type_failed()
+        show_pipeline_status(display_tag_id_gui_queue, carton_pipeline)
+        read_tags_queue.put(TagReaderEnums.CLEAR_TAG_DATA.value)
+        display_tag_id_gui_queue.put(CommonEnums.API_COMPLETED.value)
+        if message.is_api_error is True:
+            display_tag_id_gui_queue.put({
+                'type': CommonEnums.API_ERROR.value,
+                'message': message.message
+            })
+        else:
+            display_tag_id_gui_queue.put({
+                'type': DisplayEnums.CUSTOM_ERROR.value,
+                'message': 'There was an error while getting the carton type'
+            })
+
+    @main_dispatcher.handles(ScanCompleteMessage)
+    def handle_scan_complete(message):
+        display_tag_id_gui_queue.put({
+            'type': DisplayEnums.SHOW_SCAN_COMPLETE.value,
+            'data': {
+                'reason': message.reason,
+                'tags': message.tags,
+                'duration': message.duration
+            }
+        })
+
+    @main_dispatcher.handles(WeightValueReadMessage)
+    def handle_weight_value_read(message):
+        carton_job = carton_pipeline.current_job
+        carton_job.carton_weight = message.weight
+        display_tag_id_gui_queue.put({
+            'type': DisplayEnums.SHOW_WEIGHT.value,
+            'data': {
+                'weight': carton_job.carton_weight
+            }
+        })
+
+    @main_dispatcher.handles(CartonBarcodeScanValueMessage)
+    def handle_carton_barcode_scan_value(message):
+        carton_job = carton_pipeline.current_job
+        carton_job.set_barcode(message.carton_barcode, message.carton_code)
+        carton_type_speculator.set_carton_code(carton_job.carton_code)
+        display_tag_id_gui_queue.put({
+            'type': DisplayEnums.SHOW_SCANNED_BARCODE.value,
+            'data': {
+                'barcode': carton_job.carton_code
+            }
+        })
+        show_pipeline_status(display_tag_id_gui_queue, carton_pipeline)
+        read_tags_queue.put({
+            'type': TagReaderEnums.RECEIVED_CARTON_BARCODE_VALUE.value,
+            'data': {
+                'carton_code': carton_job.carton_code,
+                'expected_tag_count': message.expected_tag_count
+            }
+        })
+
+    @main_dispatcher.handles(ApiErrorMessage)
+    def handle_api_error(message):
+        display_tag_id_gui_queue.put({
+            'type': CommonEnums.API_ERROR.value,
+            'message': message.message
+        })
+
+    @main_dispatcher.handles(BarcodeScannerPermissionErrorMessage)
+    def handle_barcode_scanner_permission_error(message):
+        display_tag_id_gui_queue.put({
+            'type': DisplayEnums.CUSTOM_ERROR.value,
+            'message': message.message
+        })
+
+    @main_dispatcher.handles(GetCartonTypeMessage)
+    def handle_get_carton_type(message):
+        # End the scan first, the carton type is worked out once the summary of the
+        # scan comes back so that it is based on every tag that was read
+        display_tag_id_gui_queue.put(CommonEnums.API_PROCESSING.value)
+        carton_pipeline.current_job.request_carton_type()
+        show_pipeline_status(display_tag_id_gui_queue, carton_pipeline)
+        read_tags_queue.put(TagReaderEnums.STOP_READING_TAGS.value)
+
+    @main_dispatcher.handles(UploadMessage)
+    def handle_upload(message):
+        read_tags_queue.put(TagReaderEnums.CLEAR_TAG_DATA.value)
+        display_tag_id_gui_queue.put(CommonEnums.API_PROCESSING.value)
+        try:
+            # The carton is written to the journal and the upload sender takes it from
+            # there, so the operator can move on to the next carton straight away
+            carton_pipeline.hand_off_current_job(message.shipment_id)
+            upload_sender_queue.put(UploadSenderEnums.NEW_UPLOAD_JOURNALED.value)
+            display_tag_id_gui_queue.put(CommonEnums.API_COMPLETED.value)
+            display_tag_id_gui_queue.put(DisplayEnums.UPLOAD_SUCCESS.value)
+            show_pipeline_status(display_tag_id_gui_queue, carton_pipeline)
+            carton_type_speculator.reset()
+            carton_type_speculator.set_carton_code(None)
+        except FileNotFoundError as err:
+            display_tag_id_gui_queue.put(CommonEnums.API_COMPLETED.value)
+            error_message = 'There was a problem while reading the location'
+            display_tag_id_gui_queue.put({
+                'type': DisplayEnums.CUSTOM_ERROR.value,
+                'message': error_message
+            })
+        except sqlite3.Error as err:
+            display_tag_id_gui_queue.put(CommonEnums.API_COMPLETED.value)
+            error_message = f"There was a problem while saving the carton details: {err}"
+            display_tag_id_gui_queue.put({
+                'type': DisplayEnums.CUSTOM_ERROR.value,
+                'message': error_message
+            })
+            display_tag_id_gui_queue.put(DisplayEnums.UPLOAD_FAIL.value)
+
+    @main_dispatcher.handles(CloseShipmentMessage)
+    def handle_close_shipment(message):
+        global current_shipment_id
+        current_shipment_id = message.next_shipment_id
+        upload_sender_queue.put({
+            'type': UploadSenderEnums.CLOSE_SHIPMENT.value,
+            'data': {
+                'shipment_id': message.shipment_id
+            }
+        })
+
+    @main_dispatcher.handles(UploadSentMessage)
+    def handle_upload_sent(message):
+        carton_pipeline.finish_upload(message.upload_id)
+        show_pipeline_status(display_tag_id_gui_queue, carton_pipeline)
+
+    @main_dispatcher.handles(UploadRetryingMessage)
+    def handle_upload_retrying(message):
+        carton_pipeline.set_upload_retrying(message.upload_id)
+        show_pipeline_status(display_tag_id_gui_queue, carton_pipeline)
+
+    @main_dispatcher.handles(UploadRejectedMessage)
+    def handle_upload_rejected(message):
+        carton_pipeline.finish_upload(message.upload_id)
+        show_pipeline_status(display_tag_id_gui_queue, carton_pipeline)
+        display_tag_id_gui_queue.put({
+            'type': DisplayEnums.CUSTOM_ERROR.value,
+            'message': f"The server refused the upload of carton {message.carton_barcode}: {message.message}"
+        })
+
+    @main_dispatcher.handles(HeartbeatMessage)
+    def handle_heartbeat(message):
+        process_supervisor.record_heartbeat(message)
+        # The station is ready once every child process has opened its devices and is running its loop
+        if startup_timer.is_finished is False and process_supervisor.has_every_process_sent_heartbeat() is True:
+            startup_timer.finish('first heartbeats')
+
+    @process_supervisor.restarted('display')
+    def restore_display():
+        show_current_job(display_tag_id_gui_queue, carton_pipeline.current_job)
+        show_pipeline_status(display_tag_id_gui_queue, carton_pipeline)
+
+    @process_supervisor.restarted('tag_reader')
+    def restore_tag_reader():
+        carton_job = carton_pipeline.current_job
+        if carton_job.carton_code != '':
+            read_tags_queue.put({
+                'type': TagReaderEnums.RECEIVED_CARTON_BARCODE_VALUE.value,
+                'data': {
+                    'carton_code': carton_job.carton_code,
+                    'expected_tag_count': None
+                }
+            })
+        # The tags of a scan that was running are lost with the process, so it has to be scanned again
+        if carton_job.state in (CartonJobState.SCANNING, CartonJobState.GETTING_CARTON_TYPE):
+            carton_job.set_carton_type_failed()
+            show_pipeline_status(display_tag_id_gui_queue, carton_pipeline)
+            display_tag_id_gui_queue.put(CommonEnums.API_COMPLETED.value)
+            display_tag_id_gui_queue.put({
+                'type': DisplayEnums.CUSTOM_ERROR.value,
+                'message': 'The RFID reader stopped responding and was restarted, please scan the carton again'
+            })
+
+    @process_supervisor.restarted('weighing_scale')
+    def restore_weighing_scale():
+        # The weight the process was waiting for when it was restarted is asked for again
+        carton_job = carton_pipeline.current_job
+        if carton_job.is_weight_requested is True and carton_job.carton_weight == 0:
+            weighing_queue.put(WeighingScaleEnums.START_WEIGHING.value)
+            display_tag_id_gui_queue.put({
+                'type': DisplayEnums.CUSTOM_ERROR.value,
+                'message': 'The weighing scale stopped responding and was restarted, please check the carton is on the scale'
+            })
 
-    list_of_tags_to_upload = []
-    carton_weight = 0
-    carton_code = ''
-    carton_barcode = ''
-    carton_pack_type = None
-    shipment_id = ''
+    @process_supervisor.restarted('barcode_scanner')
+    def restore_barcode_scanner():
+        prewarm_barcode_scanner(barcode_scanner_queue, upload_journal)
 
     while True:
-        main_queue_value = main_queue.get(block=True)
-        if main_queue_value == DisplayEnums.SCAN.value:
-            # Everytime the user hits scan, start a fresh read
-            list_of_tags_to_upload.clear()
-            read_tags_queue.put(TagReaderEnums.START_READING_TAGS.value)
-            weighing_queue.put(WeighingScaleEnums.START_WEIGHING.value)
-        
-        elif main_queue_value == DisplayEnums.RESET.value:
-            list_of_tags_to_upload.clear()
-            read_tags_queue.put(TagReaderEnums.CLEAR_TAG_DATA.value)
-        
-        elif main_queue_value == CommonEnums.API_PROCESSING.value:
-            display_tag_id_gui_queue.put(CommonEnums.API_PROCESSING.value)
-        
-        elif main_queue_value == CommonEnums.API_COMPLETED.value:
-            display_tag_id_gui_queue.put(CommonEnums.API_COMPLETED.value)
-
-        elif main_queue_value == DisplayEnums.QUIT.value:
+        # The loop wakes up at least every check interval so that a child that died or got
+        # stuck is noticed even when no messages arrive
+        try:
+            message = decode_message(main_queue.get(timeout=process_supervisor.check_interval))
+        except Empty:
+            process_supervisor.check()
+            continue
+        if isinstance(message, QuitMessage):
+            process_supervisor.stop()
             for queue in queues:
                 queue.put_nowait(None)
             break
-
-        elif isinstance(main_queue_value, dict):        
-            if main_queue_value['type'] == TagReaderEnums.DONE_READING_TAGS.value:
-                data = main_queue_value['data']
-                tags_list = data['tags']
-                split_string = tags_list.split()
-                number_of_tags = split_string[0]
-                display_tag_id_gui_queue.put({
-                    'type': DisplayEnums.SHOW_NUMBER_OF_TAGS.value,
-                    'data': {
-                        'tags': number_of_tags
-                    }
-                })
-
-                # Save list of tags to the appropriate variable and make it unique
-                list_of_tags = split_string[1:]
-                list_of_tags_to_upload.extend(list_of_tags)
-                list_of_tags_to_upload = list(set(list_of_tags_to_upload))
-                
-            if main_queue_value['type'] == WeighingScaleEnums.WEIGHT_VALUE_READ.value:
-                carton_weight = main_queue_value['data']['weight']
-                display_tag_id_gui_queue.put({
-                    'type': DisplayEnums.SHOW_WEIGHT.value,
-                    'data': {
-                        'weight': carton_weight
-                    }
-                })
-
-            if main_queue_value['type'] == BarcodeScannerEnums.CARTON_BARCODE_SCAN_VALUE.value:
-                carton_barcode = main_queue_value['data']['carton_barcode']
-                carton_code = main_queue_value['data']['carton_code']
-                display_tag_id_gui_queue.put({
-                    'type': DisplayEnums.SHOW_SCANNED_BARCODE.value,
-                    'data': {
-                        'barcode': carton_code
-                    }
-                })
-                read_tags_queue.put({
-                    'type': TagReaderEnums.RECEIVED_CARTON_BARCODE_VALUE.value,
-                    'data': {
-                        'carton_code': carton_code
-                    }
-                })
-            
-            if main_queue_value['type'] == CommonEnums.API_ERROR.value:
-                error_message = main_queue_value['message']
-                display_tag_id_gui_queue.put({
-                    'type': CommonEnums.API_ERROR.value,
-                    'message': error_message
-                })
-            
-            if main_queue_value['type'] == BarcodeScannerEnums.BARCODE_SCANNER_PERMISSION_ERROR.value:
-                error_message = main_queue_value['message']
-                display_tag_id_gui_queue.put({
-                    'type': DisplayEnums.CUSTOM_ERROR.value,
-                    'message': error_message
-                })
-            
-            if main_queue_value['type'] == DisplayEnums.GET_CARTON_TYPE.value:
-                try:
-                    display_tag_id_gui_queue.put(CommonEnums.API_PROCESSING.value)
-                    product_details = decode_epc_tags_into_product_details(list_of_tags_to_upload)
-                    carton_pack_type = get_carton_pack_type(product_details, carton_code)
-                    display_tag_id_gui_queue.put({
-                        'type': DisplayEnums.SHOW_CARTON_TYPE.value,
-                        'data': {
-                            'carton_type': carton_pack_type
-                        }
-                    })
-                    display_tag_id_gui_queue.put(CommonEnums.API_COMPLETED.value)
-                except ApiError as err:
-                    read_tags_queue.put(TagReaderEnums.CLEAR_TAG_DATA.value)
-                    display_tag_id_gui_queue.put(CommonEnums.API_COMPLETED.value)
-                    display_tag_id_gui_queue.put({
-                        'type': CommonEnums.API_ERROR.value,
-                        'message': err.message
-                    })
-                except UnknownCartonTypeError as err:
-                    read_tags_queue.put(TagReaderEnums.CLEAR_TAG_DATA.value)
-                    display_tag_id_gui_queue.put(CommonEnums.API_COMPLETED.value)
-                    display_tag_id_gui_queue.put({
-                        'type': DisplayEnums.CUSTOM_ERROR.value,
-                        'message': 'There was an error while getting the carton type'
-                    })
-
-            if main_queue_value['type'] == DisplayEnums.UPLOAD.value:
-                shipment_id = main_queue_value['data']['shipment_id']
-                read_tags_queue.put(TagReaderEnums.CLEAR_TAG_DATA.value)
-                display_tag_id_gui_queue.put(CommonEnums.API_PROCESSING.value)
-                try:
-                    carton_details_api_upload_call_result = upload_carton_details(
-                        list_of_tags_to_upload, 
-                        carton_weight,
-                        carton_code,
-                        carton_barcode, 
-                        carton_pack_type,
-                        shipment_id
-                    )
-                    display_tag_id_gui_queue.put(CommonEnums.API_COMPLETED.value)
-                    display_tag_id_gui_queue.put(DisplayEnums.UPLOAD_SUCCESS.value)
-                    list_of_tags_to_upload = []
-                    carton_weight = 0
-                    carton_code = ''
-                    carton_barcode = ''
-                    carton_pack_type = None
-                    shipment_id = ''
-                except FileNotFoundError as err:
-                    display_tag_id_gui_queue.put(CommonEnums.API_COMPLETED.value)
-                    error_message = 'There was a problem while reading the location'
-                    display_tag_id_gui_queue.put({
-                        'type': DisplayEnums.CUSTOM_ERROR.value,
-                        'message': error_message
-                    })
-                except ApiError as err:
-                    display_tag_id_gui_queue.put(CommonEnums.API_COMPLETED.value)
-                    error_message = err.message
-                    display_tag_id_gui_queue.put({
-                        'type': DisplayEnums.CUSTOM_ERROR.value,
-                        'message': error_message
-                    })
-                    display_tag_id_gui_queue.put(DisplayEnums.UPLOAD_FAIL.value)
+        main_dispatcher.dispatch(message)
+        process_supervisor.check()
 
     logging_listener_process.join()
 
+    upload_journal.close()
+    carton_type_speculator.close()
+
     # Close the queues
     close_queues(queues)
 
     # Close the processes
-    close_processes(processes)
\ No newline at end of file
+    close_processes(process_supervisor.get_processes())
+
+    # The shared memory is freed once no child process is using it
+    tag_ring_buffer.close()
\ No newline at end of file
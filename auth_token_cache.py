@@ -0,0 +1,204 @@
+"""
+This file contains the authentication token cache that is shared by every process.
+
+The token is kept in a file that only the owner can read, so a process that starts (or a
+process whose token is about to expire) picks up the token another process already fetched
+instead of going to Auth0 itself. Fetches are single-flighted with a lock file: the process
+that gets the lock fetches the token and every other process waits and then reads the file.
+
+Each process also runs a background thread that refreshes the token refresh_margin_seconds
+before it expires, so a request never has to wait for Auth0 or be rejected with a 401.
+"""
+import base64
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from os import path
+
+from station_config import load_station_config
+
+logger = logging.getLogger('auth_token_cache')
+
+
+def decode_token_expiry(token: str):
+    """
+    This method reads the exp claim of a JWT without verifying it, since it is only used to
+    decide when to refresh
+
+    Returns
+    -------
+    float
+      The time the token expires at as a UNIX timestamp, or None if it cannot be read
+    """
+    try:
+        payload = token.split('.')[1]
+        # JWTs drop the base64 padding
+        payload += '=' * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class AuthTokenCache():
+    """
+    This class is used to hand out a valid authentication token to every request
+
+    Attributes
+    ----------
+    path: str
+      The file the token is shared through
+    fetch_token: Callable
+      Fetches a new token from Auth0 and returns the parsed response
+    refresh_margin_seconds: float
+      How long before it expires a token is refreshed in the background
+    token: str
+      The token this process is using, None until one has been loaded
+    expires_at: float
+      The time the token expires at, None if the token does not say
+    """
+
+    # A token this close to expiring is not handed out at all
+    EXPIRY_SKEW_SECONDS = 30
+
+    # How long to wait before trying again when a background refresh fails
+    RETRY_INTERVAL_SECONDS = 30
+
+    def __init__(self, path: str, fetch_token, refresh_margin_seconds: float):
+        self.path = path
+        self.fetch_token = fetch_token
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.token = None
+        self.expires_at = None
+        # Serialises fetches between the threads of this process, the lock file does the
+        # same between processes
+        self.lock = threading.Lock()
+        self.refresh_thread = None
+
+    def is_valid(self, expires_at, margin: float) -> bool:
+        # A token without an expiry is used until the server rejects it
+        return expires_at is None or expires_at - time.time() > margin
+
+    def read_cache_file(self):
+        """This method returns the (token, expires_at) saved by any process, or None"""
+        try:
+            with open(self.path, 'r') as f:
+                cached_token = json.load(f)
+            return cached_token['token'], cached_token['expires_at']
+        except (FileNotFoundError, KeyError, ValueError):
+            return None
+
+    def write_cache_file(self, token: str, expires_at) -> None:
+        """
+        This method saves the token so that the other processes can use it. The file is
+        written in full and then moved into place, so a reader never sees half a token
+        """
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=path.dirname(self.path), prefix='.auth_token')
+        try:
+            # mkstemp creates the file readable by the owner only
+            with os.fdopen(file_descriptor, 'w') as f:
+                json.dump({'token': token, 'expires_at': expires_at}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary_path, self.path)
+        except Exception:
+            os.unlink(temporary_path)
+            raise
+
+    def use_token(self, token: str, expires_at) -> str:
+        self.token = token
+        self.expires_at = expires_at
+        return token
+
+    def refresh(self, margin: float, rejected_token: str = None) -> str:
+        """
+        This method makes sure this process holds a token that is valid for at least margin
+        seconds, fetching one from Auth0 only if no other process has already done so
+
+        Parameters
+        ----------
+        margin: float
+          How many seconds the token must still be valid for
+        rejected_token: str, optional
+          A token the server has rejected, which is not used again even if it has not expired
+        """
+        with self.lock:
+            lock_file_descriptor = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(lock_file_descriptor, fcntl.LOCK_EX)
+                # Another process may have fetched a token while this one waited for the lock
+                cached_token = self.read_cache_file()
+                if cached_token is not None:
+                    token, expires_at = cached_token
+                    if token != rejected_token and self.is_valid(expires_at, margin):
+                        return self.use_token(token, expires_at)
+
+                logger.log(logging.DEBUG, "Fetching a new authentication token")
+                parsed_response = self.fetch_token()
+                token = parsed_response['access_token']
+                expires_at = decode_token_expiry(token)
+                if expires_at is None and 'expires_in' in parsed_response:
+                    expires_at = time.time() + float(parsed_response['expires_in'])
+                self.write_cache_file(token, expires_at)
+                logger.log(logging.DEBUG, "Got the authentication token")
+                return self.use_token(token, expires_at)
+            finally:
+                fcntl.flock(lock_file_descriptor, fcntl.LOCK_UN)
+                os.close(lock_file_descriptor)
+
+    def get_token(self) -> str:
+        """This method returns a valid token, fetching one only if no process holds one"""
+        self.start_background_refresh()
+        if self.token is not None and self.is_valid(self.expires_at, AuthTokenCache.EXPIRY_SKEW_SECONDS):
+            return self.token
+        cached_token = self.read_cache_file()
+        if cached_token is not None and self.is_valid(cached_token[1], AuthTokenCache.EXPIRY_SKEW_SECONDS):
+            return self.use_token(*cached_token)
+        return self.refresh(AuthTokenCache.EXPIRY_SKEW_SECONDS)
+
+    def invalidate(self, rejected_token: str) -> str:
+        """This method is called when the server rejects a token with a 401 and returns a new one"""
+        return self.refresh(AuthTokenCache.EXPIRY_SKEW_SECONDS, rejected_token)
+
+    def start_background_refresh(self) -> None:
+        if self.refresh_thread is None:
+            self.refresh_thread = threading.Thread(target=self.run_background_refresh, daemon=True)
+            self.refresh_thread.start()
+
+    def run_background_refresh(self) -> None:
+        while True:
+            try:
+                self.refresh(self.refresh_margin_seconds)
+                if self.expires_at is None:
+                    # There is no way to know when to refresh, leave it to the 401 handling
+                    return
+                time.sleep(max(self.expires_at - self.refresh_margin_seconds - time.time(),
+                               AuthTokenCache.RETRY_INTERVAL_SECONDS))
+            except Exception as err:
+                logger.log(logging.ERROR, f"There was an error while refreshing the authentication token: {err}")
+                time.sleep(AuthTokenCache.RETRY_INTERVAL_SECONDS)
+
+
+auth_token_cache = None
+auth_token_cache_pid = None
+
+
+def get_auth_token_cache(fetch_token) -> AuthTokenCache:
+    """
+    This method returns the token cache of this process. A forked child process gets its
+    own, since the refresh thread and the locks of its parent are not carried over
+    """
+    global auth_token_cache, auth_token_cache_pid
+    if auth_token_cache is None or auth_token_cache_pid != os.getpid():
+        auth_token_cache_config = load_station_config()['auth_token_cache']
+        dirname = path.dirname(__file__)
+        auth_token_cache = AuthTokenCache(
+            path.join(dirname, auth_token_cache_config['path']),
+            fetch_token,
+            auth_token_cache_config['refresh_margin_seconds']
+        )
+        auth_token_cache_pid = os.getpid()
+    return auth_token_cache
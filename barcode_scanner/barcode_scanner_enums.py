@@ -2,5 +2,4 @@ from enum import Enum, unique
 
 @unique
 class BarcodeScannerEnums(Enum):
-  CARTON_BARCODE_SCAN_VALUE = 'carton barcode scan value'
-  BARCODE_SCANNER_PERMISSION_ERROR = 'barcode scanner permission error'
+  PREWARM_CARTON_CODES = 'prewarm carton codes'
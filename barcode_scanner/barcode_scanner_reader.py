@@ -1,12 +1,19 @@
 import sys
 import logging
+import threading
+import time
 from multiprocessing import Process, Queue
 
 from barcode_scanner.barcode_scanner_enums import BarcodeScannerEnums
 from barcode_scanner.scanner import Scanner
 from make_api_request import MakeApiRequest
 from exceptions import ApiError
-from common_enums import CommonEnums
+from lru_ttl_cache import LRUTTLCache
+from station_config import load_station_config
+from queue_events import wait_for_events, get_queued_values
+from message_bus.messages import send_message, ApiProcessingMessage, ApiCompletedMessage, ApiErrorMessage, \
+    CartonBarcodeScanValueMessage, BarcodeScannerPermissionErrorMessage
+from process_supervisor import Heartbeat
 
 class BarcodeScannerReader(Process):
     """
@@ -19,61 +26,101 @@ class BarcodeScannerReader(Process):
         self.queue = queue
         self.main_queue = main_queue
         self.logger = logging.getLogger('barcode_scanner_reader')
+        barcode_cache_config = load_station_config()['barcode_cache']
+        self.carton_code_cache = LRUTTLCache(barcode_cache_config['max_entries'], barcode_cache_config['ttl_seconds'])
+        self.scanner = Scanner('/dev/usb-barcode-scanner')
+        self.heartbeat = Heartbeat(main_queue)
+
+    def open_scanner(self) -> bool:
+        """This method opens the barcode scanner, the main process is told if it cannot be opened"""
         try:
-            self.scanner = Scanner('/dev/usb-barcode-scanner')
+            self.scanner.open()
+            return True
         except PermissionError as err:
             self.logger.log(logging.ERROR, f"There was an error while opening the barcode scanner reader: {err}")
             message = 'Unable to open barcode scanner reader'
-            self.main_queue.put({
-                'type': BarcodeScannerEnums.BARCODE_SCANNER_PERMISSION_ERROR.value,
-                'message': message
-                })
+            send_message(self.main_queue, BarcodeScannerPermissionErrorMessage(message))
+            return False
 
     def run(self):
+        devices = [self.scanner] if self.open_scanner() is True else []
         should_exit_loop = False
+        loop_started_at = None
         while should_exit_loop is False:
-            if self.queue.qsize() > 0:
-                input_queue_value = self.queue.get()
+            # Sleep until the main process sends a command, a barcode is scanned or the next heartbeat is due
+            self.heartbeat.beat(loop_started_at)
+            ready = wait_for_events(self.queue, devices, self.heartbeat.get_timeout())
+            loop_started_at = time.monotonic()
+            for input_queue_value in get_queued_values(self.queue):
                 if input_queue_value is None:
                     self.logger.log(logging.DEBUG, "Exiting the barcode scanning process")
                     should_exit_loop = True
+                    break
+                elif isinstance(input_queue_value, dict) and input_queue_value['type'] == BarcodeScannerEnums.PREWARM_CARTON_CODES.value:
+                    self.prewarm_carton_codes(input_queue_value['data'])
+
+            if should_exit_loop is False and self.scanner in ready:
+                for barcode in self.scanner.read():
+                    self.handle_barcode(barcode)
+        self.scanner.close()
 
-            # self.scanner.read() is a non-blocking call
-            barcode = self.scanner.read()
-            if barcode:
-                try:
-                    self.main_queue.put(CommonEnums.API_PROCESSING.value)
-                    carton_code = self.decode_barcode_into_carton_code(barcode)
-                    self.main_queue.put(CommonEnums.API_COMPLETED.value)
-                    self.send_value_to_main_process(carton_code, barcode)
-                except ApiError as err:
-                    self.main_queue.put(CommonEnums.API_COMPLETED.value)
-                    self.send_api_error_to_main_process(err.message)
+    def handle_barcode(self, barcode):
+        carton_code = self.carton_code_cache.get(barcode)
+        if carton_code is not None:
+            # A carton scanned again is answered straight from the cache
+            self.send_value_to_main_process(carton_code, barcode)
+            return
+        try:
+            send_message(self.main_queue, ApiProcessingMessage())
+            carton_code = self.decode_barcode_into_carton_code(barcode)
+            send_message(self.main_queue, ApiCompletedMessage())
+            self.send_value_to_main_process(carton_code, barcode)
+        except ApiError as err:
+            send_message(self.main_queue, ApiCompletedMessage())
+            self.send_api_error_to_main_process(err.message)
 
     def send_value_to_main_process(self, carton_code, barcode):
-        self.main_queue.put({
-            'type': BarcodeScannerEnums.CARTON_BARCODE_SCAN_VALUE.value,
-            'data': {
-                'carton_code': carton_code,
-                'carton_barcode': barcode
-            }
-        })
+        send_message(self.main_queue, CartonBarcodeScanValueMessage(carton_code, barcode))
 
-    def decode_barcode_into_carton_code(self, barcode):
+    def request_carton_code(self, barcode):
         api_request = MakeApiRequest(f"/fabship/product/rfid/carton/barcode/{barcode}")
-        self.main_queue.put(CommonEnums.API_PROCESSING.value)
         try:
             carton_code = api_request.get()
             return carton_code
         except ApiError as err:
             raise err
 
+    def decode_barcode_into_carton_code(self, barcode):
+        carton_code = self.request_carton_code(barcode)
+        self.carton_code_cache.put(barcode, carton_code)
+        return carton_code
+
+    def prewarm_carton_codes(self, data: dict):
+        """
+        This method fills the carton code cache ahead of the barcodes being scanned
+
+        Parameters
+        ----------
+        data: dict
+          carton_codes holds carton codes that are already known, keyed by barcode, and
+          barcodes holds barcodes whose carton code is looked up in the background
+        """
+        for barcode, carton_code in data.get('carton_codes', {}).items():
+            self.carton_code_cache.put(barcode, carton_code)
+        barcodes = [barcode for barcode in data.get('barcodes', []) if barcode not in self.carton_code_cache]
+        if len(barcodes) > 0:
+            threading.Thread(target=self.look_up_carton_codes, args=(barcodes,), daemon=True).start()
+
+    def look_up_carton_codes(self, barcodes: list):
+        for barcode in barcodes:
+            try:
+                self.carton_code_cache.put(barcode, self.request_carton_code(barcode))
+            except ApiError as err:
+                self.logger.log(logging.ERROR, f"Could not look up the carton code of {barcode} ahead of time: {err.message}")
+
     def send_api_error_to_main_process(self, message):
         """
         This method is called to return the API error message to the main process
         """
-        self.main_queue.put({
-            'type': CommonEnums.API_ERROR.value,
-            'message': message 
-            })
+        send_message(self.main_queue, ApiErrorMessage(message))
 
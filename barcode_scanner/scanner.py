@@ -24,7 +24,27 @@ class Scanner:
         self.SHIFT_CODE = 2
         self.SHIFT_CODE_LIST = [2, 2]
         self.ERROR_CHARACTER = '?'
+        # A barcode that is not ended with a carriage return within this many seconds is thrown away
+        self.TIMEOUT = 3
         self.codes = []
+        self.last_read_at = 0
+        self.fp = None
+
+    def open(self) -> None:
+        """
+        This method opens the device without blocking, so it can be waited on together with
+        the queue of the process and read only when it has data
+        """
+        self.fp = open(self.file, 'rb', buffering=0)
+        os.set_blocking(self.fp.fileno(), False)
+
+    def fileno(self) -> int:
+        return self.fp.fileno()
+
+    def close(self) -> None:
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
 
     def is_shift_valid(self, index) -> bool:
         if index < 2:
@@ -36,21 +56,24 @@ class Scanner:
     def reset(self) -> None:
         self.codes = []
 
-    def read_char_codes(self) -> None:
-        with open(self.file, 'rb') as fp:
-            os.set_blocking(fp.fileno(), False)
-            timeout = 3  # 3 seconds time out
-            start_time = time.time()
-            while True:
-                # 50ms sleep to schedule out the process and reduce CPU usage
-                time.sleep(0.05)
-                if time.time() > start_time + timeout:
-                    return
-                content = fp.read(8) or ''
-                for char_code in [element for element in content if element > 0]:
-                    if char_code == self.CR_CHAR:
-                        return
-                    self.codes.append(char_code)
+    def read_char_codes(self) -> list:
+        """
+        This method reads everything that is waiting on the device and returns the barcodes
+        completed by it. The codes of a barcode that is not complete yet are kept for the next read
+        """
+        content = self.fp.read(4096) or b''
+        read_at = time.time()
+        if len(self.codes) > 0 and read_at > self.last_read_at + self.TIMEOUT:
+            self.reset()
+        self.last_read_at = read_at
+        barcodes = []
+        for char_code in [element for element in content if element > 0]:
+            if char_code == self.CR_CHAR:
+                barcodes.append(self.parse_char_codes())
+                self.reset()
+            else:
+                self.codes.append(char_code)
+        return barcodes
 
     def parse_char_codes(self) -> str:
         string_to_return = ""
@@ -63,8 +86,6 @@ class Scanner:
                 string_to_return += self.CHARMAP_LOWERCASE.get(code, self.ERROR_CHARACTER)
         return string_to_return
 
-    def read(self):
-        self.read_char_codes()
-        parsed_string:str = self.parse_char_codes()
-        self.reset()
-        return parsed_string
\ No newline at end of file
+    def read(self) -> list:
+        """This method never blocks, it returns the barcodes scanned since the last call"""
+        return [barcode for barcode in self.read_char_codes() if barcode]
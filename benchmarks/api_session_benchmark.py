@@ -0,0 +1,113 @@
+"""
+This script compares the latency of API requests made with a new connection every time
+against requests made over the pooled keep-alive session of MakeApiRequest.
+
+A stub server is started on localhost, so no credentials are needed. Use --delay to add
+the round trip time of the warehouse network to every connection made to the stub.
+
+Run it from the root of the repository:
+    python3 -m benchmarks.api_session_benchmark --requests 200 --delay 0.02
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import auth_token_cache
+from auth_token_cache import AuthTokenCache
+from make_api_request import MakeApiRequest, REQUEST_TIMEOUT
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so that the stub keeps connections open like the real server
+    protocol_version = 'HTTP/1.1'
+    connection_delay = 0.0
+
+    def setup(self):
+        # Stands in for the TCP and TLS handshake of a new connection over a slow link
+        time.sleep(self.connection_delay)
+        super().setup()
+
+    def do_GET(self):
+        body = json.dumps({'carton_code': 'CARTON-1'}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        # The stub also stands in for Auth0
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.dumps({'access_token': 'stub-token', 'expires_in': 86400}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def measure(make_request, number_of_requests: int) -> list:
+    latencies = []
+    for _ in range(number_of_requests):
+        started_at = time.perf_counter()
+        make_request()
+        latencies.append(time.perf_counter() - started_at)
+    return latencies
+
+
+def print_latencies(name: str, latencies: list) -> None:
+    latencies = sorted(latencies)
+    print(f"{name}: mean {statistics.mean(latencies) * 1000:.2f} ms, "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.2f} ms")
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description='Benchmark pooled API sessions against new connections')
+    parser.add_argument('--requests', action='store', type=int, dest='requests', default=200)
+    parser.add_argument('--delay', action='store', type=float, dest='delay', default=0.02,
+                        help='Seconds added to every new connection to the stub server')
+    arguments = parser.parse_args()
+
+    StubRequestHandler.connection_delay = arguments.delay
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['SERVER_BASE_URL'] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ['AUTH0_DOMAIN'] = f"http://127.0.0.1:{server.server_address[1]}/oauth/token"
+    token_directory = tempfile.TemporaryDirectory()
+
+    try:
+        api_request = MakeApiRequest('/carton-barcode')
+        # Keep the token of the stub out of the token file of the station
+        auth_token_cache.auth_token_cache = AuthTokenCache(
+            os.path.join(token_directory.name, 'auth_token_cache.json'), api_request.request_authentication_token, 300)
+        auth_token_cache.auth_token_cache_pid = os.getpid()
+        api_request.get_authentication_token()
+        new_connection_latencies = measure(
+            lambda: requests.get(api_request.url, params={'barcode': '1'}, timeout=REQUEST_TIMEOUT).json(),
+            arguments.requests
+        )
+        pooled_latencies = measure(lambda: api_request.get({'barcode': '1'}), arguments.requests)
+    finally:
+        server.shutdown()
+        server.server_close()
+        token_directory.cleanup()
+
+    print(f"{arguments.requests} requests, {arguments.delay * 1000:.0f} ms added per new connection")
+    print_latencies('New connection per request', new_connection_latencies)
+    print_latencies('Pooled keep-alive session', pooled_latencies)
+    print(f"Speed up: {statistics.mean(new_connection_latencies) / statistics.mean(pooled_latencies):.1f}x")
+
+
+if __name__ == "__main__":
+    run_benchmark()
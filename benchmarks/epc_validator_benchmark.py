@@ -0,0 +1,68 @@
+"""
+This script compares the old string based SGTIN-96 check with the shift and mask validator.
+
+Run it from the root of the repository:
+    python3 -m benchmarks.epc_validator_benchmark
+"""
+import argparse
+import random
+import timeit
+
+from tag_reader.Entities.rfid_tag import RFIDTagEntity
+
+ALLOWED_COMPANY_PREFIXES = [731422, 731430]
+
+
+def is_tag_valid_with_strings(tag_hex_value) -> bool:
+    """Replicates the old check, which went hex -> int -> binary string -> int"""
+    binary_tag_value: str = bin(int(tag_hex_value, 16))[2:].zfill(96)
+    header: int = int(binary_tag_value[0:8], 2)
+    company_prefix: int = int(binary_tag_value[14:34], 2)
+    if header != 48:
+        return False
+    if company_prefix not in ALLOWED_COMPANY_PREFIXES:
+        return False
+    return True
+
+
+def generate_epcs(number_of_epcs: int) -> list:
+    """Generates SGTIN-96 EPCs, most of them with an allowed company prefix"""
+    epcs = []
+    for _ in range(number_of_epcs):
+        company_prefix = random.choice(ALLOWED_COMPANY_PREFIXES + [123456])
+        value = (48 << 88) | (1 << 85) | (6 << 82) | (company_prefix << 62) | random.getrandbits(62)
+        epcs.append(value.to_bytes(12, 'big'))
+    return epcs
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description='Benchmark the SGTIN-96 validator')
+    parser.add_argument('--epcs', action='store', type=int, dest='epcs', default=10000)
+    parser.add_argument('--repeat', action='store', type=int, dest='repeat', default=5)
+    arguments = parser.parse_args()
+
+    random.seed(0)
+    epcs = generate_epcs(arguments.epcs)
+    hex_epcs = [epc.hex().upper() for epc in epcs]
+    packed_epcs = b''.join(epcs)
+    rfid_tag_entity = RFIDTagEntity(ALLOWED_COMPANY_PREFIXES)
+
+    expected_results = [is_tag_valid_with_strings(hex_epc) for hex_epc in hex_epcs]
+    assert [rfid_tag_entity.is_tag_valid(hex_epc) for hex_epc in hex_epcs] == expected_results
+    assert [rfid_tag_entity.is_epc_valid(epc) for epc in epcs] == expected_results
+    assert rfid_tag_entity.validate_packed_epcs(packed_epcs) == expected_results
+
+    candidates = [
+        ('binary strings (old)', lambda: [is_tag_valid_with_strings(hex_epc) for hex_epc in hex_epcs]),
+        ('shifts on hex int', lambda: [rfid_tag_entity.is_tag_valid(hex_epc) for hex_epc in hex_epcs]),
+        ('shifts on raw bytes', lambda: [rfid_tag_entity.is_epc_valid(epc) for epc in epcs]),
+        ('batch on packed bytes', lambda: rfid_tag_entity.validate_packed_epcs(packed_epcs)),
+    ]
+    print(f"Validating {len(epcs)} EPCs, best of {arguments.repeat}")
+    for name, candidate in candidates:
+        best_time = min(timeit.repeat(candidate, number=1, repeat=arguments.repeat))
+        print(f"{name:>22}: {best_time * 1000:7.2f} ms ({best_time / len(epcs) * 1e9:6.0f} ns per EPC)")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,68 @@
+"""
+This script compares the size of an upload body, the time taken to build it and the time it
+spends on a slow link, with the EPCs sent as a list of hex strings and in the compact, gzip
+compressed wire format.
+
+Run it from the root of the repository:
+    python3 -m benchmarks.epc_wire_format_benchmark --epcs 30000 --gtins 40
+"""
+import argparse
+import gzip
+import json
+import random
+import timeit
+
+from tag_reader.epc_codec import epcs_to_hex
+from tag_reader.epc_wire_format import encode_epcs
+
+GZIP_COMPRESS_LEVEL = 6
+
+
+def generate_epcs(number_of_epcs: int, number_of_gtins: int, run_length: int) -> list:
+    """
+    Generates SGTIN-96 EPCs spread over number_of_gtins products. Tags are encoded in rolls,
+    so the serials of a product come in runs of consecutive numbers
+    """
+    epcs = []
+    while len(epcs) < number_of_epcs:
+        item_reference = random.randrange(number_of_gtins)
+        prefix = (48 << 50) | (1 << 47) | (5 << 44) | (731422 << 20) | item_reference
+        first_serial = random.getrandbits(30)
+        for serial in range(first_serial, first_serial + run_length):
+            epcs.append(((prefix << 38) | serial).to_bytes(12, 'big'))
+    random.shuffle(epcs)
+    return epcs[:number_of_epcs]
+
+
+def build_plain_body(epcs: list) -> bytes:
+    return json.dumps({'epcs': epcs_to_hex(epcs)}).encode('utf-8')
+
+
+def build_compact_body(epcs: list) -> bytes:
+    body = json.dumps({'epcs': encode_epcs(epcs)}, separators=(',', ':')).encode('utf-8')
+    return gzip.compress(body, compresslevel=GZIP_COMPRESS_LEVEL, mtime=0)
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description='Benchmark the compact EPC wire format')
+    parser.add_argument('--epcs', action='store', type=int, dest='epcs', default=30000)
+    parser.add_argument('--gtins', action='store', type=int, dest='gtins', default=40)
+    parser.add_argument('--run-length', action='store', type=int, dest='run_length', default=50,
+                        help='How many consecutive serials every roll of tags holds')
+    parser.add_argument('--repeat', action='store', type=int, dest='repeat', default=10)
+    parser.add_argument('--link-kbps', action='store', type=float, dest='link_kbps', default=256,
+                        help='The speed of the uplink, used to work out the time the body spends on the wire')
+    arguments = parser.parse_args()
+
+    epcs = generate_epcs(arguments.epcs, arguments.gtins, arguments.run_length)
+
+    for name, build_body in (('Plain JSON', build_plain_body), ('Compact + gzip', build_compact_body)):
+        body = build_body(epcs)
+        seconds = min(timeit.repeat(lambda: build_body(epcs), number=1, repeat=arguments.repeat))
+        seconds_on_wire = len(body) * 8 / (arguments.link_kbps * 1000)
+        print(f"{name}: {len(body)} bytes, {seconds * 1000:.2f} ms to build, "
+              f"{seconds_on_wire * 1000:.0f} ms on a {arguments.link_kbps:.0f} kbit/s link")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,107 @@
+"""
+This script compares the ways the child processes wait for commands from the main process:
+checking queue.qsize() in a loop (with no sleep, with a 50 ms sleep, and every 300 ms like the
+old GUI loop) and sleeping on the pipe of the queue until a command arrives.
+
+For every loop it measures the CPU time the child uses while it has nothing to do, and the
+time from a command being put on the queue to the child handling it.
+
+Run it from the root of the repository:
+    python3 -m benchmarks.event_loop_benchmark --idle-seconds 5 --commands 50
+"""
+import argparse
+import resource
+import statistics
+import time
+from multiprocessing import Process, Queue
+
+from queue_events import wait_for_events, get_queued_values
+
+
+def get_cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def poll_queue(queue: Queue, result_queue: Queue, sleep_seconds: float) -> None:
+    """Replicates the old loops, which checked qsize() and then slept for sleep_seconds"""
+    started_at = get_cpu_seconds()
+    while True:
+        if queue.qsize() > 0:
+            value = queue.get()
+            if value is None:
+                break
+            result_queue.put(time.monotonic() - value)
+        if sleep_seconds > 0:
+            time.sleep(sleep_seconds)
+    result_queue.put(('cpu', get_cpu_seconds() - started_at))
+
+
+def wait_on_queue(queue: Queue, result_queue: Queue, sleep_seconds: float) -> None:
+    started_at = get_cpu_seconds()
+    should_exit_loop = False
+    while should_exit_loop is False:
+        wait_for_events(queue)
+        for value in get_queued_values(queue):
+            if value is None:
+                should_exit_loop = True
+                break
+            result_queue.put(time.monotonic() - value)
+    result_queue.put(('cpu', get_cpu_seconds() - started_at))
+
+
+def measure(loop, sleep_seconds: float, idle_seconds: float, number_of_commands: int, command_interval: float) -> tuple:
+    """
+    Returns
+    -------
+    Tuple
+      The CPU seconds used per second of idling and the latencies of the commands in seconds
+    """
+    queue = Queue()
+    result_queue = Queue()
+    process = Process(target=loop, args=(queue, result_queue, sleep_seconds))
+    process.start()
+
+    #   The child only idles while the first part of the run goes by
+    time.sleep(idle_seconds)
+    for _ in range(number_of_commands):
+        queue.put(time.monotonic())
+        time.sleep(command_interval)
+    queue.put(None)
+
+    latencies = []
+    while True:
+        result = result_queue.get()
+        if isinstance(result, tuple):
+            cpu_seconds = result[1]
+            break
+        latencies.append(result)
+    process.join()
+    return cpu_seconds / (idle_seconds + number_of_commands * command_interval), latencies
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description='Benchmark polling the control queue against waiting on it')
+    parser.add_argument('--idle-seconds', action='store', type=float, dest='idle_seconds', default=5)
+    parser.add_argument('--commands', action='store', type=int, dest='commands', default=50)
+    parser.add_argument('--command-interval', action='store', type=float, dest='command_interval', default=0.137,
+                        help='The time between two commands, chosen so it does not line up with the poll interval')
+    arguments = parser.parse_args()
+
+    loops = (
+        ('qsize() without sleeping', poll_queue, 0),
+        ('qsize() + 50 ms sleep', poll_queue, 0.05),
+        ('qsize() every 300 ms (GUI)', poll_queue, 0.3),
+        ('Wait on the queue pipe', wait_on_queue, 0),
+    )
+    for name, loop, sleep_seconds in loops:
+        cpu_per_second, latencies = measure(
+            loop, sleep_seconds, arguments.idle_seconds, arguments.commands, arguments.command_interval)
+        latencies_ms = sorted(latency * 1000 for latency in latencies)
+        print(f"{name}: {cpu_per_second * 100:.2f} % of a core, command latency "
+              f"median {statistics.median(latencies_ms):.2f} ms, "
+              f"p95 {latencies_ms[int(len(latencies_ms) * 0.95) - 1]:.2f} ms, max {latencies_ms[-1]:.2f} ms")
+
+
+if __name__ == "__main__":
+    run_benchmark()
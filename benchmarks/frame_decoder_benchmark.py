@@ -0,0 +1,102 @@
+"""
+This script compares the old byte-at-a-time tag parser with the buffered FrameDecoder.
+
+Run it from the root of the repository:
+    python3 -m benchmarks.frame_decoder_benchmark
+    python3 -m benchmarks.frame_decoder_benchmark --capture recorded_stream.bin
+
+The capture can be a file recorded with the --capture option of RFID_Upload_V0.2.py, in which
+case the bytes of every antenna are run through the decoders one after the other, or a plain
+file of raw bytes. Without a capture file a synthetic stream of reader frames with some line
+noise is generated.
+"""
+import argparse
+import random
+import time
+
+from tag_reader.frame_decoder import FrameDecoder, FRAME_START_BYTE, FRAME_LENGTH
+from tag_reader.serial_capture import CAPTURE_FILE_MAGIC, read_capture
+
+
+def generate_byte_stream(number_of_frames: int, noise_ratio: float) -> bytes:
+    """Generates a stream of 18 byte frames with random bytes of noise in between"""
+    stream = bytearray()
+    for _ in range(number_of_frames):
+        if random.random() < noise_ratio:
+            stream += bytes(random.choice([0x00, 0xFF, 0x42]) for _ in range(random.randint(1, 4)))
+        epc = bytes(random.getrandbits(8) for _ in range(12))
+        stream += bytes([FRAME_START_BYTE, 0x00, 0xEE, 0x00]) + epc + bytes([0x01, 0x02])
+    return bytes(stream)
+
+
+def parse_one_byte_at_a_time(stream: bytes, read_size: int) -> int:
+    """Replicates the old parsing loop, which handled one int per serial read"""
+    number_of_frames = 0
+    should_read_tags = False
+    tag_bytes_list = []
+    for index in range(len(stream)):
+        int_value = int.from_bytes(stream[index:index + 1], "big")
+        if int_value == FRAME_START_BYTE:
+            should_read_tags = True
+        if should_read_tags is True:
+            tag_bytes_list.append(int_value)
+            if len(tag_bytes_list) == FRAME_LENGTH:
+                should_read_tags = False
+                number_of_frames += 1
+                tag_bytes_list.clear()
+    return number_of_frames
+
+
+def parse_with_frame_decoder(stream: bytes, read_size: int) -> int:
+    """Feeds the stream into the decoder in chunks, the way in_waiting hands them over"""
+    number_of_frames = 0
+    frame_decoder = FrameDecoder()
+    for offset in range(0, len(stream), read_size):
+        number_of_frames += len(frame_decoder.feed(stream[offset:offset + read_size]))
+    return number_of_frames
+
+
+def time_parser(parser, stream: bytes, read_size: int, repeat: int):
+    best_time = None
+    number_of_frames = 0
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        number_of_frames = parser(stream, read_size)
+        elapsed_time = time.perf_counter() - start_time
+        if best_time is None or elapsed_time < best_time:
+            best_time = elapsed_time
+    return number_of_frames, best_time
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description='Benchmark the RFID frame decoder')
+    parser.add_argument('--capture', action='store', type=str, dest='capture',
+                        help='Path to a file holding a raw byte stream recorded from a reader')
+    parser.add_argument('--frames', action='store', type=int, dest='frames', default=20000)
+    parser.add_argument('--read-size', action='store', type=int, dest='read_size', default=256)
+    parser.add_argument('--repeat', action='store', type=int, dest='repeat', default=5)
+    arguments = parser.parse_args()
+
+    if arguments.capture is not None:
+        with open(arguments.capture, 'rb') as f:
+            stream = f.read()
+        if stream.startswith(CAPTURE_FILE_MAGIC):
+            stream_by_antenna = {}
+            for _, antenna_id, data in read_capture(arguments.capture):
+                stream_by_antenna.setdefault(antenna_id, bytearray()).extend(data)
+            stream = b''.join(stream_by_antenna.values())
+    else:
+        random.seed(0)
+        stream = generate_byte_stream(arguments.frames, noise_ratio=0.05)
+
+    print(f"Stream size: {len(stream)} bytes, read size: {arguments.read_size} bytes")
+    for name, parser_function in [('one byte at a time', parse_one_byte_at_a_time),
+                                  ('frame decoder', parse_with_frame_decoder)]:
+        number_of_frames, best_time = time_parser(
+            parser_function, stream, arguments.read_size, arguments.repeat)
+        print(f"{name:>20}: {number_of_frames} frames in {best_time * 1000:.1f} ms "
+              f"({number_of_frames / best_time:,.0f} frames/s)")
+
+
+if __name__ == "__main__":
+    run_benchmark()
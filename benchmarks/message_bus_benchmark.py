@@ -0,0 +1,151 @@
+"""
+This script compares the old dict protocol of the main queue, routed through a chain of
+if statements, with the typed messages, sent in their binary encoding and routed by the
+MessageDispatcher.
+
+It reports the size of every message, the time taken to build, pickle, unpickle and route a
+message in one process, and how many messages per second go through a multiprocessing Queue
+from a child process to the main process.
+
+Run it from the root of the repository:
+    python3 -m benchmarks.message_bus_benchmark --messages 200000
+"""
+import argparse
+import pickle
+import time
+import timeit
+from multiprocessing import Process, Queue
+
+from message_bus.message_dispatcher import MessageDispatcher
+from message_bus.messages import encode_message, decode_message, MESSAGE_CODECS, ApiCompletedMessage, \
+    ApiProcessingMessage, WeightValueReadMessage, CartonBarcodeScanValueMessage, ScanCompleteMessage, \
+    UploadSentMessage, CartonTypeDecidedMessage
+
+#   The types the old main loop checked, in the order it checked them
+DICT_MESSAGE_TYPES = (
+    'new tags read', 'done reading tags', 'carton type decided', 'carton type failed', 'scan complete',
+    'weight_value_read', 'carton barcode scan value', 'api error', 'barcode scanner permission error',
+    'get carton type', 'upload', 'close shipment', 'upload sent', 'upload retrying', 'upload rejected',
+)
+
+
+def build_dict_messages() -> list:
+    return [
+        'api processing',
+        'api completed',
+        {'type': 'weight_value_read', 'data': {'weight': 7.25}},
+        {'type': 'carton barcode scan value', 'data': {'carton_code': 'CB-104522P', 'carton_barcode': '8901234567890'}},
+        {'type': 'scan complete', 'data': {'reason': 'discovery plateaued', 'tags': 240, 'duration': 3.42}},
+        {'type': 'upload sent', 'data': {'upload_id': 1841, 'carton_barcode': '8901234567890', 'pending': 3, 'message': None}},
+        {'type': 'carton type decided', 'data': {'scan_id': 12, 'carton_type': 'solid'}},
+    ]
+
+
+def build_typed_messages() -> list:
+    return [
+        ApiProcessingMessage(),
+        ApiCompletedMessage(),
+        WeightValueReadMessage(7.25),
+        CartonBarcodeScanValueMessage('CB-104522P', '8901234567890'),
+        ScanCompleteMessage('discovery plateaued', 240, 3.42),
+        UploadSentMessage(1841, '8901234567890', 3),
+        CartonTypeDecidedMessage(12, 'solid'),
+    ]
+
+
+def route_dict_message(main_queue_value, counts: dict) -> None:
+    """Replicates the if chain of the old main loop"""
+    if main_queue_value == 'scan':
+        counts['scan'] += 1
+    elif main_queue_value == 'reset':
+        counts['reset'] += 1
+    elif main_queue_value == 'api processing':
+        counts['api processing'] += 1
+    elif main_queue_value == 'api completed':
+        counts['api completed'] += 1
+    elif main_queue_value == 'quit':
+        counts['quit'] += 1
+    elif isinstance(main_queue_value, dict):
+        for message_type in DICT_MESSAGE_TYPES:
+            if main_queue_value['type'] == message_type:
+                counts[message_type] += 1
+
+
+def build_dispatcher(counts: dict) -> MessageDispatcher:
+    dispatcher = MessageDispatcher()
+    for codec in MESSAGE_CODECS.values():
+        def handler(message, message_id=codec.message_id):
+            counts[message_id] += 1
+        dispatcher.register(codec.message_class, handler)
+    return dispatcher
+
+
+def send_dict_messages(queue: Queue, number_of_messages: int) -> None:
+    messages = build_dict_messages()
+    for index in range(number_of_messages):
+        queue.put(messages[index % len(messages)])
+    queue.put(None)
+
+
+def send_typed_messages(queue: Queue, number_of_messages: int) -> None:
+    messages = build_typed_messages()
+    for index in range(number_of_messages):
+        queue.put(encode_message(messages[index % len(messages)]))
+    queue.put(None)
+
+
+def measure_queue_throughput(send, receive, number_of_messages: int) -> float:
+    queue = Queue()
+    process = Process(target=send, args=(queue, number_of_messages))
+    started_at = time.perf_counter()
+    process.start()
+    while True:
+        value = queue.get()
+        if value is None:
+            break
+        receive(value)
+    seconds = time.perf_counter() - started_at
+    process.join()
+    return number_of_messages / seconds
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description='Benchmark the typed message bus against the dict protocol')
+    parser.add_argument('--messages', action='store', type=int, dest='messages', default=200000)
+    parser.add_argument('--repeat', action='store', type=int, dest='repeat', default=5)
+    arguments = parser.parse_args()
+
+    dict_messages = build_dict_messages()
+    typed_messages = build_typed_messages()
+    dict_counts = {message_type: 0 for message_type in ('scan', 'reset', 'api processing', 'api completed', 'quit', *DICT_MESSAGE_TYPES)}
+    typed_counts = {message_id: 0 for message_id in MESSAGE_CODECS}
+    dispatcher = build_dispatcher(typed_counts)
+
+    print('Pickled size of every message, dict protocol -> typed message:')
+    for dict_message, typed_message in zip(dict_messages, typed_messages):
+        print(f"  {type(typed_message).__name__}: {len(pickle.dumps(dict_message))} -> "
+              f"{len(pickle.dumps(encode_message(typed_message)))} bytes")
+
+    def round_trip_dict_messages():
+        for message in dict_messages:
+            route_dict_message(pickle.loads(pickle.dumps(message)), dict_counts)
+
+    def round_trip_typed_messages():
+        for message in typed_messages:
+            dispatcher.dispatch(decode_message(pickle.loads(pickle.dumps(encode_message(message)))))
+
+    number = max(arguments.messages // len(dict_messages) // 10, 1)
+    for name, round_trip in (('Dict protocol', round_trip_dict_messages), ('Typed messages', round_trip_typed_messages)):
+        seconds = min(timeit.repeat(round_trip, number=number, repeat=arguments.repeat))
+        print(f"{name}: {seconds / (number * len(dict_messages)) * 1e6:.2f} us to encode, pickle, unpickle and route a message")
+
+    dict_rate = measure_queue_throughput(
+        send_dict_messages, lambda value: route_dict_message(value, dict_counts), arguments.messages)
+    typed_rate = measure_queue_throughput(
+        send_typed_messages, lambda value: dispatcher.dispatch(decode_message(value)), arguments.messages)
+    print(f"Dict protocol through the main queue: {dict_rate:,.0f} messages per second")
+    print(f"Typed messages through the main queue: {typed_rate:,.0f} messages per second")
+
+
+if __name__ == "__main__":
+    run_benchmark()
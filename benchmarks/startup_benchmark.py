@@ -0,0 +1,210 @@
+"""
+This script measures how long the station takes to start, phase by phase.
+
+It reports:
+  - the time taken to import every heavy dependency in a fresh interpreter, split into the
+    ones the main process still imports and the ones that are now only imported where and
+    when they are used
+  - the time taken to get the secrets into the .env file with no snapshot (waiting for
+    Secrets Manager, as every start used to), with a fresh snapshot and with a stale one
+  - the time taken by the ProcessSupervisor to start the child processes and for every one
+    of them to send its first heartbeat
+  - the total time until the station is ready, with the secrets fetched before the child
+    processes are started, as it used to be, and with the startup used now
+
+Secrets Manager and the devices are simulated, with the delays given on the command line.
+
+Run it from the root of the repository:
+    python3 -m benchmarks.startup_benchmark --fetch-seconds 1.5 --device-seconds 0.5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Process, Queue
+from os import path
+
+from get_aws_secrets import SecretsCache
+from message_bus.messages import decode_message, HeartbeatMessage
+from process_supervisor import Heartbeat, ProcessSupervisor
+from startup_timer import StartupTimer
+
+#   The modules the main process imports before it starts anything
+EAGER_MODULES = ('requests', 'dotenv', 'tkinter')
+
+#   The modules that are only imported by the process and at the time they are needed
+DEFERRED_MODULES = ('boto3', 'watchtower', 'serial', 'pynmea2')
+
+SECRETS = {
+    'SERVER_BASE_URL': 'https://example.com', 'CLIENT_ID': 'client-id', 'CLIENT_SECRET': 'client-secret',
+    'AUDIENCE': 'audience', 'GRANT_TYPE': 'client_credentials', 'AUTH0_DOMAIN': 'https://example.auth0.com',
+}
+
+SUPERVISOR_CONFIG = {
+    'heartbeat_interval': 0.1,
+    'stall_timeout': 60.0,
+    'stall_timeouts': {},
+    'restart_initial_delay': 1.0,
+    'restart_max_delay': 30.0,
+    'healthy_after': 60.0,
+    'slow_loop_warning': 1.0,
+    'max_stalls_in_a_row': 3,
+}
+
+
+class SimulatedDevice(Process):
+    """This class stands in for a child process that takes device_seconds to open its device"""
+
+    def __init__(self, main_queue: Queue, device_seconds: float):
+        Process.__init__(self)
+        self.main_queue = main_queue
+        self.device_seconds = device_seconds
+
+    def run(self):
+        time.sleep(self.device_seconds)
+        heartbeat = Heartbeat(self.main_queue, SUPERVISOR_CONFIG['heartbeat_interval'])
+        heartbeat.beat()
+        #   Keep beating until the benchmark stops the process
+        while True:
+            time.sleep(heartbeat.get_timeout())
+            heartbeat.beat(time.monotonic())
+
+
+def measure_import(module: str):
+    """
+    Returns
+    -------
+    float
+      The seconds taken to import the module in a fresh interpreter, None if it is not installed
+    """
+    code = f"import time; started_at = time.perf_counter(); import {module}; print(time.perf_counter() - started_at)"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return float(result.stdout)
+
+
+def create_secrets_cache(directory: str, fetch_seconds: float, ttl_seconds: float) -> SecretsCache:
+    def fetch_secrets():
+        time.sleep(fetch_seconds)
+        return SECRETS
+    return SecretsCache(
+        path.join(directory, 'secrets_cache.json'), path.join(directory, '.env'), fetch_secrets, ttl_seconds, 1.0)
+
+
+def write_snapshot(directory: str, age_seconds: float) -> None:
+    with open(path.join(directory, 'secrets_cache.json'), 'w') as f:
+        json.dump({'secrets': SECRETS, 'fetched_at': time.time() - age_seconds}, f)
+    os.chmod(path.join(directory, 'secrets_cache.json'), 0o600)
+
+
+def wait_for_refresh(secrets_cache: SecretsCache) -> None:
+    """This method waits for the background refresh of a stale snapshot, before its directory is removed"""
+    while time.time() - secrets_cache.fetched_at > secrets_cache.ttl_seconds:
+        time.sleep(0.01)
+
+
+def measure_secrets(fetch_seconds: float, snapshot_age_seconds: float = None, ttl_seconds: float = 3600) -> float:
+    """
+    Returns
+    -------
+    float
+      The seconds until the .env file holds secrets, without a snapshot when snapshot_age_seconds is None
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        if snapshot_age_seconds is not None:
+            write_snapshot(directory, snapshot_age_seconds)
+        secrets_cache = create_secrets_cache(directory, fetch_seconds, ttl_seconds)
+        started_at = time.perf_counter()
+        secrets_cache.load()
+        secrets_cache.wait_until_ready()
+        seconds = time.perf_counter() - started_at
+        wait_for_refresh(secrets_cache)
+        return seconds
+
+
+def measure_startup(number_of_processes: int, fetch_seconds: float, device_seconds: float,
+                    has_snapshot: bool, is_parallel: bool) -> StartupTimer:
+    """
+    This method runs the startup of the main process with simulated child processes. When
+    is_parallel is False the secrets are fetched before anything else is started, as the
+    station used to do
+
+    Returns
+    -------
+    StartupTimer
+      The timings of every phase up to the first heartbeat of every child process
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        #   A snapshot from before the power cut, older than its TTL
+        if has_snapshot is True:
+            write_snapshot(directory, 7200)
+        secrets_cache = create_secrets_cache(directory, fetch_seconds, 3600)
+        startup_timer = StartupTimer()
+        secrets_cache.load()
+        if is_parallel is False:
+            secrets_cache.wait_until_ready()
+        startup_timer.mark('secrets')
+
+        main_queue = Queue()
+        process_supervisor = ProcessSupervisor(SUPERVISOR_CONFIG)
+        for index in range(number_of_processes):
+            process_supervisor.add(f"device {index}", lambda: SimulatedDevice(main_queue, device_seconds))
+        process_supervisor.start()
+        startup_timer.mark('child processes')
+
+        while process_supervisor.has_every_process_sent_heartbeat() is False:
+            message = decode_message(main_queue.get())
+            if isinstance(message, HeartbeatMessage):
+                process_supervisor.record_heartbeat(message)
+        startup_timer.mark('first heartbeats')
+        #   The station can take requests that need the secrets from here on
+        secrets_cache.wait_until_ready()
+        startup_timer.mark('secrets ready')
+
+        process_supervisor.stop()
+        for process in process_supervisor.get_processes():
+            process_supervisor.stop_process(process)
+        wait_for_refresh(secrets_cache)
+        return startup_timer
+
+
+def print_imports(title: str, modules: tuple) -> None:
+    print(title)
+    for module in modules:
+        seconds = measure_import(module)
+        print(f"  {module}: {'not installed' if seconds is None else f'{seconds * 1000:.1f} ms'}")
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description='Benchmark the startup of the station, phase by phase')
+    parser.add_argument('--fetch-seconds', action='store', type=float, dest='fetch_seconds', default=1.5,
+                        help='The time Secrets Manager takes to return the secrets')
+    parser.add_argument('--device-seconds', action='store', type=float, dest='device_seconds', default=0.5,
+                        help='The time every child process takes to open its device')
+    parser.add_argument('--processes', action='store', type=int, dest='processes', default=5)
+    arguments = parser.parse_args()
+
+    print_imports('Imported by the main process:', EAGER_MODULES)
+    print_imports('Only imported when they are used:', DEFERRED_MODULES)
+
+    print('Time until the .env file holds secrets:')
+    print(f"  No snapshot, waiting for Secrets Manager: {measure_secrets(arguments.fetch_seconds) * 1000:.1f} ms")
+    print(f"  Fresh snapshot: {measure_secrets(arguments.fetch_seconds, 0) * 1000:.1f} ms")
+    print(f"  Stale snapshot, refreshed in the background: {measure_secrets(arguments.fetch_seconds, 7200) * 1000:.1f} ms")
+
+    for name, has_snapshot, is_parallel in (
+            ('Secrets fetched before the child processes start', False, False),
+            ('No snapshot, child processes started while the secrets are fetched', False, True),
+            ('Stale snapshot, child processes started while the secrets are refreshed', True, True)):
+        startup_timer = measure_startup(
+            arguments.processes, arguments.fetch_seconds, arguments.device_seconds, has_snapshot, is_parallel)
+        phases = ', '.join(f"{phase} {seconds * 1000:.1f} ms" for phase, seconds in startup_timer.phases)
+        print(f"{name}: ready in {startup_timer.get_total_seconds() * 1000:.1f} ms ({phases})")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,117 @@
+"""
+This script compares the two ways a stream of tag batches can go from the TagReader process to
+the main process: every batch encoded into a message and sent through the main queue, as the
+NewTagsReadMessage used to be, and every batch written to the TagRingBuffer with only a
+TagsAvailableMessage sent through the main queue.
+
+For both it measures the tags per second the main process receives and the CPU time the main
+process spends on every tag.
+
+Run it from the root of the repository:
+    python3 -m benchmarks.tag_stream_benchmark --tags 500000 --batch-size 64
+"""
+import argparse
+import resource
+import struct
+import time
+from array import array
+from multiprocessing import Process, Queue
+
+from message_bus.messages import encode_message, decode_message, TagsAvailableMessage
+from tag_reader.tag_ring_buffer import TagRingBuffer, get_antenna_mask
+
+#   The layout of the old NewTagsReadMessage: the id, the length of the report, then the
+#   scan_started_at, sent_at and length of the EPCs, the EPCs and an antenna bitmask per EPC
+NEW_TAGS_READ_HEADER = struct.Struct('<BIddI')
+
+
+def get_cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def generate_epcs(number_of_epcs: int) -> list:
+    return [index.to_bytes(12, 'big') for index in range(number_of_epcs)]
+
+
+def send_through_queue(main_queue: Queue, tag_ring_buffer, epcs: list, batch_size: int) -> None:
+    antenna_mask = get_antenna_mask((1, 2))
+    for start in range(0, len(epcs), batch_size):
+        batch = epcs[start:start + batch_size]
+        packed_epcs = b''.join(batch)
+        masks = array('Q', [antenna_mask] * len(batch)).tobytes()
+        main_queue.put(NEW_TAGS_READ_HEADER.pack(10, len(packed_epcs) + len(masks) + 20, time.time(), time.time(),
+                                                 len(packed_epcs)) + packed_epcs + masks)
+    main_queue.put(None)
+
+
+def receive_from_queue(value, tag_ring_buffer) -> list:
+    packed_epcs_length = NEW_TAGS_READ_HEADER.unpack_from(value)[4]
+    packed_epcs = value[NEW_TAGS_READ_HEADER.size:NEW_TAGS_READ_HEADER.size + packed_epcs_length]
+    masks = array('Q')
+    masks.frombytes(value[NEW_TAGS_READ_HEADER.size + packed_epcs_length:])
+    return [packed_epcs[index:index + 12] for index in range(0, len(packed_epcs), 12)]
+
+
+def send_through_ring_buffer(main_queue: Queue, tag_ring_buffer: TagRingBuffer, epcs: list, batch_size: int) -> None:
+    antenna_mask = get_antenna_mask((1, 2))
+    for start in range(0, len(epcs), batch_size):
+        records = [(epc, 1, antenna_mask, time.time()) for epc in epcs[start:start + batch_size]]
+        while len(records) > 0:
+            number_of_records_written = tag_ring_buffer.write(records)
+            if number_of_records_written > 0:
+                main_queue.put(encode_message(TagsAvailableMessage(tag_ring_buffer.write_index)))
+            del records[:number_of_records_written]
+    main_queue.put(None)
+
+
+def receive_from_ring_buffer(value, tag_ring_buffer: TagRingBuffer) -> list:
+    message = decode_message(value)
+    return [epc for epc, scan_id, _, _ in tag_ring_buffer.read(message.write_index) if scan_id == 1]
+
+
+def measure(send, receive, number_of_tags: int, batch_size: int, ring_buffer_capacity: int) -> tuple:
+    """
+    Returns
+    -------
+    Tuple
+      The tags received per second and the CPU microseconds the main process spent per tag
+    """
+    epcs = generate_epcs(number_of_tags)
+    main_queue = Queue()
+    tag_ring_buffer = TagRingBuffer(ring_buffer_capacity)
+    process = Process(target=send, args=(main_queue, tag_ring_buffer, epcs, batch_size))
+    started_at = time.perf_counter()
+    cpu_started_at = get_cpu_seconds()
+    process.start()
+    tags = set()
+    while True:
+        value = main_queue.get()
+        if value is None:
+            break
+        tags.update(receive(value, tag_ring_buffer))
+    seconds = time.perf_counter() - started_at
+    cpu_seconds = get_cpu_seconds() - cpu_started_at
+    process.join()
+    tag_ring_buffer.close()
+    if len(tags) != number_of_tags:
+        raise AssertionError(f"Received {len(tags)} of {number_of_tags} tags")
+    return number_of_tags / seconds, cpu_seconds / number_of_tags * 1e6
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description='Benchmark the main queue against the tag ring buffer')
+    parser.add_argument('--tags', action='store', type=int, dest='tags', default=500000)
+    parser.add_argument('--batch-size', action='store', type=int, dest='batch_size', default=64)
+    parser.add_argument('--capacity', action='store', type=int, dest='capacity', default=4096)
+    arguments = parser.parse_args()
+
+    for name, send, receive in (
+            ('Batches through the main queue', send_through_queue, receive_from_queue),
+            ('Tag ring buffer', send_through_ring_buffer, receive_from_ring_buffer)):
+        tags_per_second, cpu_microseconds = measure(send, receive, arguments.tags, arguments.batch_size, arguments.capacity)
+        print(f"{name}: {tags_per_second:,.0f} tags per second, {cpu_microseconds:.2f} us of main process CPU per tag")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,166 @@
+"""
+This file contains the job that holds everything known about one carton, and the pipeline
+that moves finished cartons to the background upload while the next carton is scanned.
+"""
+from collections import OrderedDict
+
+from carton.carton_job_enums import CartonJobState
+from upload_carton_details import build_carton_details
+
+# How many barcodes of the cartons still being uploaded are shown on the display
+IN_FLIGHT_BARCODES_SHOWN = 3
+
+
+class CartonJob():
+    """
+    This class is used to hold the state of one carton
+
+    Attributes
+    ----------
+    state: CartonJobState
+      The stage the carton is at
+    tags: set
+      The raw EPCs read for the carton
+    carton_weight: float
+    carton_code: str
+    carton_barcode: str
+    carton_pack_type: str
+      None until the carton type has been worked out
+    shipment_id: str
+      Set when the carton is handed over to be uploaded
+    is_carton_type_requested: bool
+      True while the carton type is waiting on the end of the scan
+    is_weight_requested: bool
+      True once the weighing scale has been asked for the weight of the carton
+    upload_id: int
+      The id of the carton in the upload journal, once it has been written there
+    """
+
+    def __init__(self, carton_barcode: str = '', carton_code: str = ''):
+        self.state = CartonJobState.WAITING_FOR_BARCODE
+        self.tags = set()
+        self.carton_weight = 0
+        self.carton_code = carton_code
+        self.carton_barcode = carton_barcode
+        self.carton_pack_type = None
+        self.shipment_id = ''
+        self.is_carton_type_requested = False
+        self.is_weight_requested = False
+        self.upload_id = None
+
+    def set_barcode(self, carton_barcode: str, carton_code: str) -> None:
+        self.carton_barcode = carton_barcode
+        self.carton_code = carton_code
+        if self.state == CartonJobState.WAITING_FOR_BARCODE:
+            self.state = CartonJobState.READY_TO_SCAN
+
+    def start_scan(self) -> None:
+        """This method is called every time the operator hits scan, the carton is read afresh"""
+        self.tags.clear()
+        self.carton_pack_type = None
+        self.is_carton_type_requested = False
+        self.is_weight_requested = True
+        self.state = CartonJobState.SCANNING
+
+    def request_carton_type(self) -> None:
+        self.is_carton_type_requested = True
+        self.state = CartonJobState.GETTING_CARTON_TYPE
+
+    def set_carton_type_failed(self) -> None:
+        """The tags are cleared when the carton type could not be worked out, so the carton is scanned again"""
+        self.tags.clear()
+        self.is_carton_type_requested = False
+        self.state = CartonJobState.READY_TO_SCAN
+
+    def set_carton_type(self, carton_pack_type: str) -> None:
+        self.carton_pack_type = carton_pack_type
+        self.state = CartonJobState.READY_TO_UPLOAD
+
+    def build_carton_details(self) -> dict:
+        """
+        Raises
+        ------
+        FileNotFoundError
+          If the location.txt file has not been written yet
+        """
+        return build_carton_details(
+            self.tags,
+            self.carton_weight,
+            self.carton_code,
+            self.carton_barcode,
+            self.carton_pack_type,
+            self.shipment_id
+        )
+
+
+class CartonPipeline():
+    """
+    This class is used to keep track of the carton at the station and the cartons that were
+    handed over to the upload sender but are not uploaded yet
+
+    A carton is handed over as soon as it is written to the upload journal, and a new job is
+    started for the next carton straight away. The cartons in flight are dropped once the
+    upload sender reports them as sent or refused.
+
+    Attributes
+    ----------
+    upload_journal: UploadJournal
+    current_job: CartonJob
+      The carton at the station
+    in_flight_jobs: OrderedDict
+      Upload journal id -> CartonJob, oldest first
+    """
+
+    def __init__(self, upload_journal):
+        self.upload_journal = upload_journal
+        self.current_job = CartonJob()
+        self.in_flight_jobs = OrderedDict()
+        # Cartons left in the journal by the last run are still in flight
+        for upload_id, carton_details, *_ in upload_journal.get_pending():
+            job = CartonJob(carton_details['cartonBarcode'], carton_details['cartonCode'])
+            job.upload_id = upload_id
+            job.state = CartonJobState.UPLOADING
+            self.in_flight_jobs[upload_id] = job
+
+    def start_new_job(self) -> CartonJob:
+        self.current_job = CartonJob()
+        return self.current_job
+
+    def hand_off_current_job(self, shipment_id: str) -> CartonJob:
+        """
+        This method writes the current carton to the upload journal and starts a new job for
+        the next carton
+
+        Raises
+        ------
+        FileNotFoundError
+          If the location.txt file has not been written yet
+        sqlite3.Error
+          If the carton could not be written to the journal, the current job is kept
+        """
+        job = self.current_job
+        job.shipment_id = shipment_id
+        job.upload_id = self.upload_journal.append(job.build_carton_details())
+        job.state = CartonJobState.UPLOADING
+        self.in_flight_jobs[job.upload_id] = job
+        self.start_new_job()
+        return job
+
+    def set_upload_retrying(self, upload_id: int) -> None:
+        job = self.in_flight_jobs.get(upload_id)
+        if job is not None:
+            job.state = CartonJobState.RETRYING
+
+    def finish_upload(self, upload_id: int) -> None:
+        """This method is called once a carton has been uploaded or refused by the server"""
+        self.in_flight_jobs.pop(upload_id, None)
+
+    def get_status(self) -> dict:
+        """This method returns what the display shows about the pipeline"""
+        in_flight_jobs = list(self.in_flight_jobs.values())
+        return {
+            'current_state': self.current_job.state.value,
+            'in_flight': len(in_flight_jobs),
+            'retrying': sum(1 for job in in_flight_jobs if job.state == CartonJobState.RETRYING),
+            'in_flight_barcodes': [job.carton_barcode for job in in_flight_jobs[-IN_FLIGHT_BARCODES_SHOWN:]]
+        }
@@ -0,0 +1,15 @@
+from enum import Enum, unique
+
+@unique
+class CartonJobState(Enum):
+    """
+    This class is used to enumerate the stages a carton goes through, from the barcode being
+    scanned to the carton being uploaded
+    """
+    WAITING_FOR_BARCODE = 'waiting for barcode'
+    READY_TO_SCAN = 'ready to scan'
+    SCANNING = 'scanning'
+    GETTING_CARTON_TYPE = 'getting carton type'
+    READY_TO_UPLOAD = 'ready to upload'
+    UPLOADING = 'uploading'
+    RETRYING = 'retrying'
@@ -0,0 +1,156 @@
+"""
+This file contains the speculator that works out the carton type while the scan is running.
+
+As soon as the carton code is known, every batch of new EPCs read is decoded into product
+details on a worker thread, while the scan carries on. By the time the operator asks for the
+carton type most (usually all) of the EPCs have been decoded, and only the EPCs read since the
+last batch still have to go to the API.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from decode_carton_type import decode_epc_tags_into_product_details, get_carton_pack_type
+from exceptions import ApiError, UnknownCartonTypeError
+from message_bus.messages import send_message, CartonTypeDecidedMessage, CartonTypeFailedMessage
+
+logger = logging.getLogger('carton_type_speculator')
+
+
+class CartonTypeSpeculator():
+    """
+    This class is used to decode the EPCs of the current scan in the background
+
+    Only one batch of a scan is decoded at a time. EPCs that arrive while a batch is being
+    decoded are collected and sent together as the next batch. The result is sent to the
+    main queue as a CartonTypeDecidedMessage or CartonTypeFailedMessage once the carton type
+    has been asked for and every EPC has been decoded.
+
+    Attributes
+    ----------
+    main_queue: Queue
+      The queue the carton type is sent back on
+    scan_id: int
+      Changes with every new scan, results of an older scan are thrown away
+    carton_code: str
+      The carton code of the carton being scanned, None until the barcode is scanned
+    known_epcs: set
+      Every EPC of this scan that has been handed to the speculator
+    pending_epcs: set
+      EPCs that still have to be decoded
+    failed_epcs: set
+      EPCs that could not be decoded in the background, tried again once the carton type is asked for
+    product_details: list
+      The product details of every EPC decoded so far
+    """
+
+    def __init__(self, main_queue, max_workers: int = 2):
+        self.main_queue = main_queue
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='carton_type_speculator')
+        # The main loop and the worker threads share the state below
+        self.lock = threading.Lock()
+        self.scan_id = 0
+        self.carton_code = None
+        self.known_epcs = set()
+        self.pending_epcs = set()
+        self.failed_epcs = set()
+        self.product_details = []
+        self.is_decoding = False
+        self.is_carton_type_requested = False
+
+    def reset(self) -> None:
+        """This method is called when a new scan starts or the tags are cleared"""
+        with self.lock:
+            self.scan_id += 1
+            self.known_epcs = set()
+            self.pending_epcs = set()
+            self.failed_epcs = set()
+            self.product_details = []
+            self.is_decoding = False
+            self.is_carton_type_requested = False
+
+    def set_carton_code(self, carton_code) -> None:
+        with self.lock:
+            self.carton_code = carton_code
+            self.submit_pending_epcs()
+
+    def add_epcs(self, epcs) -> None:
+        """This method hands over EPCs that were read, only the ones not seen before are decoded"""
+        with self.lock:
+            new_epcs = set(epcs) - self.known_epcs
+            self.known_epcs |= new_epcs
+            self.pending_epcs |= new_epcs
+            self.submit_pending_epcs()
+
+    def request_carton_type(self) -> None:
+        """
+        This method is called once the final list of EPCs has been added. The carton type is
+        sent to the main queue straight away if every EPC has already been decoded
+        """
+        with self.lock:
+            if self.carton_code is None:
+                self.send_carton_type_failed(UnknownCartonTypeError('The carton barcode has not been scanned'))
+                return
+            self.is_carton_type_requested = True
+            self.pending_epcs |= self.failed_epcs
+            self.failed_epcs = set()
+            if self.is_decoding is False and len(self.pending_epcs) == 0:
+                self.send_carton_type()
+            else:
+                self.submit_pending_epcs()
+
+    def submit_pending_epcs(self) -> None:
+        """This method starts decoding the pending EPCs, it must be called with the lock held"""
+        if self.carton_code is None or self.is_decoding is True or len(self.pending_epcs) == 0:
+            return
+        epcs, self.pending_epcs = self.pending_epcs, set()
+        self.is_decoding = True
+        self.executor.submit(self.decode_epcs, self.scan_id, epcs)
+
+    def decode_epcs(self, scan_id: int, epcs: set) -> None:
+        """This method runs on a worker thread and decodes one batch of EPCs"""
+        product_details = None
+        error = None
+        try:
+            product_details = decode_epc_tags_into_product_details(epcs)
+        except Exception as err:
+            error = err
+
+        with self.lock:
+            if scan_id != self.scan_id:
+                return
+            self.is_decoding = False
+            if error is not None:
+                logger.log(logging.ERROR, f"Could not decode {len(epcs)} EPCs ahead of time: {error}")
+                self.failed_epcs |= epcs
+                if self.is_carton_type_requested is True:
+                    self.send_carton_type_failed(error)
+                    return
+            else:
+                self.product_details.extend(product_details)
+
+            if len(self.pending_epcs) > 0:
+                self.submit_pending_epcs()
+            elif self.is_carton_type_requested is True and len(self.failed_epcs) == 0:
+                self.send_carton_type()
+
+    def send_carton_type(self) -> None:
+        """This method works out the carton type from the product details, it must be called with the lock held"""
+        self.is_carton_type_requested = False
+        try:
+            carton_pack_type = get_carton_pack_type(self.product_details, self.carton_code)
+        except UnknownCartonTypeError as err:
+            self.send_carton_type_failed(err)
+            return
+        send_message(self.main_queue, CartonTypeDecidedMessage(self.scan_id, carton_pack_type))
+
+    def send_carton_type_failed(self, err: Exception) -> None:
+        self.is_carton_type_requested = False
+        send_message(self.main_queue, CartonTypeFailedMessage(
+            self.scan_id,
+            isinstance(err, ApiError),
+            err.message if isinstance(err, (ApiError, UnknownCartonTypeError)) else str(err)
+        ))
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
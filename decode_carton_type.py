@@ -3,21 +3,94 @@ import logging
 from carton.decide_carton_type import get_carton_perforation, decide_carton_type
 from make_api_request import MakeApiRequest
 from exceptions import ApiError, UnknownCartonTypeError
+from tag_reader.epc_codec import epcs_to_hex
+from tag_reader.epc_wire_format import encode_epcs, decode_epcs, UNSUPPORTED_FORMAT_STATUS_CODE
+from tag_reader.sgtin import group_epcs_by_gtin
+from product_cache import get_product_cache
+from station_config import load_station_config
 
-def decode_epc_tags_into_product_details(list_of_epcs):
+logger = logging.getLogger('decode_carton_type')
+
+# The EPCs are sent in the compact format, gzip compressed, only if the station is configured
+# for it, and then only until the server says it does not understand it
+is_compact_format_supported = load_station_config()['api']['compact_epc_format']
+
+def match_to_request_order(list_of_epcs, canonical_epcs, decoded_product_details):
+    """
+    The server answers a compact request in the canonical order of the EPCs, this method puts
+    the product details back in the order the EPCs were given in
+    """
+    if not isinstance(decoded_product_details, list) or len(decoded_product_details) != len(canonical_epcs):
+        return decoded_product_details
+    product_details_by_epc = dict(zip(canonical_epcs, decoded_product_details))
+    return [product_details_by_epc[bytes(epc)] for epc in list_of_epcs]
+
+def request_product_details(list_of_epcs):
     """
     This method is responsible for converting the EPC into product details via API request
+    The EPCs are passed in as raw bytes and sent as hex strings, or in the compact format if
+    the station is configured for it and the server accepts it. The list returned follows the order of the EPCs given
     """
+    global is_compact_format_supported
     api_request = MakeApiRequest('/fabship/product/rfid')
     decoded_product_details = None
     try:
+        if is_compact_format_supported is True:
+            encoded_epcs = encode_epcs(list_of_epcs)
+            try:
+                decoded_product_details = api_request.get_request_with_body(
+                    { 'epc': encoded_epcs }, compress=True
+                )
+                return match_to_request_order(list_of_epcs, decode_epcs(encoded_epcs), decoded_product_details)
+            except ApiError as err:
+                if err.status_code != UNSUPPORTED_FORMAT_STATUS_CODE:
+                    raise err
+                logger.log(logging.INFO, "The server does not accept the compact EPC format, sending hex strings instead")
+                is_compact_format_supported = False
         decoded_product_details = api_request.get_request_with_body(
-            { 'epc': list_of_epcs }
+            { 'epc': epcs_to_hex(list_of_epcs) }
         )
         return decoded_product_details
     except ApiError as err:
         raise err
 
+def decode_epc_tags_into_product_details(list_of_epcs):
+    """
+    This method is responsible for converting the EPC into product details
+    All units of a product share a GTIN, so the EPCs are grouped by GTIN and only one EPC
+    of every GTIN that is not in the product cache is sent to the API. EPCs that are not
+    SGTIN-96 are always sent. The list returned holds one product detail per EPC
+    """
+    product_cache = get_product_cache()
+    epcs_by_gtin = group_epcs_by_gtin(list_of_epcs)
+    other_epcs = epcs_by_gtin.pop(None, [])
+
+    product_details_by_gtin = product_cache.get_many(epcs_by_gtin)
+    unknown_gtins = [gtin for gtin in epcs_by_gtin if gtin not in product_details_by_gtin]
+    epcs_to_request = [epcs_by_gtin[gtin][0] for gtin in unknown_gtins] + other_epcs
+    logger.log(
+        logging.DEBUG, f"{len(product_details_by_gtin)} GTINs were found in the product cache, requesting {len(epcs_to_request)} EPCs")
+
+    other_product_details = []
+    if len(epcs_to_request) > 0:
+        requested_product_details = request_product_details(epcs_to_request)
+        if not isinstance(requested_product_details, list) or len(requested_product_details) != len(epcs_to_request):
+            #   The response cannot be matched to the EPCs that were sent, so ask for every EPC instead
+            logger.log(
+                logging.ERROR, "The product details could not be matched to the EPCs requested. Requesting every EPC")
+            return request_product_details(list_of_epcs)
+
+        new_product_details_by_gtin = dict(zip(unknown_gtins, requested_product_details))
+        product_cache.put_many(new_product_details_by_gtin)
+        product_details_by_gtin.update(new_product_details_by_gtin)
+        other_product_details = requested_product_details[len(unknown_gtins):]
+
+    decoded_product_details = []
+    for gtin, epcs in epcs_by_gtin.items():
+        decoded_product_details.extend([product_details_by_gtin[gtin]] * len(epcs))
+    decoded_product_details.extend(other_product_details)
+    return decoded_product_details
+
 def get_carton_pack_type(product_details, carton_barcode):
     """
     This method is responsible for getting the carton type based on the product details
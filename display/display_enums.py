@@ -5,16 +5,13 @@ class DisplayEnums(Enum):
     """
     This class is used to enumerate the different display options
     """
-    SCAN = 'scan'
-    GET_CARTON_TYPE = 'get carton type'
-    UPLOAD = 'upload'
     UPLOAD_SUCCESS = 'upload success'
     UPLOAD_FAIL = 'upload fail'
     SHOW_SCANNED_BARCODE = 'show scanned barcode'
     SHOW_WEIGHT = 'show weight'
     SHOW_NUMBER_OF_TAGS = 'show number of tags'
+    SHOW_SCAN_COMPLETE = 'show scan complete'
     SHOW_CARTON_TYPE = 'show carton type'   
+    SHOW_PIPELINE_STATUS = 'show pipeline status'
     CUSTOM_ERROR = 'custom error' 
-    QUIT = 'quit'
-    RESET = 'reset'
     
@@ -1,5 +1,6 @@
 from multiprocessing import Process, Queue
 import logging
+import time
 import tkinter as tk
 from tkinter import *
 from tkinter import Button, Canvas, Checkbutton, ttk, messagebox, Frame
@@ -7,6 +8,10 @@ from tkinter.constants import DISABLED, LEFT, RIGHT, TOP
 from display.display_enums import DisplayEnums
 from display.generate_shipment_id import generate_shipment_id
 from common_enums import CommonEnums
+from queue_events import get_queue_reader, get_queued_values
+from message_bus.messages import send_message, ScanMessage, ResetMessage, QuitMessage, GetCartonTypeMessage, \
+    UploadMessage, CloseShipmentMessage
+from process_supervisor import Heartbeat
 
 
 class DisplayTagIdGUI(Process):
@@ -15,7 +20,7 @@ class DisplayTagIdGUI(Process):
     are being read from the USB device
     """
 
-    def __init__(self, queue: Queue, main_queue: Queue):
+    def __init__(self, queue: Queue, main_queue: Queue, shipment_id: int):
         """
         Parameters
         ----------
@@ -24,28 +29,37 @@ class DisplayTagIdGUI(Process):
         main_queue: list
           The list into which this process will transfer data back to the
           main process
+        shipment_id: int
+          The shipment being packed. It is generated by the main process, so that it
+          stays the same when the display is restarted
         """
         Process.__init__(self)
-        self.root = tk.Tk()
+        #   The window is only created in the child process, so the main process does not wait
+        #   for the connection to the X server while the station starts up
+        self.root = None
         self.queue = queue
         self.main_queue = main_queue
         self.logger = logging.getLogger('display_tag_id_gui')
-        self.shipment_id = generate_shipment_id()
+        self.shipment_id = shipment_id
         self.scan_button = None
         self.get_carton_type_button = None
         self.upload_button = None
 
-        #   Define the variables for storing the checkbox value
-        self.carton_barcode_checkbox_variable = BooleanVar(False)
-        self.tags_checkbox_variable = BooleanVar(False)
-        self.weight_checkbox_variable = BooleanVar(False)
-        self.carton_type_checkbox_value = BooleanVar(False)
+        #   Define the variables for storing the checkbox value, they need the window
+        self.carton_barcode_checkbox_variable = None
+        self.tags_checkbox_variable = None
+        self.weight_checkbox_variable = None
+        self.carton_type_checkbox_value = None
 
         #   Define the variables for storing the output values
         self.barcode_output = None
         self.weight_output = None
         self.carton_type_output = None
         self.rfid_output = None
+        self.pipeline_status_output = None
+
+        #   TKinter calls send_heartbeat every heartbeat interval while its event loop is running
+        self.heartbeat = Heartbeat(main_queue)
 
     def show_error(self, title: str, body: str) -> None:
         """This method will show an error message"""
@@ -68,17 +82,14 @@ class DisplayTagIdGUI(Process):
         This method is called when the scan button is pressed
         """
         self.logger.log(logging.DEBUG, "The user pressed scan")
-        self.main_queue.put(DisplayEnums.SCAN.value)
+        send_message(self.main_queue, ScanMessage())
 
     def get_carton_type(self):
         """
         This method is called to get the carton type
         """
         self.logger.log(logging.DEBUG, "The user pressed get carton type")
-        self.main_queue.put({
-            'type': DisplayEnums.GET_CARTON_TYPE.value,
-            'data': None
-        })
+        send_message(self.main_queue, GetCartonTypeMessage())
 
     def upload(self):
         """
@@ -89,26 +100,23 @@ class DisplayTagIdGUI(Process):
         if self.carton_barcode_checkbox_variable is False or self.weight_checkbox_variable is False or self.tags_checkbox_variable is False:
             self.logger.log(logging.DEBUG, "The user tried to upload without all the relevant data")
             self.show_error(title="Upload Error", body="All the data is not entered. View checkboxes on the side for more information.")
-        # self.main_queue.put(DisplayEnums.UPLOAD.value)
-        self.main_queue.put({
-            'type': DisplayEnums.UPLOAD.value,
-            'data': {
-                'shipment_id': self.shipment_id
-            }
-        })
+        send_message(self.main_queue, UploadMessage(self.shipment_id))
 
     def close_window(self):
         """
         This method is called when the close button is pressed
         """
         if messagebox.askokcancel("Quit", "Do you want to quit?"):
-            self.main_queue.put(DisplayEnums.QUIT.value)
+            send_message(self.main_queue, QuitMessage())
             self.logger.log(logging.DEBUG, "The user pressed quit")
             self.root.destroy()
 
     def generate_new_shipment_id(self):
         """This method generates a new shipment id"""
-        self.shipment_id = generate_shipment_id()
+        #   The cartons of the old shipment can be uploaded without waiting for more of them
+        next_shipment_id = generate_shipment_id()
+        send_message(self.main_queue, CloseShipmentMessage(self.shipment_id, next_shipment_id))
+        self.shipment_id = next_shipment_id
         self.set_new_shipment_id()
 
     def check_if_scan_button_should_be_activated(self):
@@ -142,7 +150,7 @@ class DisplayTagIdGUI(Process):
 
     def reset_data(self):
         """This method will reset all data from the UI after an upload is successful"""
-        self.main_queue.put(DisplayEnums.RESET.value)
+        send_message(self.main_queue, ResetMessage())
         self.carton_barcode_checkbox_variable.set(False)
         self.tags_checkbox_variable.set(False)
         self.weight_checkbox_variable.set(False)
@@ -157,14 +165,28 @@ class DisplayTagIdGUI(Process):
         self.get_carton_type_button['state'] = DISABLED
         self.upload_button['state'] = DISABLED
 
+    def show_pipeline_status(self, pipeline_status: dict):
+        """This method shows the stage of the current carton and the cartons still being uploaded"""
+        text = f"Current carton: {pipeline_status['current_state']}\nUploading: {pipeline_status['in_flight']}"
+        if pipeline_status['retrying'] > 0:
+            text += f" ({pipeline_status['retrying']} retrying)"
+        if len(pipeline_status['in_flight_barcodes']) > 0:
+            text += f"\nLatest: {', '.join(pipeline_status['in_flight_barcodes'])}"
+        self.pipeline_status_output['text'] = text
+
     def set_new_shipment_id(self):
         """This method will set the new shipment id"""
         self.shipment_id_label['text'] = f"Shipment ID: {self.shipment_id}"
 
-    def run_loop(self):
+    def send_heartbeat(self):
+        """This method is called by TKinter on a timer, it stops being called if the event loop is stuck"""
+        self.heartbeat.beat()
+        self.root.after(int(self.heartbeat.interval * 1000), self.send_heartbeat)
+
+    def run_loop(self, file_object=None, mask=None):
         """
-        This method is used to run a loop every 900ms and is called
-        by TKinter. It listens for user interactions
+        This method is called by TKinter as soon as the main process puts something on the
+        queue, and handles every value waiting on it
 
         Raises
         ------
@@ -172,12 +194,15 @@ class DisplayTagIdGUI(Process):
           Raises a base Exception if it receives an enum type it does not understand
         """
 
-        # Check if the queue has any elements in it
-        # Do this because queue.get() is a blocking call
-        if self.queue.qsize() > 0:
-            input_value = self.queue.get()
+        #   The handler is removed while the values are handled. A message box shown here runs an
+        #   event loop of its own, which would otherwise call this method again for the values behind it
+        loop_started_at = time.monotonic()
+        queue_reader = get_queue_reader(self.queue)
+        self.root.tk.deletefilehandler(queue_reader)
+        for input_value in get_queued_values(self.queue):
             if input_value == DisplayEnums.UPLOAD_SUCCESS.value:
-                self.show_message("Upload Successful", "Your data was uploaded successfully")
+                #   The carton is uploaded in the background and shows up under the upload button,
+                #   so the next carton can be started without dismissing a message first
                 self.reset_data()
             if input_value == DisplayEnums.UPLOAD_FAIL.value:
                 self.show_error("Upload Error", "There was an error while uploading the carton details")
@@ -196,9 +221,14 @@ class DisplayTagIdGUI(Process):
                 elif input_value['type'] == DisplayEnums.SHOW_NUMBER_OF_TAGS.value:
                     self.rfid_output['text'] = input_value['data']['tags']
                     self.tags_checkbox_variable.set(True)
+                elif input_value['type'] == DisplayEnums.SHOW_SCAN_COMPLETE.value:
+                    self.rfid_output['text'] = f"{input_value['data']['tags']} (scan complete)"
+                    self.tags_checkbox_variable.set(True)
                 elif input_value['type'] == DisplayEnums.SHOW_CARTON_TYPE.value:
                     self.carton_type_output['text'] = input_value['data']['carton_type']
                     self.carton_type_checkbox_variable.set(True)
+                elif input_value['type'] == DisplayEnums.SHOW_PIPELINE_STATUS.value:
+                    self.show_pipeline_status(input_value['data'])
                 elif input_value['type'] == CommonEnums.API_ERROR.value:
                     message = input_value['message']
                     self.show_error('Server Error', message)
@@ -212,7 +242,8 @@ class DisplayTagIdGUI(Process):
         self.check_if_scan_button_should_be_activated()
         self.check_if_get_carton_type_button_should_be_activated()
         self.check_if_upload_button_should_be_activated()
-        self.root.after(300, self.run_loop)
+        self.root.tk.createfilehandler(queue_reader, tk.READABLE, self.run_loop)
+        self.heartbeat.beat(loop_started_at)
 
     def draw_ui(self):
         self.root.columnconfigure(0, weight=1)
@@ -327,8 +358,15 @@ class DisplayTagIdGUI(Process):
         self.upload_button.grid(row=6, column=0, sticky=(N, S, E, W))
         self.upload_button.config(font=("TkDefaultFont", 15))
 
+        #   Cartons are uploaded in the background while the next one is scanned, show both
+        self.pipeline_status_output = Label(right_frame, text="Current carton: waiting for barcode\nUploading: 0")
+        self.pipeline_status_output.grid(row=7, column=0, pady=10)
+        self.pipeline_status_output.config(font=("TkDefaultFont", 12))
+
         self.root.protocol("WM_DELETE_WINDOW", self.close_window)
-        self.root.after(900, self.run_loop)
+        #   TKinter calls run_loop as soon as the main process puts something on the queue
+        self.root.tk.createfilehandler(get_queue_reader(self.queue), tk.READABLE, self.run_loop)
+        self.send_heartbeat()
         tk.mainloop()
 
     def run(self):
@@ -336,4 +374,9 @@ class DisplayTagIdGUI(Process):
         This method is required to be implemented by any class
         that sub-classes multiprocessing.Process
         """
+        self.root = tk.Tk()
+        self.carton_barcode_checkbox_variable = BooleanVar(False)
+        self.tags_checkbox_variable = BooleanVar(False)
+        self.weight_checkbox_variable = BooleanVar(False)
+        self.carton_type_checkbox_value = BooleanVar(False)
         self.draw_ui()
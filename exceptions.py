@@ -4,10 +4,17 @@ This file contains custom exceptions
 
 
 class ApiError(Exception):
-    def __init__(self, message):
+    def __init__(self, message, status_code=None):
         self.message = message
+        # The HTTP status the server responded with, None if the server was not reached
+        self.status_code = status_code
         super().__init__(self.message)
 
+class BatchUnsupportedError(ApiError):
+    """Raised when the server answers a batch upload without a list of results"""
+    def __init__(self, message):
+        super().__init__(message)
+
 class UnknownCartonTypeError(Exception):
     def __init__(self, message):
         self.message = message
@@ -2,13 +2,31 @@
 # If you need more information about configurations or implementing the sample code, visit the AWS docs:   
 # https://aws.amazon.com/developers/getting-started/python/
 
-import boto3
 import base64
-from botocore.exceptions import ClientError
 import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from os import path
+
 from environment_variable import EnvironmentVariable
+from station_config import load_station_config
+
+logger = logging.getLogger('get_aws_secrets')
+
+
+def get_env_file_path() -> str:
+    dirname = path.dirname(__file__)
+    return path.join(dirname, '.env')
+
 
 def get_secret(environment):
+    #   boto3 takes a long time to import, it is only imported once the secrets have to be
+    #   fetched, which happens in the background while the station starts up
+    import boto3
+    from botocore.exceptions import ClientError
 
     #   Load the secrets based on environment
     if environment == EnvironmentVariable.DEVELOPMENT.value:
@@ -73,13 +91,166 @@ def get_secret(environment):
             
     # Your code goes here.
 
-def write_secrets_to_env_file(secrets: dict):
+def write_private_file(file_path: str, contents: str) -> None:
+    """
+    This method writes a file that only the owner can read. The file is written in full and
+    then moved into place, so a reader never sees half of it
+    """
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=path.dirname(file_path), prefix='.secrets')
     try:
-        with open('.env', 'w') as env_file:
-            for key, value in secrets.items():
-                string_to_write = f"{key}={value}\n"   
-                env_file.write(string_to_write)
+        # mkstemp creates the file readable by the owner only
+        with os.fdopen(file_descriptor, 'w') as f:
+            f.write(contents)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, file_path)
+    except Exception:
+        os.unlink(temporary_path)
+        raise
+
+
+def write_secrets_to_env_file(secrets: dict, env_file_path: str = None):
+    if env_file_path is None:
+        env_file_path = get_env_file_path()
+    try:
+        write_private_file(env_file_path, ''.join(f"{key}={value}\n" for key, value in secrets.items()))
         print('Done writing the env file successfully')
     except Exception as err:
         print(f"Error while writing the .env file: {err}")
-        raise err
\ No newline at end of file
+        raise err
+
+
+class SecretsCache():
+    """
+    This class is used to have the secrets in the .env file without waiting for Secrets Manager
+
+    The secrets last fetched are kept in a snapshot file that only the owner can read. When the
+    station starts, the .env file is written from the snapshot straight away, even if it is
+    older than ttl_seconds, and a background thread fetches the secrets again and rewrites both
+    files. Only a station that has never fetched the secrets has to wait for Secrets Manager.
+
+    Attributes
+    ----------
+    path: str
+      The file the snapshot is kept in
+    env_file_path: str
+      The .env file the secrets are written to
+    fetch_secrets: Callable
+      Fetches the secrets from Secrets Manager and returns them as a dict
+    ttl_seconds: float
+      A snapshot older than this is fetched again in the background
+    retry_interval: float
+      The time in seconds to wait before fetching again when a fetch fails
+    secrets: dict
+      The secrets written to the .env file, None until there are any
+    fetched_at: float
+      The time the secrets were fetched at as a UNIX timestamp
+    is_ready: Event
+      Set once the .env file holds secrets
+    """
+
+    def __init__(self, path: str, env_file_path: str, fetch_secrets, ttl_seconds: float, retry_interval: float):
+        self.path = path
+        self.env_file_path = env_file_path
+        self.fetch_secrets = fetch_secrets
+        self.ttl_seconds = ttl_seconds
+        self.retry_interval = retry_interval
+        self.secrets = None
+        self.fetched_at = None
+        self.is_ready = threading.Event()
+        self.lock = threading.Lock()
+        # Called from the refresh thread the first time the secrets are fetched, if there
+        # was no snapshot to start from
+        self.on_ready = []
+        self.refresh_thread = None
+
+    def read_snapshot_file(self):
+        """This method returns the (secrets, fetched_at) saved by the last fetch, or None"""
+        try:
+            with open(self.path, 'r') as f:
+                # A snapshot copied in by hand may be readable by everyone
+                if os.fstat(f.fileno()).st_mode & 0o077:
+                    logger.log(logging.WARNING, f"{self.path} could be read by other users, restricting it to its owner")
+                    os.fchmod(f.fileno(), 0o600)
+                snapshot = json.load(f)
+            return snapshot['secrets'], snapshot['fetched_at']
+        except (FileNotFoundError, KeyError, ValueError):
+            return None
+
+    def use_secrets(self, secrets: dict, fetched_at: float) -> None:
+        write_secrets_to_env_file(secrets, self.env_file_path)
+        self.secrets = secrets
+        self.fetched_at = fetched_at
+        self.is_ready.set()
+
+    def load(self) -> bool:
+        """
+        This method writes the .env file from the snapshot and starts fetching the secrets in
+        the background if the snapshot is missing or older than ttl_seconds. It never waits for
+        Secrets Manager
+
+        Returns
+        -------
+        bool
+          True if the .env file holds secrets, False if they are still being fetched
+        """
+        snapshot = self.read_snapshot_file()
+        if snapshot is not None:
+            self.use_secrets(*snapshot)
+            logger.log(logging.DEBUG, f"Using the secrets fetched {time.time() - self.fetched_at:.0f} s ago")
+        self.start_background_refresh()
+        return self.is_ready.is_set()
+
+    def when_ready(self, callback) -> None:
+        """This method calls callback once the .env file holds secrets, straight away if it already does"""
+        with self.lock:
+            if self.is_ready.is_set() is False:
+                self.on_ready.append(callback)
+                return
+        callback()
+
+    def wait_until_ready(self, timeout: float = None) -> bool:
+        return self.is_ready.wait(timeout)
+
+    def refresh(self) -> None:
+        secrets = self.fetch_secrets()
+        if secrets is None:
+            raise ValueError('Secrets Manager did not return the secrets as a string')
+        fetched_at = time.time()
+        write_private_file(self.path, json.dumps({'secrets': secrets, 'fetched_at': fetched_at}))
+        with self.lock:
+            self.use_secrets(secrets, fetched_at)
+            on_ready, self.on_ready = self.on_ready, []
+        logger.log(logging.DEBUG, "Fetched the secrets from Secrets Manager")
+        for callback in on_ready:
+            callback()
+
+    def start_background_refresh(self) -> None:
+        if self.refresh_thread is None:
+            self.refresh_thread = threading.Thread(target=self.run_background_refresh, daemon=True)
+            self.refresh_thread.start()
+
+    def run_background_refresh(self) -> None:
+        while True:
+            time_until_stale = 0 if self.fetched_at is None else self.fetched_at + self.ttl_seconds - time.time()
+            if time_until_stale > 0:
+                time.sleep(time_until_stale)
+                continue
+            try:
+                self.refresh()
+            except Exception as err:
+                logger.log(logging.ERROR, f"There was an error while fetching the secrets: {err}")
+                time.sleep(self.retry_interval)
+
+
+def get_secrets_cache(environment: str) -> SecretsCache:
+    """This method returns the secrets cache of the main process for the environment"""
+    secrets_cache_config = load_station_config()['secrets_cache']
+    dirname = path.dirname(__file__)
+    return SecretsCache(
+        path.join(dirname, f"{environment}-{secrets_cache_config['path']}"),
+        get_env_file_path(),
+        lambda: get_secret(environment),
+        secrets_cache_config['ttl_seconds'],
+        secrets_cache_config['retry_interval']
+    )
@@ -0,0 +1,58 @@
+"""
+This file contains a small in-process cache that holds a bounded number of entries, each for
+a limited time.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUTTLCache():
+    """
+    This class is used to cache values in memory, evicting the least recently used entry once
+    max_entries are held and ignoring entries older than ttl_seconds
+
+    Attributes
+    ----------
+    max_entries: int
+      The number of entries kept before the least recently used one is evicted
+    ttl_seconds: float
+      How long an entry is trusted after it was stored
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (value, stored at), kept in order of use with the most recently used last
+        self.entries = OrderedDict()
+        # The cache may be filled from a worker thread while the process reads from it
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """This method returns the value stored for key, or default if it is missing or expired"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            if time.monotonic() - entry[1] > self.ttl_seconds:
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value) -> None:
+        with self.lock:
+            self.entries[key] = (value, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, self) is not self
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
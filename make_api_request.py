@@ -1,77 +1,182 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 import logging
 import json
+import gzip
 from dotenv import load_dotenv
 from exceptions import ApiError
+from auth_token_cache import get_auth_token_cache
+
+# The connect and read timeouts in seconds for every request
+REQUEST_TIMEOUT = (5, 30)
+
+# The number of pooled connections kept open to each host
+CONNECTION_POOL_SIZE = 4
+
+# Request bodies are compressed at a level that is quick on the Pi and still small
+GZIP_COMPRESS_LEVEL = 6
+
+# The .env file the secrets are written to, and its modification time when this process last loaded it
+ENV_FILE_PATH = os.path.join(os.path.dirname(__file__), '.env')
+env_file_modified_at = None
+
+
+def load_env_file() -> None:
+  """Loads the .env file into the environment, again whenever it has been rewritten since. The
+  station starts before the secrets have been fetched, so a process can be started before the
+  file is written and the secrets are refreshed in the background while it runs"""
+  global env_file_modified_at
+  try:
+    modified_at = os.stat(ENV_FILE_PATH).st_mtime_ns
+  except FileNotFoundError:
+    return
+  if modified_at != env_file_modified_at:
+    load_dotenv(ENV_FILE_PATH, override=True)
+    env_file_modified_at = modified_at
 
 """
 This class will be used to construct and carry out API requests.
 """
 class MakeApiRequest():
-  # Load the env variables when this class is instantiated
-  load_dotenv()
-
   # This will be a static variable for this class
   headers = {'version': '6.0'}
 
+  # The session is shared by every request made from the same process, so that connections
+  # (and their TLS handshakes) are reused between requests
+  session = None
+  session_pid = None
+
   def __init__(self, url: str):
-    # Load all the env variables
+    # The path of the endpoint, the base URL is only added when a request is made
+    self.path = url
     # Create the logger variable
-    self.api_url = os.getenv("SERVER_BASE_URL")
-    self.client_id = os.getenv("CLIENT_ID")
-    self.client_secret = os.getenv("CLIENT_SECRET")
-    self.audience = os.getenv("AUDIENCE")
-    self.grant_type = os.getenv("GRANT_TYPE")
-    self.auth0_domain = os.getenv("AUTH0_DOMAIN")
-    self.url = f"{self.api_url}{url}"
     self.logger = logging.getLogger('make_api_request')
 
+  @staticmethod
+  def get_env(name: str):
+    """Returns the env variable as it is in the .env file now. A request object can be built
+    before the secrets have been fetched, and the secrets are refreshed while it is in use"""
+    load_env_file()
+    return os.getenv(name)
+
+  @property
+  def api_url(self):
+    return MakeApiRequest.get_env("SERVER_BASE_URL")
+
+  @property
+  def url(self) -> str:
+    return f"{self.api_url}{self.path}"
+
+  @property
+  def client_id(self):
+    return MakeApiRequest.get_env("CLIENT_ID")
+
+  @property
+  def client_secret(self):
+    return MakeApiRequest.get_env("CLIENT_SECRET")
+
+  @property
+  def audience(self):
+    return MakeApiRequest.get_env("AUDIENCE")
+
+  @property
+  def grant_type(self):
+    return MakeApiRequest.get_env("GRANT_TYPE")
+
+  @property
+  def auth0_domain(self):
+    return MakeApiRequest.get_env("AUTH0_DOMAIN")
+
+  @staticmethod
+  def get_session() -> requests.Session:
+    """Returns the session for this process, creating it on first use. A child process
+    never reuses the connections of the process it was forked from"""
+    if MakeApiRequest.session is None or MakeApiRequest.session_pid != os.getpid():
+      session = requests.Session()
+      # Only failures to connect are retried, since the request never reached the server
+      retry = Retry(total=2, connect=2, read=0, redirect=0, status=0, backoff_factor=0.3)
+      adapter = HTTPAdapter(pool_connections=CONNECTION_POOL_SIZE, pool_maxsize=CONNECTION_POOL_SIZE, max_retries=retry)
+      session.mount('https://', adapter)
+      session.mount('http://', adapter)
+      session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+      MakeApiRequest.session = session
+      MakeApiRequest.session_pid = os.getpid()
+    return MakeApiRequest.session
+
+  @staticmethod
+  def get_error_message(response) -> str:
+    """Returns the message the server sent with an error, or the HTTP reason if the body
+    is not the usual JSON error (for example a 404 page from a proxy)"""
+    try:
+      return json.loads(response.text)['message']
+    except (ValueError, KeyError, TypeError):
+      return f"{response.status_code} {response.reason}"
+
   @staticmethod
   def add_authentication_header(token: str) -> None:
     MakeApiRequest.headers['Authorization'] = f'Bearer {token}'
 
+  def request_authentication_token(self) -> dict:
+    """Fetches a new authentication token from Auth0 using client credentials"""
+    payload = {
+      'client_id': self.client_id, 
+      'client_secret': self.client_secret,
+      'audience': self.audience, 
+      'grant_type': self.grant_type
+    }
+    response = MakeApiRequest.get_session().post(f"{self.auth0_domain}", json=payload, timeout=REQUEST_TIMEOUT)
+    if not response.ok:
+      raise ApiError(f"Could not get an authentication token, Auth0 responded with {response.status_code}", response.status_code)
+    return response.json()
+
   def get_authentication_token(self):
-    """Will fetch a new authentication token using client credentials and update
-    the headers dict"""
+    """Will take a valid authentication token from the token cache shared by all
+    the processes and update the headers dict"""
     try:
-      self.logger.log(logging.DEBUG, "Making a request to get the authentication token")
-      payload = {
-        'client_id': self.client_id, 
-        'client_secret': self.client_secret,
-        'audience': self.audience, 
-        'grant_type': self.grant_type
-      }
-      response = requests.post(f"{self.auth0_domain}", json=payload)
-      parsed_response = response.json()
-      access_token = parsed_response['access_token']
-      self.logger.log(logging.DEBUG, "Got the authentication token")
-      MakeApiRequest.add_authentication_header(access_token)
+      token = get_auth_token_cache(self.request_authentication_token).get_token()
+      MakeApiRequest.add_authentication_header(token)
       return
     except Exception as err:
       raise err
 
-  def retry_request(self, method, payload):
+  @staticmethod
+  def prefetch_authentication_token() -> None:
+    """Starts refreshing the authentication token in the background, so that the token is
+    already in the shared cache when the first request is made"""
+    get_auth_token_cache(MakeApiRequest('').request_authentication_token).start_background_refresh()
+
+  @staticmethod
+  def get_compressed_body(data: dict):
+    """Returns the data as a gzip compressed JSON body along with the headers to send it with"""
+    body = gzip.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'), compresslevel=GZIP_COMPRESS_LEVEL, mtime=0)
+    headers = {**MakeApiRequest.headers, 'Content-Type': 'application/json', 'Content-Encoding': 'gzip'}
+    return body, headers
+
+  def retry_request(self, method, payload, compress=False):
     if method == 'GET':
       return self.get(payload)
     elif method == 'POST':
-      return self.post(payload)
+      return self.post(payload, compress)
     elif method == 'GET_WITH_BODY':
-      return self.get_request_with_body(payload)
+      return self.get_request_with_body(payload, compress)
 
-  def authenticate_and_retry_request(self, method, payload):
-    """Will re-fetch the token and then retry the request"""
+  def authenticate_and_retry_request(self, method, payload, compress=False):
+    """Will replace the token the server rejected and then retry the request"""
     try:
-      self.get_authentication_token()
-      return self.retry_request(method, payload)
+      rejected_token = MakeApiRequest.headers['Authorization'].replace('Bearer ', '', 1)
+      get_auth_token_cache(self.request_authentication_token).invalidate(rejected_token)
+      return self.retry_request(method, payload, compress)
     except Exception as err:
       raise err
       
   def get(self, data: dict={}):
     """Makes a GET method API request"""
     try:
+      self.get_authentication_token()
       self.logger.log(logging.DEBUG, f"Making a GET request with the following data: {data} to the following endpoint: {self.url}")
-      response = requests.get(self.url, params=data, headers=MakeApiRequest.headers)
+      response = MakeApiRequest.get_session().get(self.url, params=data, headers=MakeApiRequest.headers, timeout=REQUEST_TIMEOUT)
       response.raise_for_status()
       return response.json()
     except requests.exceptions.HTTPError as err:
@@ -79,53 +184,73 @@ class MakeApiRequest():
         self.logger.log(logging.ERROR, "There was a 401 authentication error while making the GET request. Application will fetch a new token and retry the request")
         return self.authenticate_and_retry_request('GET', data)
       else:
-        error_response = json.loads(err.response.text)
-        error_message = error_response['message']
+        error_message = MakeApiRequest.get_error_message(err.response)
         self.logger.log(logging.ERROR, f"There was an error while making the GET request: {error_message}")
-        raise ApiError(error_message) from err
+        raise ApiError(error_message, err.response.status_code) from err
 
     except requests.exceptions.MissingSchema as err:
       self.logger.log(logging.ERROR, f"There was an error while making the GET request: {err}")
       raise err
 
-  def post(self, data: dict):
-    """Makes a POST method API request"""
+    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as err:
+      self.logger.log(logging.ERROR, f"The server could not be reached while making the GET request: {err}")
+      raise ApiError('The server could not be reached. Please check the network connection and try again') from err
+
+  def post(self, data: dict, compress: bool = False):
+    """Makes a POST method API request. With compress the body is sent as gzip compressed JSON"""
     try:
+      self.get_authentication_token()
       self.logger.log(logging.DEBUG, f"Making a POST request with the following data: {data} to the following endpoint: {self.url}")
-      response = requests.post(self.url, json=data, headers=MakeApiRequest.headers)
+      if compress is True:
+        body, headers = MakeApiRequest.get_compressed_body(data)
+        response = MakeApiRequest.get_session().post(self.url, data=body, headers=headers, timeout=REQUEST_TIMEOUT)
+      else:
+        response = MakeApiRequest.get_session().post(self.url, json=data, headers=MakeApiRequest.headers, timeout=REQUEST_TIMEOUT)
       response.raise_for_status()
       return response.json()
     except requests.exceptions.HTTPError as err:
       if err.response.status_code == 401:
         self.logger.log(logging.ERROR, "There was a 401 authentication error while making the POST request. Application will fetch a new token and retry the request")
-        return self.authenticate_and_retry_request('POST', data)
+        return self.authenticate_and_retry_request('POST', data, compress)
       else:
-        error_response = json.loads(err.response.text)
-        error_message = error_response['message']
+        error_message = MakeApiRequest.get_error_message(err.response)
         self.logger.log(logging.ERROR, f"There was an error while making the POST request: {error_message}")
-        raise ApiError(error_message) from err
+        raise ApiError(error_message, err.response.status_code) from err
 
     except requests.exceptions.MissingSchema as err:
       self.logger.log(logging.ERROR, f"There was an error while making the POST request: {err}")
       raise err
 
-  def get_request_with_body(self, data: dict={}):
-    """Makes a GET method API request with the body attached"""
+    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as err:
+      self.logger.log(logging.ERROR, f"The server could not be reached while making the POST request: {err}")
+      raise ApiError('The server could not be reached. Please check the network connection and try again') from err
+
+  def get_request_with_body(self, data: dict={}, compress: bool = False):
+    """Makes a GET method API request with the body attached. With compress the body is sent
+    as gzip compressed JSON instead of being form encoded"""
     try:
+      self.get_authentication_token()
       self.logger.log(logging.DEBUG, f"Making a GET request with the following data: {data} attached to the body to the following endpoint: {self.url}")
-      response = requests.request(method='get', url=self.url, data=data, headers = MakeApiRequest.headers)
+      if compress is True:
+        body, headers = MakeApiRequest.get_compressed_body(data)
+        response = MakeApiRequest.get_session().request(method='get', url=self.url, data=body, headers=headers, timeout=REQUEST_TIMEOUT)
+      else:
+        response = MakeApiRequest.get_session().request(method='get', url=self.url, data=data, headers = MakeApiRequest.headers, timeout=REQUEST_TIMEOUT)
       response.raise_for_status()
       return response.json()
     except requests.exceptions.HTTPError as err:
       if err.response.status_code == 401:
         self.logger.log(logging.ERROR, "There was a 401 authentication error while making the GET request with a body. Application will fetch a new token and retry the request")
-        return self.authenticate_and_retry_request('GET_WITH_BODY', data)
+        return self.authenticate_and_retry_request('GET_WITH_BODY', data, compress)
       else:
-        error_response = json.loads(err.response.text)
-        error_message = error_response['message']
+        error_message = MakeApiRequest.get_error_message(err.response)
         self.logger.log(logging.ERROR, f"There was an error while making the GET request with a body: {error_message}")
-        raise ApiError(error_message) from err
+        raise ApiError(error_message, err.response.status_code) from err
 
     except requests.exceptions.MissingSchema as err:
       self.logger.log(logging.ERROR, f"There was an error while making the GET request with a body: {err}")
       raise err
+
+    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as err:
+      self.logger.log(logging.ERROR, f"The server could not be reached while making the GET request with a body: {err}")
+      raise ApiError('The server could not be reached. Please check the network connection and try again') from err
@@ -0,0 +1,29 @@
+from enum import IntEnum, unique
+
+@unique
+class MessageId(IntEnum):
+    """
+    This class is used to enumerate the messages sent to the main process. The id is the first
+    byte of every encoded message, so it must not change once a message has been given one
+    """
+    SCAN = 1
+    RESET = 2
+    QUIT = 3
+    GET_CARTON_TYPE = 4
+    UPLOAD = 5
+    CLOSE_SHIPMENT = 6
+    API_PROCESSING = 7
+    API_COMPLETED = 8
+    API_ERROR = 9
+    DONE_READING_TAGS = 11
+    SCAN_COMPLETE = 12
+    WEIGHT_VALUE_READ = 13
+    CARTON_BARCODE_SCAN_VALUE = 14
+    BARCODE_SCANNER_PERMISSION_ERROR = 15
+    CARTON_TYPE_DECIDED = 16
+    CARTON_TYPE_FAILED = 17
+    UPLOAD_SENT = 18
+    UPLOAD_RETRYING = 19
+    UPLOAD_REJECTED = 20
+    TAGS_AVAILABLE = 21
+    HEARTBEAT = 22
@@ -0,0 +1,47 @@
+import logging
+
+logger = logging.getLogger('message_dispatcher')
+
+
+class MessageDispatcher():
+    """
+    This class is used to route every message to the handler registered for its class
+
+    The handlers are kept in a dict keyed by the message id, so finding the handler of a
+    message takes one lookup however many messages are registered.
+
+    Attributes
+    ----------
+    handlers: dict
+      Message id -> the method that is called with the message
+    """
+
+    def __init__(self):
+        self.handlers = {}
+
+    def register(self, message_class, handler) -> None:
+        """
+        Raises
+        ------
+        ValueError
+          If a handler has already been registered for the message class
+        """
+        message_id = int(message_class.MESSAGE_ID)
+        if message_id in self.handlers:
+            raise ValueError(f"A handler for {message_class.__name__} has already been registered")
+        self.handlers[message_id] = handler
+
+    def handles(self, message_class):
+        """This method is used as a decorator to register the decorated function as a handler"""
+        def decorator(handler):
+            self.register(message_class, handler)
+            return handler
+        return decorator
+
+    def dispatch(self, message):
+        """This method calls the handler of the message and returns what it returns"""
+        handler = self.handlers.get(message.MESSAGE_ID)
+        if handler is None:
+            logger.log(logging.DEBUG, f"No handler is registered for {type(message).__name__}, ignoring it")
+            return None
+        return handler(message)
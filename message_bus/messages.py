@@ -0,0 +1,358 @@
+"""
+This file contains the messages the child processes send to the main process, and the binary
+codec they travel in.
+
+Every message is a slotted class with an integer MESSAGE_ID and a FIELDS tuple of
+(name, kind) pairs. An encoded message is the id as one byte, the fixed size fields packed
+with struct, the length of every variable size field, and then the variable size fields
+themselves:
+
+    [id: B] [fixed fields ...] [length: I per variable field] [variable fields ...]
+
+A message without fields is a single byte. The codec of a message is built once, when its
+class is registered, so encoding and decoding never look at FIELDS again.
+"""
+import struct
+
+from message_bus.message_bus_enums import MessageId
+
+#   The struct format of every kind of field that has a fixed size
+FIXED_FIELD_FORMATS = {
+    'int': 'q',
+    'optional_int': 'q',
+    'float': 'd',
+    'bool': '?',
+}
+
+#   The kinds of field whose size changes from one message to the next
+VARIABLE_FIELD_KINDS = ('str', 'optional_str')
+
+#   An optional int that is None is sent as this value, so it can only hold numbers from 0 up
+MISSING_INT = -1
+
+#   An optional str that is None is sent with this length
+MISSING_LENGTH = 0xFFFFFFFF
+
+MESSAGE_CODECS = {}
+
+
+class MessageCodec():
+    """
+    This class is used to encode and decode one class of message
+
+    Attributes
+    ----------
+    message_class: type
+      The Message subclass this codec handles
+    header: struct.Struct
+      Packs the id, the fixed size fields and the lengths of the variable size fields
+    """
+
+    def __init__(self, message_class):
+        self.message_class = message_class
+        self.message_id = int(message_class.MESSAGE_ID)
+        unknown_kinds = {kind for _, kind in message_class.FIELDS} - set(FIXED_FIELD_FORMATS) - set(VARIABLE_FIELD_KINDS)
+        if len(unknown_kinds) > 0:
+            raise ValueError(f"{message_class.__name__} has fields of an unknown kind: {unknown_kinds}")
+        fixed_fields = [(name, kind) for name, kind in message_class.FIELDS if kind in FIXED_FIELD_FORMATS]
+        self.variable_fields = [(name, kind) for name, kind in message_class.FIELDS if kind in VARIABLE_FIELD_KINDS]
+        self.fixed_names = [name for name, _ in fixed_fields]
+        self.optional_int_indexes = [index for index, (_, kind) in enumerate(fixed_fields) if kind == 'optional_int']
+        self.header = struct.Struct(
+            '<B' + ''.join(FIXED_FIELD_FORMATS[kind] for _, kind in fixed_fields) + 'I' * len(self.variable_fields))
+        #   A message without fields always encodes to the same byte
+        self.encoded_empty = self.header.pack(self.message_id) if len(message_class.FIELDS) == 0 else None
+
+    def encode(self, message) -> bytes:
+        if self.encoded_empty is not None:
+            return self.encoded_empty
+        fixed_values = [getattr(message, name) for name in self.fixed_names]
+        for index in self.optional_int_indexes:
+            if fixed_values[index] is None:
+                fixed_values[index] = MISSING_INT
+        if len(self.variable_fields) == 0:
+            return self.header.pack(self.message_id, *fixed_values)
+        variable_values = []
+        lengths = []
+        for name, kind in self.variable_fields:
+            value = getattr(message, name)
+            if value is None and kind == 'optional_str':
+                lengths.append(MISSING_LENGTH)
+                continue
+            value = value.encode('utf-8')
+            variable_values.append(value)
+            lengths.append(len(value))
+        return self.header.pack(self.message_id, *fixed_values, *lengths) + b''.join(variable_values)
+
+    def decode(self, data: bytes):
+        message = self.message_class.__new__(self.message_class)
+        if self.encoded_empty is not None:
+            return message
+        header_values = self.header.unpack_from(data)
+        number_of_fixed_fields = len(self.fixed_names)
+        for index, name in enumerate(self.fixed_names, start=1):
+            setattr(message, name, header_values[index])
+        for index in self.optional_int_indexes:
+            if header_values[index + 1] == MISSING_INT:
+                setattr(message, self.fixed_names[index], None)
+        offset = self.header.size
+        for (name, kind), length in zip(self.variable_fields, header_values[1 + number_of_fixed_fields:]):
+            if length == MISSING_LENGTH:
+                setattr(message, name, None)
+                continue
+            value = data[offset:offset + length]
+            offset += length
+            setattr(message, name, value.decode('utf-8'))
+        return message
+
+
+def register_message(message_class):
+    """This method is used as a class decorator, it builds the codec of the message class"""
+    message_id = int(message_class.MESSAGE_ID)
+    if message_id in MESSAGE_CODECS:
+        raise ValueError(f"The message id {message_id} is used by {MESSAGE_CODECS[message_id].message_class.__name__}")
+    message_class.CODEC = MessageCodec(message_class)
+    MESSAGE_CODECS[message_id] = message_class.CODEC
+    return message_class
+
+
+def encode_message(message) -> bytes:
+    return message.CODEC.encode(message)
+
+
+def decode_message(data: bytes):
+    """
+    Raises
+    ------
+    KeyError
+      If the first byte is not the id of a registered message
+    """
+    return MESSAGE_CODECS[data[0]].decode(data)
+
+
+def send_message(queue, message) -> None:
+    """This method encodes a message and puts it on a queue, usually the main queue"""
+    queue.put(encode_message(message))
+
+
+class Message():
+    """This class is the base of every message sent to the main process"""
+    __slots__ = ()
+    MESSAGE_ID = None
+    FIELDS = ()
+    CODEC = None
+
+    def __eq__(self, other) -> bool:
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name, _ in self.FIELDS)
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name, _ in self.FIELDS)
+        return f"{type(self).__name__}({fields})"
+
+
+@register_message
+class ScanMessage(Message):
+    __slots__ = ()
+    MESSAGE_ID = MessageId.SCAN
+
+
+@register_message
+class ResetMessage(Message):
+    __slots__ = ()
+    MESSAGE_ID = MessageId.RESET
+
+
+@register_message
+class QuitMessage(Message):
+    __slots__ = ()
+    MESSAGE_ID = MessageId.QUIT
+
+
+@register_message
+class GetCartonTypeMessage(Message):
+    __slots__ = ()
+    MESSAGE_ID = MessageId.GET_CARTON_TYPE
+
+
+@register_message
+class UploadMessage(Message):
+    __slots__ = ('shipment_id',)
+    MESSAGE_ID = MessageId.UPLOAD
+    FIELDS = (('shipment_id', 'int'),)
+
+    def __init__(self, shipment_id: int):
+        self.shipment_id = shipment_id
+
+
+@register_message
+class CloseShipmentMessage(Message):
+    __slots__ = ('shipment_id', 'next_shipment_id')
+    MESSAGE_ID = MessageId.CLOSE_SHIPMENT
+    FIELDS = (('shipment_id', 'int'), ('next_shipment_id', 'int'))
+
+    def __init__(self, shipment_id: int, next_shipment_id: int):
+        self.shipment_id = shipment_id
+        # The main process keeps the shipment ID, so that a display that is restarted shows the same one
+        self.next_shipment_id = next_shipment_id
+
+
+@register_message
+class ApiProcessingMessage(Message):
+    __slots__ = ()
+    MESSAGE_ID = MessageId.API_PROCESSING
+
+
+@register_message
+class ApiCompletedMessage(Message):
+    __slots__ = ()
+    MESSAGE_ID = MessageId.API_COMPLETED
+
+
+@register_message
+class ApiErrorMessage(Message):
+    __slots__ = ('message',)
+    MESSAGE_ID = MessageId.API_ERROR
+    FIELDS = (('message', 'optional_str'),)
+
+    def __init__(self, message: str):
+        self.message = message
+
+
+@register_message
+class TagsAvailableMessage(Message):
+    """New tags have been written to the tag ring buffer, up to write_index"""
+    __slots__ = ('write_index',)
+    MESSAGE_ID = MessageId.TAGS_AVAILABLE
+    FIELDS = (('write_index', 'int'),)
+
+    def __init__(self, write_index: int):
+        self.write_index = write_index
+
+
+@register_message
+class DoneReadingTagsMessage(Message):
+    """
+    Sent once a scan has ended, every tag of the scan has been written to the tag ring buffer
+    by then, up to write_index
+    """
+    __slots__ = ('scan_id', 'tag_count', 'write_index')
+    MESSAGE_ID = MessageId.DONE_READING_TAGS
+    FIELDS = (('scan_id', 'int'), ('tag_count', 'int'), ('write_index', 'int'))
+
+    def __init__(self, scan_id: int, tag_count: int, write_index: int):
+        self.scan_id = scan_id
+        self.tag_count = tag_count
+        self.write_index = write_index
+
+
+@register_message
+class ScanCompleteMessage(Message):
+    """Sent when a scan completed on its own, ahead of the DoneReadingTagsMessage"""
+    __slots__ = ('reason', 'tags', 'duration')
+    MESSAGE_ID = MessageId.SCAN_COMPLETE
+    FIELDS = (('reason', 'str'), ('tags', 'int'), ('duration', 'float'))
+
+    def __init__(self, reason: str, tags: int, duration: float):
+        self.reason = reason
+        self.tags = tags
+        self.duration = duration
+
+
+@register_message
+class WeightValueReadMessage(Message):
+    __slots__ = ('weight',)
+    MESSAGE_ID = MessageId.WEIGHT_VALUE_READ
+    FIELDS = (('weight', 'float'),)
+
+    def __init__(self, weight: float):
+        self.weight = weight
+
+
+@register_message
+class CartonBarcodeScanValueMessage(Message):
+    __slots__ = ('carton_code', 'carton_barcode', 'expected_tag_count')
+    MESSAGE_ID = MessageId.CARTON_BARCODE_SCAN_VALUE
+    #   The API can answer a barcode without a carton code
+    FIELDS = (('carton_code', 'optional_str'), ('carton_barcode', 'str'), ('expected_tag_count', 'optional_int'))
+
+    def __init__(self, carton_code: str, carton_barcode: str, expected_tag_count: int = None):
+        self.carton_code = carton_code
+        self.carton_barcode = carton_barcode
+        self.expected_tag_count = expected_tag_count
+
+
+@register_message
+class BarcodeScannerPermissionErrorMessage(Message):
+    __slots__ = ('message',)
+    MESSAGE_ID = MessageId.BARCODE_SCANNER_PERMISSION_ERROR
+    FIELDS = (('message', 'str'),)
+
+    def __init__(self, message: str):
+        self.message = message
+
+
+@register_message
+class CartonTypeDecidedMessage(Message):
+    __slots__ = ('scan_id', 'carton_type')
+    MESSAGE_ID = MessageId.CARTON_TYPE_DECIDED
+    FIELDS = (('scan_id', 'int'), ('carton_type', 'str'))
+
+    def __init__(self, scan_id: int, carton_type: str):
+        self.scan_id = scan_id
+        self.carton_type = carton_type
+
+
+@register_message
+class CartonTypeFailedMessage(Message):
+    __slots__ = ('scan_id', 'is_api_error', 'message')
+    MESSAGE_ID = MessageId.CARTON_TYPE_FAILED
+    FIELDS = (('scan_id', 'int'), ('is_api_error', 'bool'), ('message', 'optional_str'))
+
+    def __init__(self, scan_id: int, is_api_error: bool, message: str):
+        self.scan_id = scan_id
+        self.is_api_error = is_api_error
+        self.message = message
+
+
+class UploadResultMessage(Message):
+    """The result of one carton upload, pending is the number of cartons still in the journal"""
+    __slots__ = ('upload_id', 'carton_barcode', 'pending', 'message')
+    FIELDS = (('upload_id', 'int'), ('carton_barcode', 'str'), ('pending', 'int'), ('message', 'optional_str'))
+
+    def __init__(self, upload_id: int, carton_barcode: str, pending: int, message: str = None):
+        self.upload_id = upload_id
+        self.carton_barcode = carton_barcode
+        self.pending = pending
+        self.message = message
+
+
+@register_message
+class UploadSentMessage(UploadResultMessage):
+    __slots__ = ()
+    MESSAGE_ID = MessageId.UPLOAD_SENT
+
+
+@register_message
+class UploadRetryingMessage(UploadResultMessage):
+    __slots__ = ()
+    MESSAGE_ID = MessageId.UPLOAD_RETRYING
+
+
+@register_message
+class UploadRejectedMessage(UploadResultMessage):
+    __slots__ = ()
+    MESSAGE_ID = MessageId.UPLOAD_REJECTED
+
+
+@register_message
+class HeartbeatMessage(Message):
+    """Sent by every child process while it is running, loops is the number of loops since the last one"""
+    __slots__ = ('pid', 'loops', 'longest_loop_seconds')
+    MESSAGE_ID = MessageId.HEARTBEAT
+    FIELDS = (('pid', 'int'), ('loops', 'int'), ('longest_loop_seconds', 'float'))
+
+    def __init__(self, pid: int, loops: int, longest_loop_seconds: float):
+        self.pid = pid
+        self.loops = loops
+        self.longest_loop_seconds = longest_loop_seconds
@@ -0,0 +1,375 @@
+"""
+This file contains the supervisor that keeps the child processes running, and the heartbeat
+every child process sends it.
+
+Every child sends a HeartbeatMessage on the main queue while its loop is running, with the
+number of loops since the last heartbeat and the longest of them. The main process hands the
+heartbeats to the ProcessSupervisor and calls check on it every time its loop goes round. A
+child that died, or that stopped sending heartbeats because it is stuck, is stopped and a new
+one is started in its place, which opens its devices again. Restarts that follow each other
+wait longer every time, so that a device that is unplugged is not opened in a tight loop.
+
+A stall that restarting the child does not cure, such as the lock of a shared queue left held
+by a child that was killed, is handed to systemd: the main process exits and the service is
+started again from scratch.
+"""
+import logging
+import os
+import sys
+import time
+
+from message_bus.messages import send_message, HeartbeatMessage
+from station_config import load_station_config
+
+logger = logging.getLogger('process_supervisor')
+
+# The exit code of the main process once the supervisor cannot recover the station on its own,
+# systemd then restarts the whole service
+UNRECOVERABLE_STALL_EXIT_CODE = 3
+
+
+class Heartbeat():
+    """
+    This class is used by a child process to tell the supervisor that its loop is still running
+
+    Attributes
+    ----------
+    main_queue: Queue
+      The queue the heartbeats are sent on
+    interval: float
+      The time in seconds between two heartbeats
+    loops: int
+      The number of loops since the last heartbeat was sent
+    longest_loop_seconds: float
+      The longest of those loops
+    next_beat_at: float
+      The monotonic time at which the next heartbeat is due
+    """
+
+    def __init__(self, main_queue, interval: float = None):
+        self.main_queue = main_queue
+        if interval is None:
+            interval = load_station_config()['supervisor']['heartbeat_interval']
+        self.interval = interval
+        self.loops = 0
+        self.longest_loop_seconds = 0.0
+        self.next_beat_at = 0.0
+
+    def get_timeout(self, timeout: float = None) -> float:
+        """
+        This method returns how long the child can wait for its queue or devices before it has to
+        send the next heartbeat, never more than timeout
+        """
+        time_until_beat = max(self.next_beat_at - time.monotonic(), 0)
+        if timeout is None:
+            return time_until_beat
+        return min(timeout, time_until_beat)
+
+    def beat(self, loop_started_at: float = None) -> None:
+        """
+        This method is called every time the loop of the child goes round, with the monotonic
+        time at which the work of the loop started. The heartbeat is only sent once it is due
+        """
+        now = time.monotonic()
+        if loop_started_at is not None:
+            self.loops += 1
+            self.longest_loop_seconds = max(self.longest_loop_seconds, now - loop_started_at)
+        if now < self.next_beat_at:
+            return
+        send_message(self.main_queue, HeartbeatMessage(os.getpid(), self.loops, self.longest_loop_seconds))
+        self.loops = 0
+        self.longest_loop_seconds = 0.0
+        self.next_beat_at = now + self.interval
+
+
+class SupervisedProcess():
+    """
+    This class is used to keep track of one child process of the supervisor
+
+    Attributes
+    ----------
+    name: str
+      The name the process is reported under
+    create_process: Callable
+      Returns a new, unstarted process. A process can only be started once, so every restart
+      creates a new one, which opens its devices again
+    on_restart: Callable
+      Called with no arguments once a restarted process is running, so the main process can
+      send it the state it needs again
+    stall_timeout: float
+      The process is restarted once it has not sent a heartbeat for this many seconds
+    process: Process
+      The process that is running now
+    last_heartbeat_at: float
+      The monotonic time of the last heartbeat, or of the start of the process before its first one
+    failed_at: float
+      The monotonic time at which the process was found dead, or sent its last heartbeat before it
+      got stuck. None while it is running
+    restart_at: float
+      The monotonic time at which the process is started again, None while it is running
+    restarts_in_a_row: int
+      The number of restarts since the process last stayed up for healthy_after seconds
+    stalls_in_a_row: int
+      The number of stalls since the process last sent a heartbeat, a restart that does not
+      get it to send one again did not help
+    is_stalled: bool
+      True from the time the process is found stuck until it sends a heartbeat again
+    """
+
+    def __init__(self, name: str, create_process, stall_timeout: float, on_restart=None):
+        self.name = name
+        self.create_process = create_process
+        self.on_restart = on_restart
+        self.stall_timeout = stall_timeout
+        self.process = None
+        self.started_at = None
+        self.last_heartbeat_at = None
+        self.has_sent_heartbeat = False
+        self.failed_at = None
+        self.restart_at = None
+        self.restarts_in_a_row = 0
+        self.stalls_in_a_row = 0
+        self.is_stalled = False
+        self.crashes = 0
+        self.stalls = 0
+        self.restarts = 0
+        self.last_recovery_seconds = None
+        self.total_downtime_seconds = 0.0
+        self.longest_loop_seconds = 0.0
+
+    def start(self) -> None:
+        self.process = self.create_process()
+        self.process.start()
+        self.started_at = time.monotonic()
+        self.last_heartbeat_at = self.started_at
+        self.has_sent_heartbeat = False
+
+    def get_statistics(self) -> dict:
+        return {
+            'crashes': self.crashes,
+            'stalls': self.stalls,
+            'restarts': self.restarts,
+            'last_recovery_seconds': self.last_recovery_seconds,
+            'total_downtime_seconds': self.total_downtime_seconds,
+            'longest_loop_seconds': self.longest_loop_seconds,
+        }
+
+
+class ProcessSupervisor():
+    """
+    This class is used to start the child processes and restart any of them that dies or gets stuck
+
+    Only the main process uses the supervisor. It never blocks: a process that has to be
+    restarted is stopped and then started again by a later call to check once its backoff
+    delay has passed.
+
+    Attributes
+    ----------
+    supervised_processes: Dict
+      The name of every child process -> its SupervisedProcess
+    check_interval: float
+      The longest time the main process should wait for a message before calling check
+    is_stopping: bool
+      True once the station is shutting down, processes that exit are no longer restarted
+    max_stalls_in_a_row: int
+      The main process exits once a process has stalled this many times without sending a
+      heartbeat in between, or once every process has stalled at the same time
+    """
+
+    def __init__(self, supervisor_config: dict = None):
+        if supervisor_config is None:
+            supervisor_config = load_station_config()['supervisor']
+        self.stall_timeout = supervisor_config['stall_timeout']
+        self.stall_timeouts = supervisor_config['stall_timeouts']
+        self.restart_initial_delay = supervisor_config['restart_initial_delay']
+        self.restart_max_delay = supervisor_config['restart_max_delay']
+        self.healthy_after = supervisor_config['healthy_after']
+        self.slow_loop_warning = supervisor_config['slow_loop_warning']
+        self.check_interval = supervisor_config['heartbeat_interval']
+        self.max_stalls_in_a_row = supervisor_config['max_stalls_in_a_row']
+        self.supervised_processes = {}
+        self.last_checked_at = 0.0
+        self.is_stopping = False
+
+    def add(self, name: str, create_process) -> None:
+        """
+        Raises
+        ------
+        ValueError
+          If a process has already been added under the name
+        """
+        if name in self.supervised_processes:
+            raise ValueError(f"A process named {name} is already supervised")
+        self.supervised_processes[name] = SupervisedProcess(
+            name, create_process, self.stall_timeouts.get(name, self.stall_timeout))
+
+    def restarted(self, name: str):
+        """This method is used as a decorator to register the decorated function as the on_restart of a process"""
+        def decorator(on_restart):
+            self.supervised_processes[name].on_restart = on_restart
+            return on_restart
+        return decorator
+
+    def start(self) -> None:
+        for supervised_process in self.supervised_processes.values():
+            supervised_process.start()
+
+    def get_processes(self) -> list:
+        """This method returns the processes running now, to be joined once the station shuts down"""
+        return [
+            supervised_process.process for supervised_process in self.supervised_processes.values()
+            if supervised_process.process is not None
+        ]
+
+    def has_every_process_sent_heartbeat(self) -> bool:
+        """This method returns True once every process running now has sent its first heartbeat"""
+        return all(
+            supervised_process.has_sent_heartbeat for supervised_process in self.supervised_processes.values()
+        )
+
+    def record_heartbeat(self, message) -> None:
+        """This method is called by the main process with every HeartbeatMessage it receives"""
+        for supervised_process in self.supervised_processes.values():
+            if supervised_process.process is not None and supervised_process.process.pid == message.pid:
+                break
+        else:
+            #   A heartbeat sent by a process that has since been replaced
+            return
+        now = time.monotonic()
+        supervised_process.last_heartbeat_at = now
+        supervised_process.longest_loop_seconds = max(supervised_process.longest_loop_seconds, message.longest_loop_seconds)
+        if message.longest_loop_seconds > self.slow_loop_warning:
+            logger.log(
+                logging.WARNING,
+                f"One loop of {supervised_process.name} took {message.longest_loop_seconds:.2f} s ({message.loops} loops since the last heartbeat)")
+        supervised_process.stalls_in_a_row = 0
+        supervised_process.is_stalled = False
+        if supervised_process.has_sent_heartbeat is False:
+            supervised_process.has_sent_heartbeat = True
+            if supervised_process.failed_at is not None:
+                self.record_recovery(supervised_process, now)
+
+    def record_recovery(self, supervised_process: SupervisedProcess, now: float) -> None:
+        """This method is called once the first heartbeat of a restarted process has arrived"""
+        recovery_seconds = now - supervised_process.failed_at
+        supervised_process.failed_at = None
+        supervised_process.last_recovery_seconds = recovery_seconds
+        supervised_process.total_downtime_seconds += recovery_seconds
+        logger.log(
+            logging.WARNING,
+            f"{supervised_process.name} recovered in {recovery_seconds:.2f} s: {supervised_process.get_statistics()}")
+
+    def get_restart_delay(self, restarts_in_a_row: int) -> float:
+        return min(self.restart_initial_delay * 2 ** restarts_in_a_row, self.restart_max_delay)
+
+    def check(self, force: bool = False) -> None:
+        """
+        This method finds the processes that died or stopped sending heartbeats and stops them,
+        and starts again the ones whose backoff delay has passed. It does nothing if it was
+        called less than check_interval seconds ago, unless force is True
+
+        The main process exits, for systemd to restart the station, once every process has
+        stalled at the same time or a process keeps stalling after it was restarted
+        """
+        now = time.monotonic()
+        if self.is_stopping is True or (force is False and now - self.last_checked_at < self.check_interval):
+            return
+        self.last_checked_at = now
+        for supervised_process in self.supervised_processes.values():
+            if supervised_process.restart_at is not None:
+                if now >= supervised_process.restart_at:
+                    self.restart(supervised_process)
+                continue
+
+            process = supervised_process.process
+            if process.is_alive() is False:
+                if process.exitcode == 0:
+                    #   The process chose to exit, the station is shutting down
+                    continue
+                supervised_process.crashes += 1
+                logger.log(
+                    logging.ERROR, f"{supervised_process.name} died with exit code {process.exitcode}")
+                self.schedule_restart(supervised_process, now)
+            elif now - supervised_process.last_heartbeat_at > supervised_process.stall_timeout:
+                supervised_process.stalls += 1
+                supervised_process.stalls_in_a_row += 1
+                supervised_process.is_stalled = True
+                logger.log(
+                    logging.ERROR,
+                    f"{supervised_process.name} has not sent a heartbeat for {now - supervised_process.last_heartbeat_at:.1f} s, stopping it")
+                self.stop_process(process)
+                #   The process has been down since its last heartbeat
+                self.schedule_restart(supervised_process, now, supervised_process.last_heartbeat_at)
+                if supervised_process.stalls_in_a_row >= self.max_stalls_in_a_row:
+                    self.exit_station(
+                        f"{supervised_process.name} stalled {supervised_process.stalls_in_a_row} times in a row, restarting it does not help")
+
+        if len(self.supervised_processes) > 1 and all(
+                supervised_process.is_stalled for supervised_process in self.supervised_processes.values()):
+            self.exit_station('Every process has stalled at the same time')
+
+    def exit_station(self, reason: str) -> None:
+        """
+        This method exits the main process with UNRECOVERABLE_STALL_EXIT_CODE, for systemd to
+        restart the station
+
+        The stall is most likely a shared queue whose lock was left held by a process that was
+        stopped, so the statistics are printed as well as logged, the logging queue may be the
+        one that is locked. The main process exits without the usual clean up, which would wait
+        for the same lock
+        """
+        logger.log(logging.CRITICAL, f"{reason}, exiting for the station to be restarted")
+        print(f"{reason}, exiting for the station to be restarted", file=sys.stderr)
+        for supervised_process in self.supervised_processes.values():
+            logger.log(logging.CRITICAL, f"{supervised_process.name}: {supervised_process.get_statistics()}")
+            print(f"{supervised_process.name}: {supervised_process.get_statistics()}", file=sys.stderr)
+        sys.stderr.flush()
+        os._exit(UNRECOVERABLE_STALL_EXIT_CODE)
+
+    def schedule_restart(self, supervised_process: SupervisedProcess, now: float, failed_at: float = None) -> None:
+        #   A process that stayed up for long enough starts again from the shortest delay
+        if now - supervised_process.started_at >= self.healthy_after:
+            supervised_process.restarts_in_a_row = 0
+        if supervised_process.failed_at is None:
+            supervised_process.failed_at = now if failed_at is None else failed_at
+        restart_delay = self.get_restart_delay(supervised_process.restarts_in_a_row)
+        supervised_process.restart_at = now + restart_delay
+        logger.log(logging.WARNING, f"Restarting {supervised_process.name} in {restart_delay:.1f} s")
+
+    def restart(self, supervised_process: SupervisedProcess) -> None:
+        supervised_process.restart_at = None
+        supervised_process.restarts_in_a_row += 1
+        supervised_process.restarts += 1
+        supervised_process.process.join(timeout=0)
+        try:
+            supervised_process.start()
+        except Exception as err:
+            logger.log(logging.ERROR, f"Could not restart {supervised_process.name}: {err}")
+            self.schedule_restart(supervised_process, time.monotonic())
+            return
+        if supervised_process.on_restart is not None:
+            supervised_process.on_restart()
+
+    def stop_process(self, process, timeout: float = 2.0) -> None:
+        """
+        This method stops a process that is stuck, killing it if it does not exit in time
+
+        A process stopped this way does not release any lock it holds. Every child puts its
+        messages on the shared main queue and its log records on the shared logging queue, and
+        the feeder thread of a queue holds the write lock of the queue while it writes to the
+        pipe. A child that is stopped in the middle of such a write leaves the lock held, and
+        every other process that puts on that queue then blocks for good, which shows up as
+        every child stalling at once, or stalling again straight after it is restarted. check
+        then exits the main process for systemd to restart the station
+        """
+        process.terminate()
+        process.join(timeout=timeout)
+        if process.is_alive() is True:
+            process.kill()
+            process.join(timeout=timeout)
+
+    def stop(self) -> None:
+        """This method is called once the station is shutting down, nothing is restarted after it"""
+        self.is_stopping = True
+        for supervised_process in self.supervised_processes.values():
+            logger.log(logging.INFO, f"{supervised_process.name}: {supervised_process.get_statistics()}")
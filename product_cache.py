@@ -0,0 +1,105 @@
+"""
+This file contains the on-device cache of product details, keyed by GTIN.
+
+Every unit of a product shares its GTIN and its product details (size and so on), so once
+the details of one EPC are known they hold for every other EPC of the same GTIN. The cache
+is kept in an SQLite file so that it survives restarts. Entries expire after a TTL and the
+least recently used entries are evicted once the cache holds more than max_entries.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from os import path
+
+from station_config import load_station_config
+
+logger = logging.getLogger('product_cache')
+
+
+class ProductCache():
+    """
+    This class is used to store the product details returned by the API against their GTIN
+
+    Attributes
+    ----------
+    path: str
+      The SQLite file the cache is kept in
+    ttl_seconds: float
+      How long the details of a GTIN are trusted after they were fetched
+    max_entries: int
+      The number of GTINs kept before the least recently used ones are evicted
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # The connection may be used from worker threads, the lock keeps the access serialised
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS product_details ('
+                'gtin TEXT PRIMARY KEY, details TEXT NOT NULL, fetched_at REAL NOT NULL, last_used_at REAL NOT NULL)'
+            )
+
+    def get_many(self, gtins) -> dict:
+        """
+        This method returns a dict of GTIN to product details for every GTIN that is cached
+        and has not expired
+        """
+        gtins = list(gtins)
+        if len(gtins) == 0:
+            return {}
+        now = time.time()
+        placeholders = ','.join('?' * len(gtins))
+        with self.lock, self.connection:
+            rows = self.connection.execute(
+                f'SELECT gtin, details FROM product_details WHERE gtin IN ({placeholders}) AND fetched_at > ?',
+                (*gtins, now - self.ttl_seconds)
+            ).fetchall()
+            self.connection.execute(
+                f'UPDATE product_details SET last_used_at = ? WHERE gtin IN ({placeholders})',
+                (now, *gtins)
+            )
+        return {gtin: json.loads(details) for gtin, details in rows}
+
+    def put_many(self, product_details_by_gtin: dict) -> None:
+        """This method stores the product details of every GTIN given and evicts old entries"""
+        if len(product_details_by_gtin) == 0:
+            return
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO product_details (gtin, details, fetched_at, last_used_at) VALUES (?, ?, ?, ?)',
+                [(gtin, json.dumps(details), now, now) for gtin, details in product_details_by_gtin.items()]
+            )
+            self.connection.execute('DELETE FROM product_details WHERE fetched_at <= ?', (now - self.ttl_seconds,))
+            self.connection.execute(
+                'DELETE FROM product_details WHERE gtin IN ('
+                'SELECT gtin FROM product_details ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    def clear(self) -> None:
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM product_details')
+
+
+product_cache = None
+
+
+def get_product_cache() -> ProductCache:
+    """This method returns the product cache of this process, opening it on first use"""
+    global product_cache
+    if product_cache is None:
+        product_cache_config = load_station_config()['product_cache']
+        dirname = path.dirname(__file__)
+        product_cache = ProductCache(
+            path.join(dirname, product_cache_config['path']),
+            product_cache_config['ttl_seconds'],
+            product_cache_config['max_entries']
+        )
+    return product_cache
@@ -0,0 +1,117 @@
+"""
+This file contains the helpers the child processes use to sleep until their control queue or
+one of their devices has something for them, instead of checking queue.qsize() in a loop.
+"""
+import collections
+import logging
+import os
+import queue
+import threading
+from multiprocessing import Pipe
+from multiprocessing.connection import wait
+
+logger = logging.getLogger('queue_events')
+
+#   Queue id -> the QueueReader of a queue without a pipe of its own that can be waited on,
+#   for the process that created it
+queue_readers = {}
+queue_readers_pid = None
+
+
+class QueueReader():
+    """
+    This class is used to wait on a queue that does not expose the pipe it reads from
+
+    A thread takes every value off the queue as soon as it is put there, keeps it, and sends a
+    byte through a pipe this class owns, so the pipe becomes readable like the one of a
+    multiprocessing.Queue. The thread stops after the None that tells a process to exit.
+
+    Attributes
+    ----------
+    control_queue: Queue
+      The queue the values are taken from
+    values: deque
+      The values taken off the queue that have not been handed out yet
+    """
+
+    def __init__(self, control_queue):
+        self.control_queue = control_queue
+        self.values = collections.deque()
+        self.read_connection, self.write_connection = Pipe(duplex=False)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def fileno(self) -> int:
+        return self.read_connection.fileno()
+
+    def run(self) -> None:
+        while True:
+            value = self.control_queue.get()
+            #   The value is kept before the pipe is made readable, so it is there once the
+            #   process wakes up
+            self.values.append(value)
+            self.write_connection.send_bytes(b'')
+            if value is None:
+                return
+
+    def get_values(self) -> list:
+        #   The pipe is emptied before the values are taken, a value that comes in between
+        #   leaves the pipe readable so it is handed out on the next wake up
+        while self.read_connection.poll():
+            self.read_connection.recv_bytes()
+        values = []
+        while len(self.values) > 0:
+            values.append(self.values.popleft())
+        return values
+
+
+def get_fallback_queue_reader(control_queue) -> QueueReader:
+    global queue_readers, queue_readers_pid
+    if queue_readers_pid != os.getpid():
+        #   The threads of the parent process are not carried over into a child process
+        queue_readers = {}
+        queue_readers_pid = os.getpid()
+    if id(control_queue) not in queue_readers:
+        logger.log(logging.DEBUG, f"{type(control_queue).__name__} has no pipe to wait on, reading it from a thread")
+        queue_readers[id(control_queue)] = QueueReader(control_queue)
+    return queue_readers[id(control_queue)]
+
+
+def get_queue_reader(control_queue):
+    """
+    This method returns an object that becomes readable as soon as a value has been put on
+    the queue, so it can be waited on with the file descriptors of the devices
+
+    For a multiprocessing.Queue this is the end of the pipe the queue reads from. That pipe
+    is not part of the public API of the queue, so any queue without one is read through a
+    QueueReader instead
+    """
+    reader = getattr(control_queue, '_reader', None)
+    if reader is not None and callable(getattr(reader, 'fileno', None)) and callable(getattr(reader, 'poll', None)):
+        return reader
+    return get_fallback_queue_reader(control_queue)
+
+
+def wait_for_events(control_queue, devices: list = (), timeout: float = None) -> list:
+    """
+    This method blocks until the control queue has a value or one of the devices can be
+    read from, or until timeout seconds have passed. None waits without a time limit
+
+    Returns
+    -------
+    List
+      The devices that can be read from, and the queue reader if the queue has a value
+    """
+    return wait([get_queue_reader(control_queue), *devices], timeout)
+
+
+def get_queued_values(control_queue) -> list:
+    """This method takes every value that is waiting on the queue, without blocking"""
+    if get_queue_reader(control_queue) is not getattr(control_queue, '_reader', None):
+        return get_fallback_queue_reader(control_queue).get_values()
+    values = []
+    while True:
+        try:
+            values.append(control_queue.get_nowait())
+        except queue.Empty:
+            return values
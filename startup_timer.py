@@ -0,0 +1,47 @@
+"""
+This file contains the timer the main process uses to log how long every phase of the startup
+of the station took, from the first import to the first heartbeat of every child process.
+"""
+import logging
+import time
+
+logger = logging.getLogger('startup_timer')
+
+
+class StartupTimer():
+    """
+    This class is used to time the phases of the startup one after the other
+
+    Attributes
+    ----------
+    started_at: float
+      The perf_counter time the startup started at
+    phases: List
+      Tuples of (phase, seconds) in the order the phases ended
+    is_finished: bool
+      True once the startup is over and the timings have been logged
+    """
+
+    def __init__(self, started_at: float = None):
+        self.started_at = time.perf_counter() if started_at is None else started_at
+        self.phase_started_at = self.started_at
+        self.phases = []
+        self.is_finished = False
+
+    def mark(self, phase: str) -> float:
+        """This method ends the phase running since the last mark and returns how long it took"""
+        now = time.perf_counter()
+        seconds = now - self.phase_started_at
+        self.phases.append((phase, seconds))
+        self.phase_started_at = now
+        return seconds
+
+    def get_total_seconds(self) -> float:
+        return self.phase_started_at - self.started_at
+
+    def finish(self, phase: str) -> None:
+        """This method ends the last phase and logs the time every phase took"""
+        self.mark(phase)
+        self.is_finished = True
+        phases = ', '.join(f"{name} {seconds:.3f} s" for name, seconds in self.phases)
+        logger.log(logging.INFO, f"The station started in {self.get_total_seconds():.3f} s: {phases}")
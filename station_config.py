@@ -0,0 +1,127 @@
+"""
+This file is used to load the configuration that differs from one packing station to another.
+
+The values are read from station_config.json in the root of the project. Any key that is not
+present in that file falls back to the value in DEFAULT_STATION_CONFIG.
+"""
+import json
+import logging
+from os import path
+
+DEFAULT_STATION_CONFIG = {
+    # One entry for every RFID reader (antenna) connected to the station
+    'readers': [
+        {'device': '/dev/rfid-reader-1', 'baud_rate': 57600, 'antenna_id': 1},
+        {'device': '/dev/rfid-reader-2', 'baud_rate': 57600, 'antenna_id': 2},
+    ],
+    # The GS1 company prefixes a tag must carry to be accepted
+    'allowed_company_prefixes': [731422, 731430],
+    # Newly read tags are sent to the main process once batch_size of them are waiting,
+    # or once the oldest of them has waited batch_interval seconds. They go through a ring
+    # buffer in shared memory that holds ring_buffer_capacity tags, and the end of a scan waits
+    # up to ring_buffer_full_timeout seconds for the main process to make room in it
+    'tag_stream': {
+        'batch_interval': 0.25,
+        'batch_size': 64,
+        'ring_buffer_capacity': 4096,
+        'ring_buffer_full_timeout': 2.0,
+    },
+    # A scan ends on its own once the rate of newly found tags stays below min_discovery_rate
+    # (tags per second, measured over window_seconds) for plateau_seconds
+    'scan_completion': {
+        'window_seconds': 1.0,
+        'min_discovery_rate': 1.0,
+        'plateau_seconds': 1.5,
+        'min_scan_seconds': 2.0,
+        'max_scan_seconds': 60.0,
+    },
+    # The EPCs are only sent in the compact wire format, gzip compressed, once compact_epc_format
+    # is turned on for a server that understands it. Otherwise they are sent as plain JSON
+    'api': {
+        'compact_epc_format': False,
+    },
+    # The product details of every GTIN are cached in an SQLite file, relative to the project root
+    'product_cache': {
+        'path': 'product_cache.sqlite3',
+        'ttl_seconds': 7 * 24 * 60 * 60,
+        'max_entries': 5000,
+    },
+    # The authentication token is shared by all the processes through this file, relative to
+    # the project root, and refreshed refresh_margin_seconds before it expires
+    'auth_token_cache': {
+        'path': 'auth_token_cache.json',
+        'refresh_margin_seconds': 300,
+    },
+    # The secrets last fetched from Secrets Manager are kept in this file, relative to the project
+    # root and prefixed with the environment, so the station can start without waiting for
+    # them. A snapshot older than ttl_seconds is fetched again in the background, a failed
+    # fetch is retried after retry_interval seconds
+    'secrets_cache': {
+        'path': 'secrets_cache.json',
+        'ttl_seconds': 24 * 60 * 60,
+        'retry_interval': 30.0,
+    },
+    # Cartons are written to this journal, relative to the project root, and uploaded in the
+    # background. A failed upload is retried after retry_initial_delay seconds, doubling up
+    # to retry_max_delay. With batch_uploads turned on, the cartons of a shipment are uploaded
+    # together once batch_size of them are waiting, once the oldest has waited batch_max_age
+    # seconds or once the shipment is closed. Otherwise they are uploaded one at a time
+    'upload_journal': {
+        'path': 'upload_journal.sqlite3',
+        'retry_initial_delay': 2.0,
+        'retry_max_delay': 300.0,
+        'batch_size': 10,
+        'batch_max_age': 30.0,
+        'batch_uploads': False,
+    },
+    # The carton code of every barcode scanned is kept in memory, so that a carton scanned
+    # again does not go to the API
+    'barcode_cache': {
+        'max_entries': 512,
+        'ttl_seconds': 8 * 60 * 60,
+    },
+    # Every child process sends a heartbeat every heartbeat_interval seconds. One that has not
+    # sent one for stall_timeout seconds (or the value for its name in stall_timeouts) is
+    # restarted, as is one that died. Restarts in a row wait restart_initial_delay seconds,
+    # doubling up to restart_max_delay, until the process has stayed up for healthy_after
+    # seconds. A loop that takes longer than slow_loop_warning seconds is logged
+    'supervisor': {
+        'heartbeat_interval': 1.0,
+        'stall_timeout': 15.0,
+        'stall_timeouts': {
+            'upload_sender': 120.0,
+        },
+        'restart_initial_delay': 1.0,
+        'restart_max_delay': 30.0,
+        'healthy_after': 60.0,
+        'slow_loop_warning': 1.0,
+        'max_stalls_in_a_row': 3,
+    },
+}
+
+logger = logging.getLogger('station_config')
+
+
+def get_station_config_file_path() -> str:
+    dirname = path.dirname(__file__)
+    return path.join(dirname, 'station_config.json')
+
+
+def load_station_config() -> dict:
+    """
+    This method is responsible for reading the station configuration file and filling in
+    the defaults for anything it does not mention
+    """
+    station_config = dict(DEFAULT_STATION_CONFIG)
+    filename = get_station_config_file_path()
+    try:
+        with open(filename, 'r') as f:
+            for key, value in json.load(f).items():
+                # Sections like tag_stream only need to mention the values they change
+                if isinstance(value, dict) and isinstance(station_config.get(key), dict):
+                    station_config[key] = {**station_config[key], **value}
+                else:
+                    station_config[key] = value
+    except FileNotFoundError:
+        logger.log(logging.DEBUG, "The station_config.json file was not found. Using the default configuration")
+    return station_config
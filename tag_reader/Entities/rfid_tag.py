@@ -1,7 +1,30 @@
+import struct
+
+from station_config import load_station_config
+
+#   All SGTIN values have an 8-bit header corresponding to 48
+SGTIN_96_HEADER = 48
+
+#   The header takes up bits 0-7 and the company prefix bits 14-33 of the 96 bit EPC
+HEADER_SHIFT = 88
+HEADER_MASK = 0xFF
+COMPANY_PREFIX_SHIFT = 62
+COMPANY_PREFIX_MASK = (1 << 20) - 1
+
+#   Working on the raw bytes, the company prefix sits in bytes 1-4 (bits 8-39) and is
+#   shifted down past the 6 bits that follow it
+COMPANY_PREFIX_BYTES_SHIFT = 6
+
+#   Header byte, the 4 bytes holding the company prefix, then the 7 remaining bytes
+EPC_HEADER_AND_PREFIX_STRUCT = struct.Struct('>BI7x')
+
+
 class RFIDTagEntity():
-    def __init__(self):
-        self.allowed_company_prefixes = [731422, 731430]
-        self.allowed_header = 48
+    def __init__(self, allowed_company_prefixes=None):
+        if allowed_company_prefixes is None:
+            allowed_company_prefixes = load_station_config()['allowed_company_prefixes']
+        self.allowed_company_prefixes = frozenset(allowed_company_prefixes)
+        self.allowed_header = SGTIN_96_HEADER
 
     def convert_tag_from_bytes_to_hex(self, tag_bytes_list) -> str:
         tag_hex_value = ""
@@ -13,20 +36,33 @@ class RFIDTagEntity():
         return tag_hex_value
 
     def is_tag_valid(self, tag_hex_value) -> bool:
-        #   This line converts from hex -> int -> bin, removes the 0b at the beginning and then zfills to get 96 bits
-        binary_tag_value: str = bin(int(tag_hex_value, 16))[2:].zfill(96)
+        tag_value: int = int(tag_hex_value, 16)
+
+        header: int = (tag_value >> HEADER_SHIFT) & HEADER_MASK
+        company_prefix: int = (tag_value >> COMPANY_PREFIX_SHIFT) & COMPANY_PREFIX_MASK
 
-        binary_header: str = binary_tag_value[0:8]
-        binary_company_prefix: str = binary_tag_value[14:34]
+        return header == self.allowed_header and company_prefix in self.allowed_company_prefixes
 
-        header: int = int(binary_header, 2)
-        company_prefix: int = int(binary_company_prefix, 2)
+    def is_epc_valid(self, epc: bytes) -> bool:
+        """This method does the same check as is_tag_valid, straight on the 12 raw EPC bytes"""
+        header, prefix_bytes = EPC_HEADER_AND_PREFIX_STRUCT.unpack(epc)
+        company_prefix: int = (prefix_bytes >> COMPANY_PREFIX_BYTES_SHIFT) & COMPANY_PREFIX_MASK
 
-        #   All SGTIN values have an 8-bit header corresponding to 48
-        if header != self.allowed_header:
-            return False
+        return header == self.allowed_header and company_prefix in self.allowed_company_prefixes
 
-        if company_prefix not in self.allowed_company_prefixes:
-            return False
+    def validate_packed_epcs(self, packed_epcs: bytes) -> list:
+        """
+        This method validates a whole buffer of EPCs at once, where the raw 12 byte EPCs
+        have been packed back to back, and returns a list with one bool per EPC
+        """
+        allowed_header = self.allowed_header
+        allowed_company_prefixes = self.allowed_company_prefixes
+        return [
+            header == allowed_header
+            and (prefix_bytes >> COMPANY_PREFIX_BYTES_SHIFT) & COMPANY_PREFIX_MASK in allowed_company_prefixes
+            for header, prefix_bytes in EPC_HEADER_AND_PREFIX_STRUCT.iter_unpack(packed_epcs)
+        ]
 
-        return True
\ No newline at end of file
+    def validate_epcs(self, epcs) -> list:
+        """This method validates a list of raw 12 byte EPCs at once"""
+        return self.validate_packed_epcs(b''.join(epcs))
@@ -0,0 +1,33 @@
+"""
+This file contains the helpers used to carry EPCs around in their compact binary form.
+
+Inside the station every EPC is kept as its raw 12 bytes, and a group of EPCs travels
+between processes packed back to back in a single bytes object. EPCs are only turned
+into 24 character hex strings at the API boundary.
+"""
+
+#   An SGTIN-96 EPC is 96 bits long
+EPC_LENGTH = 12
+
+
+def pack_epcs(epcs) -> bytes:
+    """Packs an iterable of raw 12 byte EPCs back to back into one bytes object"""
+    return b''.join(epcs)
+
+
+def unpack_epcs(packed_epcs: bytes) -> list:
+    """Splits a buffer built by pack_epcs back into a list of raw 12 byte EPCs"""
+    return [packed_epcs[index:index + EPC_LENGTH] for index in range(0, len(packed_epcs), EPC_LENGTH)]
+
+
+def epc_to_hex(epc: bytes) -> str:
+    return epc.hex().upper()
+
+
+def epcs_to_hex(epcs) -> list:
+    """Converts raw EPCs to the upper case hex strings the API expects"""
+    return [epc.hex().upper() for epc in epcs]
+
+
+def hex_to_epc(tag_hex_value: str) -> bytes:
+    return bytes.fromhex(tag_hex_value)
@@ -0,0 +1,103 @@
+"""
+This file contains the compact wire format used to send large lists of EPCs to the API.
+
+SGTIN-96 EPCs of the same product only differ in their 38 bit serial, so they are grouped
+by the 58 bits in front of the serial (header, filter, partition, company prefix and item
+reference) and only the serials are sent. The serials of a group are sorted and sent as
+ranges of consecutive serials, each range as a pair of numbers: the gap from the end of the
+previous range (from 0 for the first range) and the length of the range.
+
+    {
+        "encoding": "sgtin-96-ranges",
+        "groups": [
+            {"gtin": "80614141123458", "prefix": "C1D095EFDC6539", "serials": [6789, 3, 10, 1]}
+        ],
+        "other": ["E28011606000020A1B2C3D4E"]
+    }
+
+The group above holds the serials 6789, 6790, 6791 and 6802. EPCs that are not SGTIN-96 are
+sent as hex strings under "other". Decoding gives the EPCs back in a canonical order (groups
+in the order sent, serials ascending, then the other EPCs in the order sent), so a request that is answered
+with one result per EPC is matched up in that order.
+"""
+from bisect import bisect_left
+
+from tag_reader.sgtin import SGTIN_96_HEADER, decode_item, PARTITION_SHIFT, PARTITION_MASK, \
+    COMPANY_PREFIX_AND_ITEM_REFERENCE_MASK
+
+COMPACT_EPC_ENCODING = 'sgtin-96-ranges'
+
+#   The status a server that does not understand the compact format (or a compressed body)
+#   responds with, the EPCs are then sent as a plain list of hex strings instead
+UNSUPPORTED_FORMAT_STATUS_CODE = 415
+
+SERIAL_BITS = 38
+SERIAL_MASK = (1 << SERIAL_BITS) - 1
+
+
+def encode_epcs(epcs) -> dict:
+    """
+    This method encodes EPCs, given as raw bytes or hex strings, into the compact wire format.
+    Duplicate EPCs are only sent once
+
+    The EPCs are turned into ints and sorted, after which the serials of one product are next
+    to each other and a range of consecutive serials is a run of consecutive ints. Only the
+    start of every range is looked at in Python, which keeps tags encoded in rolls cheap.
+    """
+    values = sorted({int(epc, 16) if isinstance(epc, str) else int.from_bytes(epc, 'big') for epc in epcs})
+    #   Sorted by value, the SGTIN-96 EPCs are the ones between these two bounds
+    sgtin_start = bisect_left(values, SGTIN_96_HEADER << 88)
+    sgtin_end = bisect_left(values, (SGTIN_96_HEADER + 1) << 88)
+    sgtin_values = values[sgtin_start:sgtin_end]
+    other_values = values[:sgtin_start] + values[sgtin_end:]
+
+    #   A range also ends where the serial rolls over into the next prefix
+    range_starts = [
+        index for index in range(1, len(sgtin_values))
+        if sgtin_values[index] != sgtin_values[index - 1] + 1 or sgtin_values[index] & SERIAL_MASK == 0
+    ]
+
+    serial_ranges_by_prefix = {}
+    previous_end_by_prefix = {}
+    for range_start, range_end in zip([0] + range_starts, range_starts + [len(sgtin_values)]):
+        prefix = sgtin_values[range_start] >> SERIAL_BITS
+        first_serial = sgtin_values[range_start] & SERIAL_MASK
+        range_length = range_end - range_start
+        serial_ranges_by_prefix.setdefault(prefix, []).extend(
+            (first_serial - previous_end_by_prefix.get(prefix, -1) - 1, range_length))
+        previous_end_by_prefix[prefix] = first_serial + range_length - 1
+
+    groups = []
+    for prefix, serial_ranges in serial_ranges_by_prefix.items():
+        partition = (prefix >> (PARTITION_SHIFT - SERIAL_BITS)) & PARTITION_MASK
+        item = decode_item(partition, prefix & COMPANY_PREFIX_AND_ITEM_REFERENCE_MASK)
+        groups.append({
+            'gtin': item[2] if item is not None else None,
+            'prefix': format(prefix, 'X'),
+            'serials': serial_ranges
+        })
+    return {
+        'encoding': COMPACT_EPC_ENCODING,
+        'groups': groups,
+        'other': [format(value, '024X') for value in other_values]
+    }
+
+
+def decode_serial_ranges(serial_ranges: list) -> list:
+    serials = []
+    previous_end = -1
+    for index in range(0, len(serial_ranges), 2):
+        range_start = previous_end + 1 + serial_ranges[index]
+        previous_end = range_start + serial_ranges[index + 1] - 1
+        serials.extend(range(range_start, previous_end + 1))
+    return serials
+
+
+def decode_epcs(encoded_epcs: dict) -> list:
+    """This method turns the compact wire format back into raw EPCs, in the canonical order"""
+    epcs = []
+    for group in encoded_epcs['groups']:
+        prefix = int(group['prefix'], 16) << SERIAL_BITS
+        epcs.extend((prefix | serial).to_bytes(12, 'big') for serial in decode_serial_ranges(group['serials']))
+    epcs.extend(bytes.fromhex(epc) for epc in encoded_epcs['other'])
+    return epcs
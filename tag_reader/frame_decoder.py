@@ -0,0 +1,64 @@
+#   The starting byte of any tag frame is 0x11 (which is 17)
+FRAME_START_BYTE = 0x11
+
+#   One RFID tag frame has a sequence of 18 bytes
+FRAME_LENGTH = 18
+
+#   First 4 bytes and last 2 bytes of a frame are placeholders, the EPC sits in between
+EPC_START_INDEX = 4
+EPC_END_INDEX = 16
+
+
+class FrameDecoder():
+    """
+    This class is used to cut complete RFID tag frames out of the raw byte stream
+    coming from a reader
+
+    Bytes are appended to a single reusable buffer. Every call to feed scans the buffer
+    for the start byte and slices out every complete frame found, keeping any trailing
+    partial frame for the next call.
+
+    Attributes
+    ----------
+    buffer: bytearray
+      Holds the bytes that have been received but not yet consumed as part of a frame
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def reset(self) -> None:
+        """This method is called to discard any partially received frame"""
+        self.buffer.clear()
+
+    def feed(self, data: bytes) -> list:
+        """
+        This method is called with a chunk of bytes read from the reader and returns
+        the list of complete frames (as bytes) found so far
+
+        Parameters
+        ----------
+        data: bytes
+          The raw bytes read from the serial device
+        """
+        buffer = self.buffer
+        buffer += data
+        buffer_length = len(buffer)
+        frames = []
+        position = 0
+        with memoryview(buffer) as view:
+            while True:
+                start = buffer.find(FRAME_START_BYTE, position)
+                if start == -1:
+                    #   No start byte left, everything in the buffer is noise
+                    position = buffer_length
+                    break
+                if buffer_length - start < FRAME_LENGTH:
+                    #   Keep the partial frame around until the rest of it arrives
+                    position = start
+                    break
+                position = start + FRAME_LENGTH
+                frames.append(bytes(view[start:position]))
+
+        del buffer[:position]
+        return frames
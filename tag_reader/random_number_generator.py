@@ -1,57 +1,121 @@
 from multiprocessing import Process, Queue
 import logging
+import queue
 import time
-from random import randint, choice
+from random import randint, choice, getrandbits
 from string import ascii_uppercase
 
 from tag_reader.tag_reader_enums import TagReaderEnums
-from carton.carton_type import CartonType
+from tag_reader.tag_ring_buffer import TagRingBuffer, get_antenna_mask
+from message_bus.messages import send_message, TagsAvailableMessage, DoneReadingTagsMessage
+from process_supervisor import Heartbeat
+from station_config import load_station_config
 
 
 class RandomNumberGenerator(Process):
-    def __init__(self, queue: Queue, main_queue: Queue):
+    def __init__(self, queue: Queue, main_queue: Queue, tag_ring_buffer: TagRingBuffer):
         Process.__init__(self)
         self.queue = queue
         self.main_queue = main_queue
+        self.tag_ring_buffer = tag_ring_buffer
+        self.scan_id = 0
         self.random_numbers_list: list = []
-        self.return_string: str = ""
+        # The tags of the scan that did not fit in the tag ring buffer yet, and the ones written to it
+        self.unsent_numbers_list: list = []
+        self.reported_numbers_list: list = []
+        self.read_time = None
         self.logger = logging.getLogger('random_number_generator')
+        # The longest time the end of a scan waits for the main process to make room in the tag ring buffer
+        self.ring_buffer_full_timeout = load_station_config()['tag_stream']['ring_buffer_full_timeout']
+        self.heartbeat = Heartbeat(main_queue)
+
+    def send_new_tags_to_main_process(self):
+        """
+        This method writes the tags of the scan to the tag ring buffer and lets the main process
+        know they are there. The tags that do not fit are kept and written on a later loop, once
+        the main process has caught up
+        """
+        number_of_records_written = self.tag_ring_buffer.write([
+            (random_number, self.scan_id, get_antenna_mask((1,)), self.read_time)
+            for random_number in self.unsent_numbers_list
+        ])
+        if number_of_records_written > 0:
+            send_message(self.main_queue, TagsAvailableMessage(self.tag_ring_buffer.write_index))
+        if number_of_records_written < len(self.unsent_numbers_list):
+            self.logger.log(
+                logging.DEBUG,
+                f"The tag ring buffer is full, {len(self.unsent_numbers_list) - number_of_records_written} tags will be sent later")
+        self.reported_numbers_list.extend(self.unsent_numbers_list[:number_of_records_written])
+        del self.unsent_numbers_list[:number_of_records_written]
+
+    def end_scan(self):
+        """This method is called to send any tags still waiting and then the summary of the scan"""
+        give_up_at = time.time() + self.ring_buffer_full_timeout
+        while len(self.unsent_numbers_list) > 0:
+            self.send_new_tags_to_main_process()
+            if len(self.unsent_numbers_list) == 0:
+                break
+            if time.time() >= give_up_at:
+                self.logger.log(
+                    logging.ERROR, f"The main process did not make room for the last {len(self.unsent_numbers_list)} tags of the scan")
+                self.unsent_numbers_list.clear()
+                break
+            # The main process frees the space as it reads the batches that were already written
+            time.sleep(0.01)
+        self.logger.log(
+            logging.DEBUG, f"Returning the summary of {len(self.reported_numbers_list)} tags to main queue")
+        # Only the tags written to the tag ring buffer are counted, the main process received every one of them
+        send_message(self.main_queue, DoneReadingTagsMessage(
+            self.scan_id, len(self.reported_numbers_list), self.tag_ring_buffer.write_index))
 
     def run(self):
+        next_tag_at = time.time()
+        loop_started_at = None
         while True:
-            random_number: float = self.generate_random_epc_tag()
-            self.random_numbers_list.append(random_number)
-            if self.queue.qsize() > 0:
-                queue_value: Union[str, None] = self.queue.get()
+            if time.time() >= next_tag_at:
+                random_number: bytes = self.generate_random_epc_tag()
+                self.random_numbers_list.append(random_number)
+                next_tag_at += 1
+            if len(self.unsent_numbers_list) > 0:
+                self.send_new_tags_to_main_process()
+            self.heartbeat.beat(loop_started_at)
+            loop_started_at = None
+            wait_timeout = max(next_tag_at - time.time(), 0)
+            if len(self.unsent_numbers_list) > 0:
+                # The main process frees the space in the tag ring buffer as it reads
+                wait_timeout = min(wait_timeout, 0.01)
+            try:
+                # Sleep until a command arrives, the next tag is due or the next heartbeat is due
+                queue_value: Union[str, None] = self.queue.get(
+                    timeout=self.heartbeat.get_timeout(wait_timeout))
+            except queue.Empty:
+                continue
+            loop_started_at = time.monotonic()
+            self.logger.log(
+                logging.DEBUG, f"Received {queue_value} from queue")
+
+            if queue_value is None:
+                break
+
+            if isinstance(queue_value, dict) and queue_value['type'] == TagReaderEnums.START_READING_TAGS.value:
                 self.logger.log(
-                    logging.DEBUG, f"Received {queue_value} from queue")
-
-                if queue_value is None:
-                    break
-
-                if queue_value == TagReaderEnums.START_READING_TAGS.value:
-                    self.return_string = str(len(self.random_numbers_list)) + " "
-                    for random_number in self.random_numbers_list:
-                        self.return_string += str(random_number) + " "
-                    self.logger.log(
-                        logging.DEBUG, f"Returning {self.return_string} to main queue")
-                    self.main_queue.put({
-                        'type': TagReaderEnums.DONE_READING_TAGS.value,
-                        'data': {
-                            'tags': self.return_string,
-                            'carton_type': CartonType.SOLID.value
-                        }
-                    })
-                    self.return_string = ""
-                    self.random_numbers_list = []
-
-            time.sleep(1)
+                    logging.DEBUG, f"Returning {len(self.random_numbers_list)} new tags to main queue")
+                self.scan_id = queue_value['data']['scan_id']
+                self.read_time = time.time()
+                self.reported_numbers_list = []
+                self.unsent_numbers_list = self.random_numbers_list
+                self.random_numbers_list = []
+                self.send_new_tags_to_main_process()
+
+            if queue_value == TagReaderEnums.STOP_READING_TAGS.value:
+                self.end_scan()
 
     def generate_random_value(self):
         return ''.join(["{}".format(randint(0, 9)) for num in range(0, 24)])
 
-    def generate_random_epc_tag(self) -> str:
-        random_epc_code = '303ACA4782' + self.generate_random_character() + str(randint(10**(13-1), (10**13)-1))
+    def generate_random_epc_tag(self) -> bytes:
+        #   Keep the SGTIN-96 header and company prefix, randomise the rest of the raw EPC
+        random_epc_code = bytes.fromhex('303ACA4782') + getrandbits(56).to_bytes(7, 'big')
         return random_epc_code
 
     def generate_random_character(self) -> str:
@@ -0,0 +1,170 @@
+import logging
+import selectors
+import time
+import serial
+
+from tag_reader.frame_decoder import FrameDecoder
+from tag_reader.tag_ring_buffer import ANTENNA_MASK_BITS
+
+
+class RFIDReader():
+    """
+    This class is used to hold a single RFID reader (antenna) connected via USB
+
+    Attributes
+    ----------
+    device: str
+      The path of the serial device, for example /dev/rfid-reader-1
+    baud_rate: int
+      The baud rate the reader talks at
+    antenna_id: int
+      The identifier reported along with every tag this reader sees
+    serial_device: Object
+      The opened serial port, None until open is called
+    frame_decoder: FrameDecoder
+      Cuts the frames out of the bytes read from this reader
+    """
+
+    def __init__(self, device: str, baud_rate: int, antenna_id: int):
+        self.device = device
+        self.baud_rate = baud_rate
+        self.antenna_id = antenna_id
+        self.serial_device = None
+        self.frame_decoder = FrameDecoder()
+
+    def open(self) -> None:
+        # The port is non-blocking, the pool's selector decides when there is data to read
+        self.serial_device = serial.Serial(self.device, self.baud_rate, timeout=0)
+
+    def reset(self) -> None:
+        """This method is called to throw away any bytes read before a new scan"""
+        self.frame_decoder.reset()
+        self.serial_device.reset_input_buffer()
+
+    def read_frames(self, capture_writer=None) -> list:
+        """
+        This method is called to read everything that is currently waiting on the port in
+        one call and decode it into frames
+
+        Parameters
+        ----------
+        capture_writer: CaptureWriter, optional
+          When given, the raw bytes read are also recorded to a capture file
+        """
+        data = self.serial_device.read(self.serial_device.in_waiting or 1)
+        if not data:
+            return []
+        if capture_writer is not None:
+            capture_writer.write(self.antenna_id, time.time(), data)
+        return self.frame_decoder.feed(data)
+
+    def close(self) -> None:
+        self.serial_device.flush()
+        self.serial_device.reset_input_buffer()
+        self.serial_device.close()
+
+
+class ReaderPool():
+    """
+    This class is used to service any number of RFID readers together
+
+    Every reader is registered with one selector, so whichever reader has data is drained
+    as soon as it arrives and an idle reader never holds up a busy one.
+
+    Attributes
+    ----------
+    readers: List
+      The RFIDReader objects that belong to this pool
+    selector: selectors.BaseSelector
+      Waits on all of the reader ports at once
+    capture_writer: CaptureWriter
+      Records the raw bytes read from every port when a capture has been started, otherwise None
+    """
+
+    def __init__(self, readers: list):
+        self.readers = readers
+        self.selector = None
+        self.capture_writer = None
+        self.logger = logging.getLogger('reader_pool')
+
+    @staticmethod
+    def from_config(reader_configs: list):
+        """
+        This method is called to build the pool from the 'readers' entries of the station config
+
+        Parameters
+        ----------
+        reader_configs: list
+          A list of dicts, each with a device, baud_rate and antenna_id key
+
+        Raises
+        ------
+        ValueError
+          If an antenna_id is not an int from 0 to 63, the antennas that have seen a tag are
+          sent to the main process as a 64 bit mask
+        """
+        for reader_config in reader_configs:
+            antenna_id = reader_config['antenna_id']
+            if not isinstance(antenna_id, int) or not 0 <= antenna_id < ANTENNA_MASK_BITS:
+                raise ValueError(
+                    f"The antenna_id of {reader_config['device']} is {antenna_id!r}, it must be an int from 0 to {ANTENNA_MASK_BITS - 1}")
+        readers = [
+            RFIDReader(reader_config['device'], reader_config['baud_rate'], reader_config['antenna_id'])
+            for reader_config in reader_configs
+        ]
+        return ReaderPool(readers)
+
+    def open(self) -> None:
+        """
+        This method is called to open every reader port and register it with the selector
+
+        Raises
+        ------
+        serial.serialutil.SerialException
+          If one of the USB devices is not connected properly and cannot be read from
+        """
+        self.selector = selectors.DefaultSelector()
+        for reader in self.readers:
+            self.logger.log(
+                logging.DEBUG, f"Opening {reader.device} at {reader.baud_rate} baud for antenna {reader.antenna_id}")
+            reader.open()
+            self.selector.register(reader.serial_device, selectors.EVENT_READ, reader)
+
+    def watch(self, file_object) -> None:
+        """
+        This method registers another file object with the selector, such as the pipe of the
+        control queue, so that read_frames returns as soon as it can be read
+        """
+        self.selector.register(file_object, selectors.EVENT_READ, None)
+
+    def reset(self) -> None:
+        for reader in self.readers:
+            reader.reset()
+
+    def read_frames(self, timeout: float) -> list:
+        """
+        This method waits up to timeout seconds for any reader to have data and returns
+        every complete frame read as a list of (antenna_id, frame) tuples. None waits until
+        a reader or a watched file object has data
+        """
+        frames = []
+        for selector_key, _ in self.selector.select(timeout=timeout):
+            reader = selector_key.data
+            if reader is None:
+                #   A watched file object, it is read by whoever registered it
+                continue
+            for tag_frame in reader.read_frames(self.capture_writer):
+                frames.append((reader.antenna_id, tag_frame))
+        return frames
+
+    def start_capture(self, capture_writer) -> None:
+        """This method is called to record every byte read from now on to a capture file"""
+        self.capture_writer = capture_writer
+
+    def close(self) -> None:
+        self.selector.close()
+        for reader in self.readers:
+            reader.close()
+        if self.capture_writer is not None:
+            self.capture_writer.close()
+            self.capture_writer = None
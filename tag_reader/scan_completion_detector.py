@@ -0,0 +1,94 @@
+from collections import deque
+
+from tag_reader.tag_reader_enums import ScanCompletionEnums
+
+
+class ScanCompletionDetector():
+    """
+    This class is used to decide when a scan has found every tag it is going to find
+
+    Tags are discovered quickly when a carton enters the tunnel and the rate of new unique
+    EPCs then falls away. The scan is declared complete when that rate stays below
+    min_discovery_rate for plateau_seconds, or straight away once the expected number of
+    tags for the carton has been read.
+
+    Attributes
+    ----------
+    window_seconds: float
+      The length of the sliding window over which the discovery rate is measured
+    min_discovery_rate: float
+      The rate of new tags per second below which discovery is considered to have stopped
+    plateau_seconds: float
+      How long the rate has to stay below min_discovery_rate before the scan is complete
+    min_scan_seconds: float
+      The scan is never declared complete on a plateau before this much time has passed
+    max_scan_seconds: float
+      The scan is declared complete after this much time no matter what, None to never time out
+    expected_tag_count: int
+      The number of tags the carton should hold, None when it is not known
+    """
+
+    def __init__(self, window_seconds: float, min_discovery_rate: float, plateau_seconds: float,
+                 min_scan_seconds: float, max_scan_seconds: float = None):
+        self.window_seconds = window_seconds
+        self.min_discovery_rate = min_discovery_rate
+        self.plateau_seconds = plateau_seconds
+        self.min_scan_seconds = min_scan_seconds
+        self.max_scan_seconds = max_scan_seconds
+        self.expected_tag_count = None
+        self.discovery_times = deque()
+        self.scan_started_at = None
+        self.plateau_started_at = None
+
+    @staticmethod
+    def from_config(scan_completion_config: dict):
+        return ScanCompletionDetector(
+            scan_completion_config['window_seconds'],
+            scan_completion_config['min_discovery_rate'],
+            scan_completion_config['plateau_seconds'],
+            scan_completion_config['min_scan_seconds'],
+            scan_completion_config.get('max_scan_seconds')
+        )
+
+    def start(self, now: float) -> None:
+        """This method is called when a scan starts, the expected tag count is kept"""
+        self.discovery_times.clear()
+        self.scan_started_at = now
+        self.plateau_started_at = None
+
+    def record_new_tags(self, number_of_new_tags: int, now: float) -> None:
+        """This method is called with the number of new unique tags found at a given time"""
+        if number_of_new_tags > 0:
+            self.discovery_times.append((now, number_of_new_tags))
+
+    def get_discovery_rate(self, now: float) -> float:
+        """This method returns the number of new tags per second seen over the last window"""
+        discovery_times = self.discovery_times
+        while len(discovery_times) > 0 and now - discovery_times[0][0] > self.window_seconds:
+            discovery_times.popleft()
+        return sum(number_of_new_tags for _, number_of_new_tags in discovery_times) / self.window_seconds
+
+    def check(self, unique_tag_count: int, now: float):
+        """
+        This method is called regularly during a scan and returns the reason the scan is
+        complete, or None if it should keep going
+        """
+        if self.expected_tag_count is not None and unique_tag_count >= self.expected_tag_count:
+            return ScanCompletionEnums.EXPECTED_COUNT_REACHED.value
+
+        scan_duration = now - self.scan_started_at
+        if self.max_scan_seconds is not None and scan_duration >= self.max_scan_seconds:
+            return ScanCompletionEnums.MAXIMUM_SCAN_TIME.value
+
+        #   A plateau only means something once tags have been found
+        if unique_tag_count == 0 or self.get_discovery_rate(now) >= self.min_discovery_rate:
+            self.plateau_started_at = None
+            return None
+
+        if self.plateau_started_at is None:
+            self.plateau_started_at = now
+
+        if scan_duration >= self.min_scan_seconds and now - self.plateau_started_at >= self.plateau_seconds:
+            return ScanCompletionEnums.DISCOVERY_PLATEAUED.value
+
+        return None
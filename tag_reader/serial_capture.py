@@ -0,0 +1,54 @@
+"""
+This file contains the reader and writer for RFID serial capture files.
+
+A capture file holds the raw bytes read from every reader port, along with the time they
+were read and the antenna they came from, so that a scan can be replayed later without
+any hardware (see tag_reader/serial_replay.py).
+
+File layout: an 8 byte magic string, followed by one record per read. Each record is a
+little endian header of (timestamp as float64, antenna ID as uint16, length as uint16)
+followed by the bytes that were read.
+"""
+import struct
+
+CAPTURE_FILE_MAGIC = b'RFIDCAP1'
+CAPTURE_RECORD_HEADER = struct.Struct('<dHH')
+
+
+class CaptureWriter():
+    """
+    This class is used to append the bytes read from the reader ports to a capture file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.capture_file = open(path, 'wb')
+        self.capture_file.write(CAPTURE_FILE_MAGIC)
+
+    def write(self, antenna_id: int, timestamp: float, data: bytes) -> None:
+        self.capture_file.write(CAPTURE_RECORD_HEADER.pack(timestamp, antenna_id, len(data)))
+        self.capture_file.write(data)
+
+    def close(self) -> None:
+        self.capture_file.close()
+
+
+def read_capture(path: str):
+    """
+    This method is a generator that yields every (timestamp, antenna_id, data) record held
+    in a capture file, in the order they were written
+
+    Raises
+    ------
+    ValueError
+      If the file is not a capture file
+    """
+    with open(path, 'rb') as capture_file:
+        if capture_file.read(len(CAPTURE_FILE_MAGIC)) != CAPTURE_FILE_MAGIC:
+            raise ValueError(f"{path} is not an RFID capture file")
+        while True:
+            record_header = capture_file.read(CAPTURE_RECORD_HEADER.size)
+            if len(record_header) < CAPTURE_RECORD_HEADER.size:
+                return
+            timestamp, antenna_id, length = CAPTURE_RECORD_HEADER.unpack(record_header)
+            yield timestamp, antenna_id, capture_file.read(length)
@@ -0,0 +1,171 @@
+"""
+This file is used to replay an RFID capture file into the TagReader without any hardware.
+
+Every antenna in the capture gets its own pseudo-terminal. The TagReader process is pointed
+at those pseudo-terminals instead of /dev/rfid-reader-*, a scan is started and the recorded
+bytes are written back at the speed they were captured at (or faster).
+
+Record a capture on a station with:
+    python3 ./RFID_Upload_V0.2.py --env production --capture scan.rfidcap
+
+Replay it on any Linux machine with:
+    python3 -m tag_reader.serial_replay scan.rfidcap --speed 10
+"""
+import argparse
+import logging
+import os
+import queue
+import sys
+import time
+import tty
+from multiprocessing import Queue
+
+from tag_reader.serial_capture import read_capture
+from tag_reader.tag_reader import TagReader
+from tag_reader.tag_reader_enums import TagReaderEnums
+from tag_reader.tag_ring_buffer import TagRingBuffer
+from message_bus.messages import decode_message, TagsAvailableMessage, DoneReadingTagsMessage, ScanCompleteMessage
+
+
+def open_pseudo_terminals(antenna_ids: list) -> dict:
+    """
+    This method opens one raw pseudo-terminal for every antenna and returns a dict of
+    antenna ID to (master file descriptor, slave file descriptor, slave device path)
+    """
+    pseudo_terminals = {}
+    for antenna_id in antenna_ids:
+        master_fd, slave_fd = os.openpty()
+        #   Raw mode so that the bytes are passed through untouched
+        tty.setraw(slave_fd)
+        pseudo_terminals[antenna_id] = (master_fd, slave_fd, os.ttyname(slave_fd))
+    return pseudo_terminals
+
+
+def close_pseudo_terminals(pseudo_terminals: dict) -> None:
+    for master_fd, slave_fd, _ in pseudo_terminals.values():
+        os.close(master_fd)
+        os.close(slave_fd)
+
+
+def replay_capture(capture_path: str, speed: float, baud_rate: int = 57600, startup_delay: float = 1.0,
+                   summary_timeout: float = 10.0) -> dict:
+    """
+    This method replays a capture file through a TagReader process and returns the
+    statistics of the scan
+
+    Parameters
+    ----------
+    capture_path: str
+      The capture file written by the TagReader in capture mode
+    speed: float
+      How many times faster than real time to replay, 0 to replay as fast as possible
+    baud_rate: int
+      The baud rate given to the TagReader for every pseudo-terminal
+    startup_delay: float
+      The time given to the TagReader process to open its ports before the replay starts
+    summary_timeout: float
+      How long to wait for the summary of the scan once every byte has been written
+    """
+    records = list(read_capture(capture_path))
+    if len(records) == 0:
+        raise ValueError(f"{capture_path} does not hold any reads")
+
+    antenna_ids = sorted({antenna_id for _, antenna_id, _ in records})
+    pseudo_terminals = open_pseudo_terminals(antenna_ids)
+    reader_configs = [
+        {'device': device, 'baud_rate': baud_rate, 'antenna_id': antenna_id}
+        for antenna_id, (_, _, device) in pseudo_terminals.items()
+    ]
+
+    read_tags_queue = Queue()
+    main_queue = Queue()
+    tag_ring_buffer = TagRingBuffer()
+    tag_reader_process = TagReader(read_tags_queue, main_queue, tag_ring_buffer, reader_configs)
+    tag_reader_process.start()
+    read_tags_queue.put({'type': TagReaderEnums.START_READING_TAGS.value, 'data': {'scan_id': 1}})
+    time.sleep(startup_delay)
+
+    statistics = {
+        'records': len(records),
+        'bytes': sum(len(data) for _, _, data in records),
+        'new_tag_batches': 0,
+        'first_tag_after': None,
+        'scan_complete': None,
+        'tags': None,
+    }
+
+    try:
+        first_timestamp = records[0][0]
+        replay_started_at = time.perf_counter()
+        replay_started_at_wall_time = time.time()
+        for timestamp, antenna_id, data in records:
+            if speed > 0:
+                delay = (timestamp - first_timestamp) / speed - (time.perf_counter() - replay_started_at)
+                if delay > 0:
+                    time.sleep(delay)
+            os.write(pseudo_terminals[antenna_id][0], data)
+        statistics['replay_duration'] = time.perf_counter() - replay_started_at
+
+        #   Drain the pseudo-terminals before asking for the summary of the scan
+        time.sleep(0.5)
+        read_tags_queue.put(TagReaderEnums.STOP_READING_TAGS.value)
+        #   A scan that completed on its own sends a summary of its own ahead of the one asked for
+        number_of_summaries = 0
+        while True:
+            message = decode_message(main_queue.get(timeout=summary_timeout))
+            if isinstance(message, TagsAvailableMessage):
+                statistics['new_tag_batches'] += 1
+                #   The tags are read so the TagReader always has room for the next batch
+                tag_ring_buffer.read(message.write_index)
+                if statistics['first_tag_after'] is None:
+                    statistics['first_tag_after'] = time.time() - replay_started_at_wall_time
+            elif isinstance(message, ScanCompleteMessage):
+                statistics['scan_complete'] = {
+                    'reason': message.reason,
+                    'tags': message.tags,
+                    'duration': message.duration
+                }
+            elif isinstance(message, DoneReadingTagsMessage):
+                statistics['tags'] = message.tag_count
+                number_of_summaries += 1
+                if number_of_summaries == (1 if statistics['scan_complete'] is None else 2):
+                    break
+    except queue.Empty:
+        logging.getLogger('serial_replay').log(logging.ERROR, "The TagReader did not send the summary of the scan")
+    finally:
+        read_tags_queue.put(None)
+        tag_reader_process.join()
+        close_pseudo_terminals(pseudo_terminals)
+        tag_ring_buffer.close()
+
+    return statistics
+
+
+def run_replay():
+    parser = argparse.ArgumentParser(description='Replay an RFID capture file through the TagReader')
+    parser.add_argument('capture_path', type=str)
+    parser.add_argument('--speed', action='store', type=float, dest='speed', default=1.0,
+                        help='How many times faster than real time to replay, 0 for as fast as possible')
+    parser.add_argument('--expected-tags', action='store', type=int, dest='expected_tags',
+                        help='Exit with an error if the scan does not find exactly this many tags')
+    arguments = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    statistics = replay_capture(arguments.capture_path, arguments.speed)
+
+    print(f"Replayed {statistics['records']} reads ({statistics['bytes']} bytes) "
+          f"in {statistics.get('replay_duration', 0):.2f} s at {arguments.speed}x")
+    print(f"Unique tags: {statistics['tags']} in {statistics['new_tag_batches']} batches")
+    if statistics['first_tag_after'] is not None:
+        print(f"First tags reached the main queue {statistics['first_tag_after']:.3f} s after the replay started")
+    if statistics['scan_complete'] is not None:
+        print(f"Scan completed on its own after {statistics['scan_complete']['duration']:.2f} s: "
+              f"{statistics['scan_complete']['reason']}")
+
+    if arguments.expected_tags is not None and statistics['tags'] != arguments.expected_tags:
+        print(f"Expected {arguments.expected_tags} tags but found {statistics['tags']}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run_replay()
@@ -0,0 +1,190 @@
+"""
+This file contains the decoder for SGTIN-96 EPCs.
+
+An SGTIN-96 EPC is laid out as follows, from the most significant bit:
+    header (8 bits) | filter (3 bits) | partition (3 bits) | company prefix + item reference (44 bits) | serial (38 bits)
+
+The partition value decides how the 44 bits are split between the company prefix and the
+item reference, and how many decimal digits each of them has. The shifts and masks for every
+partition value are worked out once when this module is loaded.
+"""
+import struct
+from functools import lru_cache
+
+#   All SGTIN-96 values have an 8-bit header corresponding to 48
+SGTIN_96_HEADER = 48
+
+FILTER_SHIFT = 85
+FILTER_MASK = 0x7
+PARTITION_SHIFT = 82
+PARTITION_MASK = 0x7
+COMPANY_PREFIX_AND_ITEM_REFERENCE_SHIFT = 38
+COMPANY_PREFIX_AND_ITEM_REFERENCE_MASK = (1 << 44) - 1
+SERIAL_MASK = (1 << 38) - 1
+
+#   (company prefix bits, company prefix digits, item reference bits, item reference digits)
+#   for every partition value, as given by the GS1 EPC Tag Data Standard
+SGTIN_PARTITIONS = (
+    (40, 12, 4, 1),
+    (37, 11, 7, 2),
+    (34, 10, 10, 3),
+    (30, 9, 14, 4),
+    (27, 8, 17, 5),
+    (24, 7, 20, 6),
+    (20, 6, 24, 7),
+)
+
+#   An EPC is unpacked as one 32 bit and one 64 bit integer, which is quicker than going
+#   through a 96 bit int
+EPC_STRUCT = struct.Struct('>IQ')
+
+
+class SGTINPartition():
+    """
+    This class holds everything needed to split the company prefix and item reference
+    for one partition value
+    """
+    __slots__ = ('item_reference_bits', 'item_reference_mask', 'company_prefix_limit',
+                 'item_reference_limit', 'company_prefix_format', 'item_reference_format')
+
+    def __init__(self, company_prefix_bits: int, company_prefix_digits: int,
+                 item_reference_bits: int, item_reference_digits: int):
+        self.item_reference_bits = item_reference_bits
+        self.item_reference_mask = (1 << item_reference_bits) - 1
+        #   Values that do not fit in the number of digits are not valid SGTINs
+        self.company_prefix_limit = 10 ** company_prefix_digits
+        self.item_reference_limit = 10 ** item_reference_digits
+        self.company_prefix_format = f"0{company_prefix_digits}d"
+        self.item_reference_format = f"0{item_reference_digits}d"
+
+
+PARTITION_TABLE = tuple(SGTINPartition(*partition) for partition in SGTIN_PARTITIONS)
+
+
+class SGTIN():
+    """
+    This class holds the fields decoded from an SGTIN-96 EPC
+
+    Attributes
+    ----------
+    filter_value: int
+      The filter value, for example 1 for a point of sale item
+    partition: int
+      The partition value, which decides the number of digits in the company prefix
+    company_prefix: str
+      The GS1 company prefix, zero padded to its number of digits
+    item_reference: str
+      The item reference including the indicator digit, zero padded to its number of digits
+    serial: int
+      The serial number of this particular item
+    gtin: str
+      The 14 digit GTIN rebuilt from the company prefix and item reference, check digit included
+    """
+    __slots__ = ('filter_value', 'partition', 'company_prefix', 'item_reference', 'serial', 'gtin')
+
+    def __init__(self, filter_value: int, partition: int, company_prefix: str, item_reference: str, gtin: str,
+                 serial: int):
+        self.filter_value = filter_value
+        self.partition = partition
+        self.company_prefix = company_prefix
+        self.item_reference = item_reference
+        self.serial = serial
+        self.gtin = gtin
+
+    def __repr__(self) -> str:
+        return (f"SGTIN(filter_value={self.filter_value}, partition={self.partition}, "
+                f"company_prefix={self.company_prefix}, item_reference={self.item_reference}, "
+                f"serial={self.serial}, gtin={self.gtin})")
+
+
+def calculate_gs1_check_digit(digits: str) -> int:
+    """
+    This method calculates the GS1 check digit, where the digits are weighted 3 and 1
+    alternately starting from the right
+    """
+    total = 0
+    for index, digit in enumerate(reversed(digits)):
+        total += int(digit) * (3 if index % 2 == 0 else 1)
+    return (10 - total % 10) % 10
+
+
+def decode_sgtin_96(epc: bytes):
+    """
+    This method decodes the raw 12 bytes of an SGTIN-96 EPC
+
+    Returns
+    -------
+    SGTIN
+      The decoded fields, or None if the EPC is not a valid SGTIN-96
+    """
+    high_bits, low_bits = EPC_STRUCT.unpack(epc)
+    return decode_sgtin_96_value((high_bits << 64) | low_bits)
+
+
+def decode_sgtin_96_value(value: int):
+    """This method decodes an SGTIN-96 EPC that has already been turned into a 96 bit int"""
+    if value >> 88 != SGTIN_96_HEADER:
+        return None
+
+    partition = (value >> PARTITION_SHIFT) & PARTITION_MASK
+    item = decode_item(partition, (value >> COMPANY_PREFIX_AND_ITEM_REFERENCE_SHIFT) & COMPANY_PREFIX_AND_ITEM_REFERENCE_MASK)
+    if item is None:
+        return None
+
+    return SGTIN((value >> FILTER_SHIFT) & FILTER_MASK, partition, *item, value & SERIAL_MASK)
+
+
+@lru_cache(maxsize=4096)
+def decode_item(partition: int, company_prefix_and_item_reference: int):
+    """
+    This method splits the company prefix and item reference and rebuilds the GTIN
+
+    Every unit of a product shares these bits, so the result is cached and only the
+    first EPC of each product pays for the string formatting and check digit.
+
+    Returns
+    -------
+    Tuple
+      (company prefix, item reference, GTIN) as strings, or None if the bits are not valid
+    """
+    if partition >= len(PARTITION_TABLE):
+        return None
+    partition_entry = PARTITION_TABLE[partition]
+
+    company_prefix = company_prefix_and_item_reference >> partition_entry.item_reference_bits
+    item_reference = company_prefix_and_item_reference & partition_entry.item_reference_mask
+    if company_prefix >= partition_entry.company_prefix_limit or item_reference >= partition_entry.item_reference_limit:
+        return None
+
+    company_prefix = format(company_prefix, partition_entry.company_prefix_format)
+    item_reference = format(item_reference, partition_entry.item_reference_format)
+    #   The indicator digit leads the item reference in the EPC but the GTIN in the barcode
+    gtin_without_check_digit = item_reference[0] + company_prefix + item_reference[1:]
+    gtin = gtin_without_check_digit + str(calculate_gs1_check_digit(gtin_without_check_digit))
+    return company_prefix, item_reference, gtin
+
+
+def decode_sgtin_96_batch(epcs) -> list:
+    """
+    This method decodes a list of raw EPCs, or a buffer of EPCs packed back to back, and
+    returns a list with one SGTIN (or None for an EPC that is not an SGTIN-96) per EPC
+    """
+    if isinstance(epcs, (bytes, bytearray, memoryview)):
+        return [
+            decode_sgtin_96_value((high_bits << 64) | low_bits)
+            for high_bits, low_bits in EPC_STRUCT.iter_unpack(epcs)
+        ]
+    return [decode_sgtin_96(epc) for epc in epcs]
+
+
+def group_epcs_by_gtin(epcs) -> dict:
+    """
+    This method groups raw EPCs by the GTIN they encode. EPCs that are not SGTIN-96 are
+    grouped under None
+    """
+    epcs_by_gtin = {}
+    for epc in epcs:
+        sgtin = decode_sgtin_96(epc)
+        gtin = sgtin.gtin if sgtin is not None else None
+        epcs_by_gtin.setdefault(gtin, []).append(epc)
+    return epcs_by_gtin
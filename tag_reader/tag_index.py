@@ -0,0 +1,72 @@
+class TagSighting():
+    """
+    This class is used to keep the read statistics of one tag during a scan
+
+    Attributes
+    ----------
+    antenna_ids: Set
+      The IDs of every antenna that has read this tag
+    read_count: int
+      The number of times the readers reported this tag
+    first_seen: float
+      The time at which this tag was first read
+    last_seen: float
+      The time at which this tag was last read
+    """
+    __slots__ = ('antenna_ids', 'read_count', 'first_seen', 'last_seen')
+
+    def __init__(self, antenna_id: int, timestamp: float):
+        self.antenna_ids = {antenna_id}
+        self.read_count = 1
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+
+    def add_read(self, antenna_id: int, timestamp: float) -> None:
+        self.antenna_ids.add(antenna_id)
+        self.read_count += 1
+        self.last_seen = timestamp
+
+
+class TagIndex():
+    """
+    This class is used to de-duplicate tags in constant time, keyed on the raw 12 byte EPC
+
+    Readers report the same tag many times a second, so a repeat read must be recognised
+    before any hex conversion or validation happens. Tags that failed validation are
+    remembered as well, so they are not validated (and logged) again on every read.
+
+    Attributes
+    ----------
+    sightings: Dict
+      Maps the raw EPC bytes of every valid tag to its TagSighting, in the order the tags were first read
+    rejected_epcs: Set
+      The raw EPC bytes of every tag that failed validation
+    """
+
+    def __init__(self):
+        self.sightings = {}
+        self.rejected_epcs = set()
+
+    def __len__(self) -> int:
+        return len(self.sightings)
+
+    def record_repeat(self, epc: bytes, antenna_id: int, timestamp: float) -> bool:
+        """
+        This method is called for every read and returns True if the EPC has already been
+        seen (valid or not), in which case nothing more needs to be done with the read
+        """
+        tag_sighting = self.sightings.get(epc)
+        if tag_sighting is not None:
+            tag_sighting.add_read(antenna_id, timestamp)
+            return True
+        return epc in self.rejected_epcs
+
+    def add(self, epc: bytes, antenna_id: int, timestamp: float) -> None:
+        self.sightings[epc] = TagSighting(antenna_id, timestamp)
+
+    def reject(self, epc: bytes) -> None:
+        self.rejected_epcs.add(epc)
+
+    def clear(self) -> None:
+        self.sightings.clear()
+        self.rejected_epcs.clear()
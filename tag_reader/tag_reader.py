@@ -2,13 +2,23 @@ from multiprocessing import Process, Queue
 import logging
 import time
 import serial
-import sys
 from make_api_request import MakeApiRequest
 from carton.decide_carton_type import decide_carton_type, get_carton_perforation
 from tag_reader.Entities.rfid_tag import RFIDTagEntity
+from tag_reader.epc_codec import epc_to_hex, epcs_to_hex
+from tag_reader.frame_decoder import EPC_START_INDEX, EPC_END_INDEX
+from tag_reader.reader_pool import ReaderPool
+from tag_reader.serial_capture import CaptureWriter
+from tag_reader.tag_index import TagIndex
+from tag_reader.tag_ring_buffer import TagRingBuffer, get_antenna_mask
+from tag_reader.scan_completion_detector import ScanCompletionDetector
 from tag_reader.tag_reader_enums import TagReaderEnums
 from exceptions import ApiError
-from common_enums import CommonEnums
+from station_config import load_station_config
+from queue_events import get_queue_reader, get_queued_values
+from process_supervisor import Heartbeat
+from message_bus.messages import send_message, ApiProcessingMessage, ApiCompletedMessage, ApiErrorMessage, \
+    TagsAvailableMessage, DoneReadingTagsMessage, ScanCompleteMessage
 
 
 class TagReader(Process):
@@ -21,59 +31,139 @@ class TagReader(Process):
       A multiprocessing queue that is used by the main process to send instructions to this process
     main_queue: Queue
       A multiprocessing queue that is used by this process to communicate information back to the main process
-    serial_device: Object
-      The serial device port that will be read from will be stored in this variable
+    tag_ring_buffer: TagRingBuffer
+      The shared memory the tags read are written to for the main process, the main queue only
+      tells the main process when there are new ones
+    reader_pool: ReaderPool
+      The RFID readers (antennas) configured for this station, read from station_config.json
+    capture_path: String
+      When set, the raw bytes read from every reader are recorded to this capture file
     should_read_tags: Boolean
       This variable is used to determine when this process should start reading tags
     should_send_back_tag_values: Boolean
-      This variable is used to determine when this process will send tags read back to the main process
+      This variable is used to determine when this process will send tags read back to the main process,
+      it is True while a scan is running
+    scan_id: Int
+      The ID the main process gave the current scan, it is written with every tag so that the main
+      process can tell the tags of an earlier scan apart
+    new_epcs: List
+      The EPCs first seen since the last batch of new tags was written to the tag ring buffer
+    batch_interval: Float
+      The longest time in seconds a newly seen tag waits before it is sent to the main process
+    batch_size: Int
+      The number of newly seen tags that are sent straight away without waiting for the batch interval
+    scan_completion_detector: ScanCompletionDetector
+      Decides when a scan has stopped finding new tags, so it can end without waiting for the user
     tag_bytes_list: List
       This will be used to store all the bytes belonging to one RFID tag
-    tag_hex_list: List
-      This will be used to store the hex value of a specific RFID tag
-    string_of_tags: String
-      This will store all the tag values read during a given session
+    tag_index: TagIndex
+      This holds the raw EPC of every valid tag read during a given session, along with the antennas,
+      read count and first/last seen time of every tag
+    select_timeout: Float
+      The longest time in seconds the loop waits on the readers during a scan, so that batches are sent
+      and the end of the scan is noticed on time. Outside of a scan the loop sleeps until the queue or
+      a reader has data, or the next heartbeat is due
+    heartbeat: Heartbeat
+      Tells the main process that the loop is still running
     """
 
-    def __init__(self, queue: Queue, main_queue: Queue):
+    def __init__(self, queue: Queue, main_queue: Queue, tag_ring_buffer: TagRingBuffer, reader_configs: list = None,
+                 capture_path: str = None):
         Process.__init__(self)
         self.queue = queue
         self.main_queue = main_queue
-        self.serial_device_1 = None
-        self.serial_device_2 = None
+        self.tag_ring_buffer = tag_ring_buffer
+        station_config = load_station_config()
+        if reader_configs is None:
+            reader_configs = station_config['readers']
+        self.reader_pool = ReaderPool.from_config(reader_configs)
+        self.capture_path = capture_path
         self.should_send_back_tag_values = False
-        self.tag_hex_list = []  # The hex value of the RFID tag will be stored in this list
-        self.string_of_tags = ""
-        self.start_time = 0
+        self.rfid_tag_entity = RFIDTagEntity()
+        self.tag_index = TagIndex()  # The read statistics of every tag, keyed on the raw EPC bytes
+        self.new_epcs = []  # The EPCs first seen since the last batch was written to the tag ring buffer
+        self.scan_id = 0
+        self.scan_started_at = None
+        self.last_batch_sent_at = 0
         self.logger = logging.getLogger('tag_reader')
         self.carton_barcode = None
+        # The longest time the loop waits on the readers during a scan
+        self.select_timeout = 0.05
+        tag_stream_config = station_config['tag_stream']
+        self.batch_interval = tag_stream_config['batch_interval']
+        self.batch_size = tag_stream_config['batch_size']
+        # The longest time the end of a scan waits for the main process to make room in the tag ring buffer
+        self.ring_buffer_full_timeout = tag_stream_config['ring_buffer_full_timeout']
+        self.scan_completion_detector = ScanCompletionDetector.from_config(station_config['scan_completion'])
+        self.heartbeat = Heartbeat(main_queue)
 
     def send_tag_details_to_main_process(self):
         """
-        This method is called to return the list of tags to the main process
+        This method is called at the end of a scan, once every tag has been written to the tag
+        ring buffer, to tell the main process the scan is over
         """
-        self.string_of_tags = str(len(self.tag_hex_list)) + " "
-        for tag_value in self.tag_hex_list:
-            self.string_of_tags += tag_value + " "
+        send_message(self.main_queue, DoneReadingTagsMessage(
+            self.scan_id, len(self.tag_index), self.tag_ring_buffer.write_index))
 
-        self.main_queue.put({
-            'type': TagReaderEnums.DONE_READING_TAGS.value,
-            'data': {
-                'tags': self.string_of_tags
-            }
-        })
+    def send_new_tags_to_main_process(self):
+        """
+        This method is called during a scan to write only the tags that have not been sent before
+        to the tag ring buffer, and let the main process know they are there
+
+        The tags that do not fit are kept in new_epcs and written with the next batch, once the
+        main process has caught up
+        """
+        sightings = self.tag_index.sightings
+        records = [
+            (epc, self.scan_id, get_antenna_mask(sightings[epc].antenna_ids), sightings[epc].first_seen)
+            for epc in self.new_epcs
+        ]
+        number_of_records_written = self.tag_ring_buffer.write(records)
+        if number_of_records_written > 0:
+            send_message(self.main_queue, TagsAvailableMessage(self.tag_ring_buffer.write_index))
+        if number_of_records_written < len(records):
+            self.logger.log(
+                logging.DEBUG, f"The tag ring buffer is full, {len(records) - number_of_records_written} tags will be sent later")
+        del self.new_epcs[:number_of_records_written]
+        self.last_batch_sent_at = time.time()
 
-        self.string_of_tags = ""
-        self.start_time = time.time()
+    def is_new_tags_batch_due(self) -> bool:
+        """
+        This method checks if the new tags should be sent, which happens once enough of them
+        have been read or the oldest of them has waited for the batch interval
+        """
+        if len(self.new_epcs) == 0:
+            return False
+        return len(self.new_epcs) >= self.batch_size or time.time() - self.last_batch_sent_at >= self.batch_interval
+
+    def send_scan_complete_to_main_process(self, reason: str):
+        """
+        This method is called to tell the main process that the scan completed on its own
+        """
+        send_message(self.main_queue, ScanCompleteMessage(reason, len(self.tag_index), time.time() - self.scan_started_at))
+
+    def end_scan(self):
+        """This method is called to send any tags still waiting and then the summary of the scan"""
+        give_up_at = time.time() + self.ring_buffer_full_timeout
+        while len(self.new_epcs) > 0:
+            self.send_new_tags_to_main_process()
+            if len(self.new_epcs) == 0:
+                break
+            if time.time() >= give_up_at:
+                self.logger.log(
+                    logging.ERROR, f"The main process did not make room for the last {len(self.new_epcs)} tags of the scan")
+                self.new_epcs.clear()
+                break
+            # The main process frees the space as it reads the batches that were already written
+            time.sleep(0.01)
+        self.send_tag_details_to_main_process()
+        self.should_send_back_tag_values = False
     
     def send_api_error_to_main_process(self, message):
         """
         This method is called to return the API error message to the main process
         """
-        self.main_queue.put({
-            'type': CommonEnums.API_ERROR.value,
-            'message': message
-            })
+        send_message(self.main_queue, ApiErrorMessage(message))
 
     def decode_epc_tags_into_product_details(self):
         """
@@ -81,14 +171,14 @@ class TagReader(Process):
         """
         api_request = MakeApiRequest('/fabship/product/rfid')
         decoded_product_details = None
-        self.main_queue.put(CommonEnums.API_PROCESSING.value)
+        send_message(self.main_queue, ApiProcessingMessage())
         try:
             decoded_product_details = api_request.get_request_with_body(
-                {'epc': self.tag_hex_list})
+                {'epc': epcs_to_hex(self.tag_index.sightings)})
         except ApiError as err:
             self.queue.put_nowait(TagReaderEnums.CLEAR_TAG_DATA.value)
             self.send_api_error_to_main_process(err.message)
-        self.main_queue.put(CommonEnums.API_COMPLETED.value)
+        send_message(self.main_queue, ApiCompletedMessage())
 
         carton_perforation = get_carton_perforation(self.carton_barcode)
         carton_type = None
@@ -99,144 +189,128 @@ class TagReader(Process):
             self.logger.log(logging.ERROR, f"There was an error while deciding the carton type")
         return carton_type
 
-    def read_tag_data(self, tag_bytes_list):
-        """This method is called to convert EPC bytes to hex values and add them to the list if valid"""
-        rfid_tag_entity = RFIDTagEntity()
-        tag_hex_value = rfid_tag_entity.convert_tag_from_bytes_to_hex(tag_bytes_list=tag_bytes_list)
-        if tag_hex_value in self.tag_hex_list:
-            #   Do nothing if the tag is already listed
+    def read_tag_data(self, tag_bytes_list, antenna_id, timestamp):
+        """This method is called to add the EPC of a tag frame to the tag index if it is new and valid"""
+        epc = tag_bytes_list[EPC_START_INDEX:EPC_END_INDEX]
+        if self.tag_index.record_repeat(epc, antenna_id, timestamp) is True:
+            #   Do nothing else if the tag has already been seen
             return
-        
-        if rfid_tag_entity.is_tag_valid(tag_hex_value=tag_hex_value) is True:
-            self.tag_hex_list.append(tag_hex_value)
+
+        if self.rfid_tag_entity.is_epc_valid(epc) is True:
+            self.tag_index.add(epc, antenna_id, timestamp)
+            self.new_epcs.append(epc)
         else:
-            self.logger.log(logging.ERROR, f"This tag value {tag_hex_value} is not a valid EPC")
+            self.tag_index.reject(epc)
+            self.logger.log(logging.ERROR, f"This tag value {epc_to_hex(epc)} is not a valid EPC")
+
+    def clear_tag_data(self):
+        """This method is called to forget the tags and any partially read bytes from every reader"""
+        self.reader_pool.reset()
+        self.tag_index.clear()
+        self.new_epcs.clear()
+        self.scan_started_at = time.time()
+        self.last_batch_sent_at = self.scan_started_at
+        self.scan_completion_detector.start(self.scan_started_at)
 
     def read_tag_bytes(self):
         """
-        This method is called to start reading the byte strings from the serial
-        device connected via USB
+        This method is called to start reading the byte strings from every
+        RFID reader in the pool
 
         Raises
         ------
         serial.serialutil.SerialException
-          If the USB device is not connected properly and cannot be read from
+          If a USB device is not connected properly and cannot be read from
         """
         try:
             self.logger.log(
                 logging.DEBUG, "Starting the serial ports for RFID reading")
-            self.serial_device_1 = serial.Serial(
-                '/dev/rfid-reader-1', 57600, timeout=0.5)
-            self.serial_device_2 = serial.Serial(
-                '/dev/rfid-reader-2', 57600, timeout=0.5)
+            self.reader_pool.open()
         except serial.serialutil.SerialException as err:
             self.logger.log(
                 logging.ERROR, f"There was an error while opening ports for the RFID readers: {err}")
             raise err
 
-        should_exit_loop = False
+        if self.capture_path is not None:
+            self.logger.log(
+                logging.DEBUG, f"Capturing the raw bytes from every RFID reader to {self.capture_path}")
+            self.reader_pool.start_capture(CaptureWriter(self.capture_path))
 
-        should_read_tags_from_device_1 = False
-        should_read_tags_from_device_2 = False
+        # The queue is waited on together with the readers, so a command wakes the loop up
+        # the moment it is sent
+        self.reader_pool.watch(get_queue_reader(self.queue))
 
-        tag_bytes_list_for_device_1 = []
-        tag_bytes_list_for_device_2 = []
+        should_exit_loop = False
+        loop_started_at = None
 
         while should_exit_loop is False:
-            # Check if the queue has any elements in it
-            # Do this because queue.get() is a blocking call
-            if self.queue.qsize() > 0:
-                input_queue_string = self.queue.get()
-                if input_queue_string == TagReaderEnums.START_READING_TAGS.value:
-                    # When the user clicks the scan button, clear the buffer
-                    # clear the bytes list and also clear previously stored EPC's
+            for input_queue_string in get_queued_values(self.queue):
+                if input_queue_string == TagReaderEnums.STOP_READING_TAGS.value:
                     self.logger.log(
-                        logging.DEBUG, "Clearing the bytes list for tags in preparation for another scan")
-                    tag_bytes_list_for_device_1.clear()
-                    tag_bytes_list_for_device_2.clear()
-                    self.serial_device_1.reset_input_buffer()
-                    self.serial_device_2.reset_input_buffer()
-                    self.tag_hex_list.clear()
-                    self.should_send_back_tag_values = True
-                    self.start_time = time.time()
+                        logging.DEBUG, f"Ending the scan with {len(self.tag_index)} tags")
+                    self.end_scan()
                 elif input_queue_string == TagReaderEnums.CLEAR_TAG_DATA.value:
                     self.logger.log(
                         logging.DEBUG, "Clearing the bytes list for tags")
-                    tag_bytes_list_for_device_1.clear()
-                    tag_bytes_list_for_device_2.clear()
-                    self.serial_device_1.reset_input_buffer()
-                    self.serial_device_2.reset_input_buffer()
-                    self.tag_hex_list.clear()
+                    self.clear_tag_data()
                     self.should_send_back_tag_values = False
-                    self.start_time = time.time()
                     self.carton_barcode = None
                     self.carton_type = None
+                    self.scan_completion_detector.expected_tag_count = None
                 elif isinstance(input_queue_string, dict):
-                    if input_queue_string['type'] == TagReaderEnums.RECEIVED_CARTON_BARCODE_VALUE.value:
+                    if input_queue_string['type'] == TagReaderEnums.START_READING_TAGS.value:
+                        # When the user clicks the scan button, clear the buffer
+                        # clear the bytes list and also clear previously stored EPC's
+                        self.logger.log(
+                            logging.DEBUG, "Clearing the bytes list for tags in preparation for another scan")
+                        self.clear_tag_data()
+                        self.scan_id = input_queue_string['data']['scan_id']
+                        self.should_send_back_tag_values = True
+                    elif input_queue_string['type'] == TagReaderEnums.RECEIVED_CARTON_BARCODE_VALUE.value:
                         self.logger.log(
                             logging.DEBUG, "Received the carton barcode value")
                         self.carton_barcode = input_queue_string['data']['carton_code']
+                        # If the number of tags in the carton is known, the scan can stop as soon as they are all read
+                        self.scan_completion_detector.expected_tag_count = input_queue_string['data'].get(
+                            'expected_tag_count')
                 elif input_queue_string is None:
                     self.logger.log(
                         logging.DEBUG, "Exiting the tag_reader process")
                     should_exit_loop = True
+                    break
+            if should_exit_loop is True:
+                break
 
-            read_bytes_from_device_1 = self.serial_device_1.read()
-            int_value_from_device_1 = int.from_bytes(
-                read_bytes_from_device_1, "big")
-
-            read_bytes_from_device_2 = self.serial_device_2.read()
-            int_value_from_device_2 = int.from_bytes(
-                read_bytes_from_device_2, "big")
-
-            sys.stdout.flush()
-            # The starting byte of any tag id is 0x11 (which is 17)
-            if int_value_from_device_1 == 0x11:
-                should_read_tags_from_device_1 = True
-
-            if should_read_tags_from_device_1 is True:
-                tag_bytes_list_for_device_1.append(int_value_from_device_1)
-
-                # One RFID tag has a sequence of 18 bytes
-                if len(tag_bytes_list_for_device_1) == 18:
-                    should_read_tags_from_device_1 = False
-                    self.read_tag_data(
-                        tag_bytes_list=tag_bytes_list_for_device_1)
-                    # Clear the bytes from the RFID tag read in preparation for the next one
-                    tag_bytes_list_for_device_1.clear()
-
-            # The starting byte of any tag id is 0x11 (which is 17)
-            if int_value_from_device_2 == 0x11:
-                should_read_tags_from_device_2 = True
-
-            if should_read_tags_from_device_2 is True:
-                tag_bytes_list_for_device_2.append(int_value_from_device_2)
-
-                # One RFID tag has a sequence of 18 bytes
-                if len(tag_bytes_list_for_device_2) == 18:
-                    should_read_tags_from_device_2 = False
-                    self.read_tag_data(
-                        tag_bytes_list=tag_bytes_list_for_device_2)
-                    # Clear the bytes from the RFID tag read in preparation for the next one
-                    tag_bytes_list_for_device_2.clear()
-
-            #   Before sending tag values to the main process, check the following:
-            #   1. The boolean for this is set to True
-            #   2. The tag hex list actually has values
-            #   3. The time lapsed has been at least 2 seconds
-            if self.should_send_back_tag_values is True and len(self.tag_hex_list) > 0 and time.time() - self.start_time > 2:
-                # if self.carton_type is None:
-                #     self.carton_type = self.decode_epc_tags_into_product_details()
-                self.send_tag_details_to_main_process()
+            # Wait for any reader to have data, then pass the complete frames from all
+            # of them to the shared de-duplication stage
+            # Outside of a scan the ports are still drained but the frames are ignored
+            select_timeout = self.select_timeout if self.should_send_back_tag_values is True else None
+            # The time spent waiting on the readers is not counted as part of the loop
+            self.heartbeat.beat(loop_started_at)
+            tag_frames = self.reader_pool.read_frames(timeout=self.heartbeat.get_timeout(select_timeout))
+            loop_started_at = time.monotonic()
+            if self.should_send_back_tag_values is True:
+                read_time = time.time()
+                unique_tag_count = len(self.tag_index)
+                for antenna_id, tag_frame in tag_frames:
+                    self.read_tag_data(tag_bytes_list=tag_frame, antenna_id=antenna_id, timestamp=read_time)
+                self.scan_completion_detector.record_new_tags(len(self.tag_index) - unique_tag_count, read_time)
 
-        # Once the loop exits, perform clean up and close serial ports
-        self.serial_device_1.flush()
-        self.serial_device_1.reset_input_buffer()
-        self.serial_device_1.close()
+                #   Only the tags that were not sent before go to the main process, in batches
+                #   through the tag ring buffer
+                if self.is_new_tags_batch_due() is True:
+                    self.send_new_tags_to_main_process()
 
-        self.serial_device_2.flush()
-        self.serial_device_2.reset_input_buffer()
-        self.serial_device_2.close()
+                #   End the scan as soon as no more new tags are being found
+                scan_completion_reason = self.scan_completion_detector.check(len(self.tag_index), read_time)
+                if scan_completion_reason is not None:
+                    self.logger.log(
+                        logging.DEBUG, f"The scan completed with {len(self.tag_index)} tags: {scan_completion_reason}")
+                    self.send_scan_complete_to_main_process(scan_completion_reason)
+                    self.end_scan()
+
+        # Once the loop exits, perform clean up and close serial ports
+        self.reader_pool.close()
 
     def run(self):
         """
@@ -3,7 +3,17 @@ from enum import Enum, unique
 @unique
 class TagReaderEnums(Enum):
   START_READING_TAGS = 'start reading tags'
-  DONE_READING_TAGS = 'done reading tags'
+  STOP_READING_TAGS = 'stop reading tags'
   RECEIVED_CARTON_BARCODE_VALUE = 'received carton barcode value'
   CLEAR_TAG_DATA = 'clear tag data'
   GET_CARTON_TYPE = 'get carton type'
+
+
+@unique
+class ScanCompletionEnums(Enum):
+  """
+  This class is used to enumerate the reasons a scan can complete on its own
+  """
+  EXPECTED_COUNT_REACHED = 'expected count reached'
+  DISCOVERY_PLATEAUED = 'discovery plateaued'
+  MAXIMUM_SCAN_TIME = 'maximum scan time'
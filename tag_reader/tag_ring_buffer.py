@@ -0,0 +1,138 @@
+"""
+This file contains the ring buffer the TagReader writes the tags it reads into, so that the
+tags reach the main process through shared memory instead of being pickled through the main
+queue. The queue only carries a small TagsAvailableMessage once a batch has been written.
+
+There is exactly one writer (the tag reader process) and one reader (the main process), so no
+lock is needed: only the writer moves the write index and only the reader moves the read
+index. Both indexes count every record ever written or read and never wrap, the position of a
+record in the buffer is its index modulo the capacity.
+
+    [write index: Q] ... [read index: Q] ... [capacity: Q] ... [record] [record] ...
+
+The indexes are 8 byte aligned and sit on cache lines of their own, so each one is written in
+a single store and the two processes do not keep taking the same cache line from each other.
+The reader never goes past the write index it was given in a TagsAvailableMessage. That
+message goes through the pipe of the main queue after the records were written, so the
+records are visible to the reader even on CPUs that reorder stores.
+"""
+import struct
+from itertools import starmap
+from multiprocessing import shared_memory
+
+#   The raw EPC, the scan it was read in, a bitmask of the antennas that have seen it
+#   (antenna IDs 0 to 63) and the time it was first read
+TAG_RECORD = struct.Struct('<12sIQd')
+
+#   The antenna IDs that fit in the antenna bitmask of a record
+ANTENNA_MASK_BITS = 64
+
+RING_INDEX = struct.Struct('<Q')
+WRITE_INDEX_OFFSET = 0
+READ_INDEX_OFFSET = 64
+CAPACITY_OFFSET = 128
+RECORDS_OFFSET = 192
+
+
+def get_antenna_mask(antenna_ids) -> int:
+    return sum(1 << antenna_id for antenna_id in antenna_ids)
+
+
+class TagRingBuffer():
+    """
+    This class is used to pass tag records from one process to another through shared memory
+
+    The main process creates the buffer before the tag reader process is started, and the tag
+    reader process inherits it. Records are written with write and read with read, each of
+    which must only ever be called from one process.
+
+    Attributes
+    ----------
+    shared_memory: SharedMemory
+      The block of shared memory holding the indexes and the records
+    capacity: int
+      The number of records the buffer can hold before the reader has to catch up
+    is_owner: bool
+      True in the process that created the shared memory, which is the one that unlinks it
+    """
+
+    def __init__(self, capacity: int = 4096, name: str = None):
+        if name is None:
+            self.shared_memory = shared_memory.SharedMemory(create=True, size=RECORDS_OFFSET + capacity * TAG_RECORD.size)
+            self.shared_memory.buf[:RECORDS_OFFSET] = bytes(RECORDS_OFFSET)
+            RING_INDEX.pack_into(self.shared_memory.buf, CAPACITY_OFFSET, capacity)
+            self.is_owner = True
+        else:
+            self.shared_memory = shared_memory.SharedMemory(name=name)
+            self.is_owner = False
+        self.capacity = RING_INDEX.unpack_from(self.shared_memory.buf, CAPACITY_OFFSET)[0]
+
+    @property
+    def name(self) -> str:
+        return self.shared_memory.name
+
+    @property
+    def write_index(self) -> int:
+        return RING_INDEX.unpack_from(self.shared_memory.buf, WRITE_INDEX_OFFSET)[0]
+
+    @property
+    def read_index(self) -> int:
+        return RING_INDEX.unpack_from(self.shared_memory.buf, READ_INDEX_OFFSET)[0]
+
+    def write(self, records: list) -> int:
+        """
+        This method writes as many of the records as there is space for, every record being a
+        tuple of (epc, scan_id, antenna_mask, first_seen)
+
+        Returns
+        -------
+        Int
+          The number of records written, the first ones of the list. The rest have to be
+          written again once the reader has caught up
+        """
+        buffer = self.shared_memory.buf
+        write_index = self.write_index
+        number_of_records = min(len(records), self.capacity - (write_index - self.read_index))
+        written = 0
+        while written < number_of_records:
+            position = (write_index + written) % self.capacity
+            #   The records up to the end of the buffer are packed together and copied in one go
+            number_of_records_in_segment = min(number_of_records - written, self.capacity - position)
+            start = RECORDS_OFFSET + position * TAG_RECORD.size
+            buffer[start:start + number_of_records_in_segment * TAG_RECORD.size] = b''.join(
+                starmap(TAG_RECORD.pack, records[written:written + number_of_records_in_segment]))
+            written += number_of_records_in_segment
+        #   The records are in place before the write index is moved past them
+        RING_INDEX.pack_into(buffer, WRITE_INDEX_OFFSET, write_index + number_of_records)
+        return number_of_records
+
+    def read(self, until_index: int) -> list:
+        """
+        This method reads every record from the read index up to until_index, which is the
+        write index sent with a TagsAvailableMessage
+
+        Returns
+        -------
+        List
+          The records as tuples of (epc, scan_id, antenna_mask, first_seen). Records that were
+          already read for an earlier message are not returned again
+        """
+        buffer = self.shared_memory.buf
+        read_index = self.read_index
+        records = []
+        while read_index < until_index:
+            position = read_index % self.capacity
+            number_of_records_in_segment = min(until_index - read_index, self.capacity - position)
+            start = RECORDS_OFFSET + position * TAG_RECORD.size
+            #   The records are unpacked straight out of the shared memory
+            records.extend(TAG_RECORD.iter_unpack(buffer[start:start + number_of_records_in_segment * TAG_RECORD.size]))
+            read_index += number_of_records_in_segment
+        if len(records) > 0:
+            RING_INDEX.pack_into(buffer, READ_INDEX_OFFSET, read_index)
+        return records
+
+    def close(self) -> None:
+        """This method is called by the main process once every child has exited, the owner also frees it"""
+        self.shared_memory.close()
+        if self.is_owner is True:
+            self.shared_memory.unlink()
@@ -1,42 +1,36 @@
 import serial
 import sys
 
+from station_config import load_station_config
+
 def run_test():
+    reader_configs = load_station_config()['readers']
+    serial_devices = {}
     try:
-        serial_device_1 = serial.Serial(
-            '/dev/rfid-reader-1', 57600, timeout=0.5
-        )
-        serial_device_2 = serial.Serial(
-            '/dev/rfid-reader-2', 57600, timeout=0.5
-        )
+        for reader_config in reader_configs:
+            serial_devices[reader_config['antenna_id']] = serial.Serial(
+                reader_config['device'], reader_config['baud_rate'], timeout=0.5
+            )
     except serial.serialutil.SerialException as err:
         print('There was a problem while opening the ports for the reader')
         raise err
 
     try:
         while True:
-            serial_device_1.reset_input_buffer()
-            serial_device_2.reset_input_buffer()
-            
-            read_bytes_from_device_1 = serial_device_1.read()
-            int_value_from_device_1 = int.from_bytes(
-                read_bytes_from_device_1, "big")
-            read_bytes_from_device_2 = serial_device_2.read()
-            int_value_from_device_2 = int.from_bytes(
-                read_bytes_from_device_2, "big"
-            )
-            sys.stdout.flush()
-            print(f"Value from device 1: {int_value_from_device_1}")
-            print(f"Value from device 2: {int_value_from_device_2}")
+            for antenna_id, serial_device in serial_devices.items():
+                serial_device.reset_input_buffer()
+
+                read_bytes_from_device = serial_device.read()
+                int_value_from_device = int.from_bytes(
+                    read_bytes_from_device, "big")
+                sys.stdout.flush()
+                print(f"Value from antenna {antenna_id}: {int_value_from_device}")
     except KeyboardInterrupt:
         print("Received keyboard interrupt in the RFID reader test program. Closing the ports and exiting the program")
-        serial_device_1.flush()
-        serial_device_1.reset_input_buffer()
-        serial_device_1.close()
-
-        serial_device_2.flush()
-        serial_device_2.reset_input_buffer()
-        serial_device_2.close()
+        for serial_device in serial_devices.values():
+            serial_device.flush()
+            serial_device.reset_input_buffer()
+            serial_device.close()
 
 if __name__ == "__main__":
-    run_test()
\ No newline at end of file
+    run_test()
@@ -0,0 +1,63 @@
+"""
+Run from the root of the repository:
+    python3 -m pytest test/test_epc_wire_format.py
+"""
+from tag_reader.epc_wire_format import encode_epcs, decode_epcs, SERIAL_BITS, SERIAL_MASK
+
+#   The part in front of the serial of the SGTIN-96 example of the GS1 EPC Tag Data Standard
+GS1_EXAMPLE_PREFIX = 0x3074257BF7194E4000001A85 >> SERIAL_BITS
+GS1_EXAMPLE_GTIN = '80614141123458'
+
+
+def build_epc(serial: int, prefix: int = GS1_EXAMPLE_PREFIX) -> bytes:
+    return ((prefix << SERIAL_BITS) | serial).to_bytes(12, 'big')
+
+
+def round_trip(epcs: list) -> list:
+    return decode_epcs(encode_epcs(epcs))
+
+
+def test_consecutive_serials_are_sent_as_ranges():
+    epcs = [build_epc(serial) for serial in (6802, 6789, 6790, 6791)]
+    encoded_epcs = encode_epcs(epcs)
+    assert encoded_epcs['groups'] == [
+        {'gtin': GS1_EXAMPLE_GTIN, 'prefix': format(GS1_EXAMPLE_PREFIX, 'X'), 'serials': [6789, 3, 10, 1]}]
+    assert encoded_epcs['other'] == []
+    assert decode_epcs(encoded_epcs) == sorted(epcs)
+
+
+def test_hex_strings_are_encoded_like_raw_epcs():
+    epcs = [build_epc(serial) for serial in range(10)]
+    assert encode_epcs([epc.hex() for epc in epcs]) == encode_epcs(epcs)
+
+
+def test_serial_roll_over_starts_a_new_group():
+    next_prefix = GS1_EXAMPLE_PREFIX + 1
+    epcs = [build_epc(SERIAL_MASK - 1), build_epc(SERIAL_MASK), build_epc(0, next_prefix), build_epc(1, next_prefix)]
+    encoded_epcs = encode_epcs(epcs)
+    assert [group['serials'] for group in encoded_epcs['groups']] == [[SERIAL_MASK - 1, 2], [0, 2]]
+    assert decode_epcs(encoded_epcs) == epcs
+
+
+def test_duplicate_epcs_are_sent_once():
+    epcs = [build_epc(5), build_epc(6), build_epc(5), build_epc(6)]
+    encoded_epcs = encode_epcs(epcs)
+    assert encoded_epcs['groups'][0]['serials'] == [5, 2]
+    assert decode_epcs(encoded_epcs) == [build_epc(5), build_epc(6)]
+
+
+def test_epcs_that_are_not_sgtin_are_sent_as_other():
+    other_epcs = [bytes.fromhex('E28011606000020A1B2C3D4E'), bytes.fromhex('3674257BF7194E4000001A85')]
+    encoded_epcs = encode_epcs(other_epcs + [build_epc(6789)])
+    assert len(encoded_epcs['groups']) == 1
+    assert encoded_epcs['other'] == sorted(epc.hex().upper() for epc in other_epcs)
+    assert round_trip(other_epcs + [build_epc(6789)]) == [build_epc(6789)] + sorted(other_epcs)
+
+
+def test_invalid_partition_is_encoded_without_gtin():
+    #   The GS1 example with its partition set to 7
+    prefix = GS1_EXAMPLE_PREFIX | (0x7 << (82 - SERIAL_BITS))
+    epcs = [build_epc(serial, prefix) for serial in (1, 2, 3)]
+    encoded_epcs = encode_epcs(epcs)
+    assert encoded_epcs['groups'] == [{'gtin': None, 'prefix': format(prefix, 'X'), 'serials': [1, 3]}]
+    assert decode_epcs(encoded_epcs) == epcs
@@ -0,0 +1,30 @@
+"""
+Run from the root of the repository:
+    python3 -m pytest test/test_messages.py
+"""
+import pickle
+
+from message_bus.messages import encode_message, decode_message, CartonBarcodeScanValueMessage
+
+
+def round_trip(message):
+    #   The messages go through the main queue pickled
+    return decode_message(pickle.loads(pickle.dumps(encode_message(message))))
+
+
+def test_carton_barcode_scan_value_with_carton_code():
+    message = round_trip(CartonBarcodeScanValueMessage('CB-104522P', '8901234567890', 120))
+    assert message.carton_code == 'CB-104522P'
+    assert message.carton_barcode == '8901234567890'
+    assert message.expected_tag_count == 120
+
+
+def test_carton_barcode_scan_value_without_carton_code():
+    message = round_trip(CartonBarcodeScanValueMessage(None, '8901234567890'))
+    assert message.carton_code is None
+    assert message.carton_barcode == '8901234567890'
+    assert message.expected_tag_count is None
+
+
+def test_empty_carton_code_is_not_read_as_missing():
+    assert round_trip(CartonBarcodeScanValueMessage('', '8901234567890')).carton_code == ''
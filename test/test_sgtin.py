@@ -0,0 +1,65 @@
+"""
+Run from the root of the repository:
+    python3 -m pytest test/test_sgtin.py
+"""
+import pytest
+
+from tag_reader.sgtin import decode_sgtin_96, decode_sgtin_96_batch, group_epcs_by_gtin, SGTIN_PARTITIONS
+
+#   The SGTIN-96 example of the GS1 EPC Tag Data Standard
+GS1_EXAMPLE_EPC = bytes.fromhex('3074257BF7194E4000001A85')
+GS1_EXAMPLE_GTIN = '80614141123458'
+
+
+def build_epc(partition: int, company_prefix: int, item_reference: int, serial: int,
+              filter_value: int = 3, header: int = 48) -> bytes:
+    item_reference_bits = SGTIN_PARTITIONS[partition][2] if partition < len(SGTIN_PARTITIONS) else 0
+    value = (header << 88) | (filter_value << 85) | (partition << 82) \
+        | (company_prefix << (38 + item_reference_bits)) | (item_reference << 38) | serial
+    return value.to_bytes(12, 'big')
+
+
+def test_decode_gs1_example():
+    sgtin = decode_sgtin_96(GS1_EXAMPLE_EPC)
+    assert sgtin.filter_value == 3
+    assert sgtin.partition == 5
+    assert sgtin.company_prefix == '0614141'
+    assert sgtin.item_reference == '812345'
+    assert sgtin.serial == 6789
+    assert sgtin.gtin == GS1_EXAMPLE_GTIN
+
+
+@pytest.mark.parametrize('partition', range(len(SGTIN_PARTITIONS)))
+def test_decode_every_partition(partition):
+    #   The GTIN of the GS1 example, with its digits split between the company prefix and the
+    #   item reference the way the partition says
+    _, company_prefix_digits, _, item_reference_digits = SGTIN_PARTITIONS[partition]
+    digits = GS1_EXAMPLE_GTIN[1:13]
+    company_prefix = digits[:company_prefix_digits]
+    item_reference = GS1_EXAMPLE_GTIN[0] + digits[company_prefix_digits:]
+    assert len(item_reference) == item_reference_digits
+
+    sgtin = decode_sgtin_96(build_epc(partition, int(company_prefix), int(item_reference), 123456789))
+    assert sgtin.partition == partition
+    assert sgtin.company_prefix == company_prefix
+    assert sgtin.item_reference == item_reference
+    assert sgtin.serial == 123456789
+    assert sgtin.gtin == GS1_EXAMPLE_GTIN
+
+
+def test_epc_that_is_not_sgtin_96():
+    #   An SGTIN-198 header
+    epc = bytes.fromhex('3674257BF7194E4000001A85')
+    assert decode_sgtin_96(epc) is None
+    assert group_epcs_by_gtin([epc, GS1_EXAMPLE_EPC]) == {None: [epc], GS1_EXAMPLE_GTIN: [GS1_EXAMPLE_EPC]}
+
+
+def test_invalid_partition():
+    assert decode_sgtin_96(build_epc(7, 614141, 812345, 6789)) is None
+
+
+def test_decode_packed_batch():
+    epc = bytes.fromhex('3674257BF7194E4000001A85')
+    sgtins = decode_sgtin_96_batch(GS1_EXAMPLE_EPC + epc)
+    assert sgtins[0].gtin == GS1_EXAMPLE_GTIN
+    assert sgtins[1] is None
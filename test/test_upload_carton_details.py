@@ -0,0 +1,114 @@
+"""
+Run from the root of the repository:
+    python3 -m pytest test/test_upload_carton_details.py
+"""
+import importlib
+import queue
+import sys
+
+import pytest
+
+pytest.importorskip('requests')
+pytest.importorskip('dotenv')
+
+import make_api_request
+from make_api_request import MakeApiRequest
+
+
+class FakeResponse():
+    def __init__(self, body: dict = None):
+        self.body = {'success': True} if body is None else body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+
+class FakeSession():
+    def __init__(self, batch_results: list = None):
+        self.posted_urls = []
+        self.posted_bodies = []
+        self.batch_results = batch_results
+
+    def post(self, url, **kwargs):
+        self.posted_urls.append(url)
+        self.posted_bodies.append(kwargs.get('json'))
+        if url.endswith('/batch'):
+            return FakeResponse({'results': self.batch_results})
+        return FakeResponse()
+
+
+def build_carton_details(carton_barcode: str) -> dict:
+    return {
+        'location': 'warehouse', 'epcs': [], 'shipmentId': '1', 'cartonCode': 'CB-1',
+        'cartonBarcode': carton_barcode, 'cartonWeight': 7.25, 'packType': 'solid'
+    }
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """Points the API requests at a fake server, with the secrets written to a temporary .env file"""
+    env_file_path = tmp_path / '.env'
+    env_file_path.write_text('SERVER_BASE_URL=https://api.example.com\n')
+    monkeypatch.setattr(make_api_request, 'ENV_FILE_PATH', str(env_file_path))
+    monkeypatch.setattr(make_api_request, 'env_file_modified_at', None)
+    monkeypatch.delenv('SERVER_BASE_URL', raising=False)
+    monkeypatch.setattr(MakeApiRequest, 'get_authentication_token', lambda self: None)
+
+    def use_session(fake_session):
+        monkeypatch.setattr(MakeApiRequest, 'get_session', staticmethod(lambda: fake_session))
+        return fake_session
+    return use_session
+
+
+def test_post_carton_details_uses_secrets_written_after_import(tmp_path, monkeypatch):
+    env_file_path = tmp_path / '.env'
+    monkeypatch.setattr(make_api_request, 'ENV_FILE_PATH', str(env_file_path))
+    monkeypatch.setattr(make_api_request, 'env_file_modified_at', None)
+    monkeypatch.delenv('SERVER_BASE_URL', raising=False)
+
+    #   The module is imported, and its request objects built, before the secrets are fetched
+    sys.modules.pop('upload_carton_details', None)
+    upload_carton_details = importlib.import_module('upload_carton_details')
+
+    env_file_path.write_text('SERVER_BASE_URL=https://api.example.com\n')
+    fake_session = FakeSession()
+    monkeypatch.setattr(MakeApiRequest, 'get_session', staticmethod(lambda: fake_session))
+    monkeypatch.setattr(MakeApiRequest, 'get_authentication_token', lambda self: None)
+
+    assert upload_carton_details.post_carton_details(build_carton_details('8901234567890')) is True
+    assert fake_session.posted_urls == ['https://api.example.com/fabship/product/rfid']
+
+
+def test_post_carton_details_batch_returns_none_for_cartons_without_result(api):
+    import upload_carton_details
+    api(FakeSession(batch_results=[
+        {'cartonBarcode': '1', 'success': True}, {'cartonBarcode': '3', 'success': False, 'message': 'Duplicate'}]))
+
+    results = upload_carton_details.post_carton_details_batch(
+        [build_carton_details('1'), build_carton_details('2'), build_carton_details('3')])
+    assert results == [
+        {'cartonBarcode': '1', 'success': True}, None, {'cartonBarcode': '3', 'success': False, 'message': 'Duplicate'}]
+
+
+def test_send_batch_resends_only_the_cartons_without_result(api, tmp_path):
+    from upload_sender.upload_journal import UploadJournal
+    from upload_sender.upload_sender import UploadSender
+    fake_session = api(FakeSession(batch_results=[{'cartonBarcode': '1', 'success': True}]))
+
+    upload_sender = UploadSender(queue.Queue(), queue.Queue())
+    upload_sender.is_batch_upload_supported = True
+    upload_sender.upload_journal = UploadJournal(str(tmp_path / 'upload_journal.sqlite3'))
+    for carton_barcode in ('1', '2'):
+        upload_sender.upload_journal.append(build_carton_details(carton_barcode))
+
+    assert upload_sender.send_batch(upload_sender.upload_journal.get_pending()) is True
+    assert fake_session.posted_urls == [
+        'https://api.example.com/fabship/product/rfid/batch', 'https://api.example.com/fabship/product/rfid']
+    assert fake_session.posted_bodies[1]['cartonBarcode'] == '2'
+    assert upload_sender.upload_journal.count_pending() == 0
+    # A partial answer does not turn batches off
+    assert upload_sender.is_batch_upload_supported is True
+    upload_sender.upload_journal.close()
@@ -2,12 +2,34 @@ import logging
 from os import path
 
 from make_api_request import MakeApiRequest
-from exceptions import ApiError
+from exceptions import ApiError, BatchUnsupportedError
+from station_config import load_station_config
+from tag_reader.epc_codec import epcs_to_hex
+from tag_reader.epc_wire_format import encode_epcs, UNSUPPORTED_FORMAT_STATUS_CODE
 
 logger = logging.getLogger('upload_carton_details')
 api_request = MakeApiRequest('/fabship/product/rfid')
+batch_api_request = MakeApiRequest('/fabship/product/rfid/batch')
 
-def upload_carton_details(list_of_epc_tags, carton_weight, carton_code, carton_barcode, carton_pack_type, shipment_id) -> bool:
+# The keys shared by every carton of a batch, they are sent once for the whole batch
+BATCH_KEYS = ('location', 'shipmentId')
+
+# The EPCs are sent in the compact format, gzip compressed, only if the station is configured
+# for it, and then only until the server says it does not understand it
+is_compact_format_supported = load_station_config()['api']['compact_epc_format']
+
+def build_carton_details(list_of_epc_tags, carton_weight, carton_code, carton_barcode, carton_pack_type, shipment_id) -> dict:
+    """
+    This method builds the body of the upload request for one carton, so that it can be
+    written to the upload journal and sent later
+
+    Raises
+    ------
+    FileNotFoundError
+      If the location.txt file has not been written yet
+    """
+    # The tags are carried as raw EPC bytes, the API expects hex strings
+    list_of_epc_tags = epcs_to_hex(list_of_epc_tags)
     logger.log(logging.DEBUG, f"Received the following tags to upload: {list_of_epc_tags}")
     # Read the location from the relevant file
     dirname = path.dirname(__file__)
@@ -21,24 +43,102 @@ def upload_carton_details(list_of_epc_tags, carton_weight, carton_code, carton_b
         logger.log(
             logging.ERROR, "Could not find the location.txt file to read from")
         raise err
-    # Make the API request
+    return {
+        'location': location, #   only while testing against prod
+        'epcs': list_of_epc_tags,
+        'shipmentId': str(shipment_id),
+        'cartonCode': carton_code,
+        'cartonBarcode': carton_barcode,
+        'cartonWeight': carton_weight,
+        'packType': carton_pack_type
+    }
+
+def encode_carton_details(carton_details: dict) -> dict:
+    """This method replaces the list of hex EPCs of a carton with the compact wire format"""
+    return {**carton_details, 'epcs': encode_epcs(carton_details['epcs'])}
+
+def encode_carton_details_batch(carton_details_batch: dict) -> dict:
+    return {**carton_details_batch, 'cartons': [encode_carton_details(carton) for carton in carton_details_batch['cartons']]}
+
+def post_in_supported_format(request: MakeApiRequest, body: dict, encode_body):
+    """
+    This method posts the body as plain JSON, or with its EPCs in the compact format if the
+    station is configured for it, falling back to plain JSON for this and every later request
+    if the server does not accept it
+    """
+    global is_compact_format_supported
+    if is_compact_format_supported is True:
+        try:
+            return request.post(encode_body(body), compress=True)
+        except ApiError as err:
+            if err.status_code != UNSUPPORTED_FORMAT_STATUS_CODE:
+                raise err
+            logger.log(logging.INFO, "The server does not accept the compact EPC format, sending plain JSON instead")
+            is_compact_format_supported = False
+    return request.post(body)
+
+def post_carton_details(carton_details: dict) -> bool:
+    """This method makes the API request for carton details built by build_carton_details"""
     try:
         logger.log(logging.DEBUG, "Making a POST request")
-        response = api_request.post(
-            {
-                'location': location, #   only while testing against prod 
-                'epcs': list_of_epc_tags,
-                'shipmentId': str(shipment_id),
-                'cartonCode': carton_code,
-                'cartonBarcode': carton_barcode,
-                'cartonWeight': carton_weight,
-                'packType': carton_pack_type
-            }
-        )
+        response = post_in_supported_format(api_request, carton_details, encode_carton_details)
         logger.log(logging.DEBUG,
                     f"Received the following response: {response}")
         return True
     except ApiError as err:
         logger.log(logging.ERROR,
                     f"Error raised while uploading tags: {err.message}")
-        raise err
\ No newline at end of file
+        raise err
+
+def build_carton_details_batch(list_of_carton_details: list) -> dict:
+    """
+    This method builds the body of one upload request for several cartons of the same
+    shipment, each of them built by build_carton_details
+    """
+    return {
+        'location': list_of_carton_details[0]['location'],
+        'shipmentId': list_of_carton_details[0]['shipmentId'],
+        'cartons': [
+            {key: value for key, value in carton_details.items() if key not in BATCH_KEYS}
+            for carton_details in list_of_carton_details
+        ]
+    }
+
+def post_carton_details_batch(list_of_carton_details: list) -> list:
+    """
+    This method uploads several cartons of the same shipment in one API request
+
+    Returns
+    -------
+    List
+      One dict per carton, in the order given, with a success key and, for a carton the
+      server refused, a message key. None for a carton the response has no result for, it
+      has to be sent again on its own
+
+    Raises
+    ------
+    BatchUnsupportedError
+      If the response holds no list of results, which is what a server without the batch
+      endpoint may answer. The cartons have to be sent one at a time
+    """
+    try:
+        logger.log(logging.DEBUG, f"Making a POST request for a batch of {len(list_of_carton_details)} cartons")
+        response = post_in_supported_format(
+            batch_api_request, build_carton_details_batch(list_of_carton_details), encode_carton_details_batch)
+        logger.log(logging.DEBUG,
+                    f"Received the following response: {response}")
+    except ApiError as err:
+        logger.log(logging.ERROR,
+                    f"Error raised while uploading a batch of cartons: {err.message}")
+        raise err
+    # Only a result for a carton says what happened to it, a carton without one cannot be
+    # trusted to have been saved
+    results = response.get('results') if isinstance(response, dict) else None
+    if not isinstance(results, list) or not all(isinstance(result, dict) for result in results):
+        raise BatchUnsupportedError('The response to the batch upload has no results')
+    results_by_barcode = {result.get('cartonBarcode'): result for result in results}
+    return [results_by_barcode.get(carton_details['cartonBarcode']) for carton_details in list_of_carton_details]
+
+def upload_carton_details(list_of_epc_tags, carton_weight, carton_code, carton_barcode, carton_pack_type, shipment_id) -> bool:
+    return post_carton_details(build_carton_details(
+        list_of_epc_tags, carton_weight, carton_code, carton_barcode, carton_pack_type, shipment_id))
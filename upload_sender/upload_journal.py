@@ -0,0 +1,106 @@
+"""
+This file contains the journal that carton details are written to before they are uploaded.
+
+The journal is an SQLite file in WAL mode, so writing a carton is one small append that is on
+disk in a few milliseconds and survives a crash or a power cut. The UploadSender process
+drains the journal in the background, which means the station never waits for the network.
+"""
+import json
+import logging
+import sqlite3
+import time
+from os import path
+
+from station_config import load_station_config
+
+logger = logging.getLogger('upload_journal')
+
+PENDING = 'pending'
+FAILED = 'failed'
+
+
+class UploadJournal():
+    """
+    This class is used to hold the carton details that still have to be uploaded
+
+    Attributes
+    ----------
+    path: str
+      The SQLite file the journal is kept in
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # The main process writes and the sender process reads, a writer waits for the other
+        # rather than failing
+        self.connection = sqlite3.connect(path, timeout=10)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        # Every commit is synced, a carton that was reported as saved must not be lost
+        self.connection.execute('PRAGMA synchronous=FULL')
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS uploads ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, carton_details TEXT NOT NULL, status TEXT NOT NULL, '
+                'attempts INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, next_attempt_at REAL NOT NULL, '
+                'last_error TEXT)'
+            )
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS uploads_by_next_attempt ON uploads (status, next_attempt_at)')
+
+    def append(self, carton_details: dict) -> int:
+        """This method writes the details of one carton to the journal and returns its ID"""
+        now = time.time()
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO uploads (carton_details, status, created_at, next_attempt_at) VALUES (?, ?, ?, ?)',
+                (json.dumps(carton_details), PENDING, now, now)
+            )
+        return cursor.lastrowid
+
+    def get_pending(self) -> list:
+        """
+        This method returns every pending upload, oldest first, as a list of
+        (upload ID, carton details, attempts, created at, next attempt at) tuples
+        """
+        rows = self.connection.execute(
+            'SELECT id, carton_details, attempts, created_at, next_attempt_at FROM uploads WHERE status = ? ORDER BY id',
+            (PENDING,)
+        ).fetchall()
+        return [(upload_id, json.loads(carton_details), *rest) for upload_id, carton_details, *rest in rows]
+
+    def get_carton_codes_by_barcode(self) -> dict:
+        """This method returns the carton code of every carton in the journal, keyed by its barcode"""
+        rows = self.connection.execute(
+            "SELECT json_extract(carton_details, '$.cartonBarcode'), json_extract(carton_details, '$.cartonCode') FROM uploads"
+        ).fetchall()
+        return {carton_barcode: carton_code for carton_barcode, carton_code in rows if carton_code}
+
+    def count_pending(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM uploads WHERE status = ?', (PENDING,)).fetchone()[0]
+
+    def mark_sent(self, upload_id: int) -> None:
+        with self.connection:
+            self.connection.execute('DELETE FROM uploads WHERE id = ?', (upload_id,))
+
+    def mark_retry(self, upload_id: int, next_attempt_at: float, error: str) -> None:
+        with self.connection:
+            self.connection.execute(
+                'UPDATE uploads SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id = ?',
+                (next_attempt_at, error, upload_id)
+            )
+
+    def mark_failed(self, upload_id: int, error: str) -> None:
+        """This method keeps an upload the server refused in the journal, without retrying it"""
+        with self.connection:
+            self.connection.execute(
+                'UPDATE uploads SET status = ?, attempts = attempts + 1, last_error = ? WHERE id = ?',
+                (FAILED, error, upload_id)
+            )
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def get_upload_journal_path() -> str:
+    dirname = path.dirname(path.dirname(__file__))
+    return path.join(dirname, load_station_config()['upload_journal']['path'])
@@ -0,0 +1,238 @@
+from multiprocessing import Process, Queue
+import logging
+import queue
+import random
+import time
+
+from exceptions import ApiError, BatchUnsupportedError
+from message_bus.messages import send_message, UploadSentMessage, UploadRetryingMessage, UploadRejectedMessage
+from process_supervisor import Heartbeat
+from station_config import load_station_config
+from upload_carton_details import post_carton_details, post_carton_details_batch
+from upload_sender.upload_journal import UploadJournal, get_upload_journal_path
+from upload_sender.upload_sender_enums import UploadSenderEnums
+
+# Responses that say nothing about the carton itself, the upload is tried again
+RETRYABLE_STATUS_CODES = (401, 408, 429)
+
+# Responses that mean the server has no batch endpoint, the cartons are sent one at a time
+BATCH_UNSUPPORTED_STATUS_CODES = (404, 405)
+
+
+class UploadSender(Process):
+    """
+    This class is used to upload the cartons written to the upload journal in the background
+
+    Uploads are sent oldest first, one carton per request. Only when batch_uploads is turned
+    on in the upload_journal section of the station config are the cartons of one shipment
+    batched into a single request. An upload that fails because the server could not be reached (or had an error
+    of its own) stays in the journal and is tried again after a delay that doubles with every
+    attempt. An upload the server refuses is kept in the journal but not tried again, and
+    the operator is told about it.
+    """
+
+    def __init__(self, queue: Queue, main_queue: Queue):
+        """
+        Parameters
+        ----------
+        queue: Queue
+          The queue the main process uses to say that a new carton was written to the journal
+          or that a shipment was closed
+        main_queue: Queue
+          The queue this process reports the result of every upload on
+        """
+        Process.__init__(self)
+        self.queue = queue
+        self.main_queue = main_queue
+        self.logger = logging.getLogger('upload_sender')
+        upload_journal_config = load_station_config()['upload_journal']
+        self.retry_initial_delay = upload_journal_config['retry_initial_delay']
+        self.retry_max_delay = upload_journal_config['retry_max_delay']
+        self.batch_size = upload_journal_config['batch_size']
+        self.batch_max_age = upload_journal_config['batch_max_age']
+        self.closed_shipment_ids = set()
+        # The batch endpoint is only used on a server it has been turned on for
+        self.is_batch_upload_supported = upload_journal_config['batch_uploads']
+        self.upload_journal = None
+        self.heartbeat = Heartbeat(main_queue)
+
+    def get_retry_delay(self, attempts: int) -> float:
+        """This method returns the backoff before the next attempt, with some jitter"""
+        delay = min(self.retry_initial_delay * (2 ** attempts), self.retry_max_delay)
+        return delay + random.uniform(0, delay * 0.1)
+
+    def is_retryable(self, err: Exception) -> bool:
+        if isinstance(err, ApiError):
+            return err.status_code is None or err.status_code >= 500 or err.status_code in RETRYABLE_STATUS_CODES
+        return True
+
+    def send_result_to_main_process(self, message_class, upload_id: int, carton_details: dict, message: str = None) -> None:
+        send_message(self.main_queue, message_class(
+            upload_id, carton_details['cartonBarcode'], self.upload_journal.count_pending(), message))
+
+    def get_batches(self, pending_uploads: list) -> list:
+        """
+        This method groups the pending uploads into batches of the same shipment, oldest
+        first, and returns a list of (time the batch is ready at, uploads) tuples
+
+        The shipment of the newest carton is still being packed, so its cartons wait until
+        there are batch_size of them or the oldest has waited batch_max_age. The cartons of
+        any other shipment, and cartons that have already been tried, are ready straight away.
+        """
+        uploads_by_shipment = {}
+        for upload in pending_uploads:
+            uploads_by_shipment.setdefault(upload[1]['shipmentId'], []).append(upload)
+        open_shipment_id = pending_uploads[-1][1]['shipmentId']
+
+        batches = []
+        for shipment_id, uploads in uploads_by_shipment.items():
+            is_shipment_closed = shipment_id != open_shipment_id or shipment_id in self.closed_shipment_ids
+            for index in range(0, len(uploads), self.batch_size):
+                batch = uploads[index:index + self.batch_size]
+                if is_shipment_closed or len(batch) == self.batch_size or batch[0][2] > 0:
+                    batches.append((0, batch))
+                else:
+                    batches.append((batch[0][3] + self.batch_max_age, batch))
+        return batches
+
+    def send_due_uploads(self):
+        """
+        This method sends every batch that is due and returns how long to wait before the
+        next one is, or None when nothing is left to upload
+
+        While an upload is waiting to be retried nothing else is sent, since it would most
+        likely fail the same way
+        """
+        while True:
+            pending_uploads = self.upload_journal.get_pending()
+            if len(pending_uploads) == 0:
+                return None
+            now = time.time()
+            blocked_until = max(upload[4] for upload in pending_uploads)
+            batches = [(max(ready_at, blocked_until), batch) for ready_at, batch in self.get_batches(pending_uploads)]
+            due_batches = [batch for send_at, batch in batches if send_at <= now]
+            if len(due_batches) == 0:
+                return min(send_at for send_at, _ in batches) - now
+            for batch in due_batches:
+                is_sent = self.send_batch(batch)
+                # Every request can take up to its timeout, a backlog must not look like a stuck process
+                self.heartbeat.beat()
+                if is_sent is False:
+                    break
+
+    def send_batch(self, batch: list) -> bool:
+        """
+        This method uploads a batch of cartons and records the result of every one of them
+
+        Returns
+        -------
+        bool
+          False if the batch has to be retried later
+        """
+        if len(batch) > 1 and self.is_batch_upload_supported is True:
+            try:
+                results = post_carton_details_batch([carton_details for _, carton_details, *_ in batch])
+            except ApiError as err:
+                if isinstance(err, BatchUnsupportedError) or err.status_code in BATCH_UNSUPPORTED_STATUS_CODES:
+                    self.logger.log(logging.INFO, "The server does not accept batches, uploading one carton at a time")
+                    self.is_batch_upload_supported = False
+                    return self.send_batch(batch)
+                return self.handle_failed_upload(batch, err)
+            except Exception as err:
+                return self.handle_failed_upload(batch, err)
+
+            uploads_without_result = []
+            for upload, result in zip(batch, results):
+                if result is None:
+                    uploads_without_result.append(upload)
+                elif result.get('success', True) is True:
+                    self.handle_sent_upload(upload)
+                else:
+                    self.handle_failed_upload([upload], ApiError(result.get('message', 'The carton was refused'), 400))
+            if len(uploads_without_result) > 0:
+                self.logger.log(
+                    logging.WARNING,
+                    f"The server sent no result for {len(uploads_without_result)} cartons of the batch, uploading them one at a time")
+            # Only the cartons the server said nothing about are sent again
+            return self.send_one_at_a_time(uploads_without_result)
+
+        return self.send_one_at_a_time(batch)
+
+    def send_one_at_a_time(self, uploads: list) -> bool:
+        """
+        This method uploads the cartons with one request each and records the result of every one of them
+
+        Returns
+        -------
+        bool
+          False if an upload has to be retried later, the uploads after it are not sent
+        """
+        for upload in uploads:
+            self.heartbeat.beat()
+            try:
+                post_carton_details(upload[1])
+            except Exception as err:
+                if self.handle_failed_upload([upload], err) is False:
+                    return False
+                continue
+            self.handle_sent_upload(upload)
+        return True
+
+    def handle_sent_upload(self, upload) -> None:
+        upload_id, carton_details, *_ = upload
+        self.upload_journal.mark_sent(upload_id)
+        self.logger.log(logging.DEBUG, f"Uploaded carton {carton_details['cartonBarcode']}")
+        self.send_result_to_main_process(UploadSentMessage, upload_id, carton_details)
+
+    def handle_failed_upload(self, uploads: list, err: Exception) -> bool:
+        """
+        This method schedules the uploads for a retry, or marks them as failed if the server
+        refused them
+
+        Returns
+        -------
+        bool
+          False if the uploads will be retried
+        """
+        message = err.message if isinstance(err, ApiError) else str(err)
+        if self.is_retryable(err):
+            retry_delay = self.get_retry_delay(uploads[0][2])
+            for upload_id, carton_details, *_ in uploads:
+                self.logger.log(
+                    logging.ERROR,
+                    f"Could not upload carton {carton_details['cartonBarcode']}, retrying in {retry_delay:.0f} s: {message}")
+                self.upload_journal.mark_retry(upload_id, time.time() + retry_delay, message)
+                self.send_result_to_main_process(UploadRetryingMessage, upload_id, carton_details, message)
+            return False
+        for upload_id, carton_details, *_ in uploads:
+            self.logger.log(
+                logging.ERROR, f"The server refused carton {carton_details['cartonBarcode']}: {message}")
+            self.upload_journal.mark_failed(upload_id, message)
+            self.send_result_to_main_process(UploadRejectedMessage, upload_id, carton_details, message)
+        return True
+
+    def send_uploads(self) -> None:
+        # The connection is opened here, after the process has been started
+        self.upload_journal = UploadJournal(get_upload_journal_path())
+        should_exit_loop = False
+        loop_started_at = None
+        while should_exit_loop is False:
+            wait_timeout = self.send_due_uploads()
+            # Uploads can take a while, the supervisor is told how long the longest loop took
+            self.heartbeat.beat(loop_started_at)
+            try:
+                input_queue_value = self.queue.get(timeout=self.heartbeat.get_timeout(wait_timeout))
+            except queue.Empty:
+                loop_started_at = time.monotonic()
+                continue
+            loop_started_at = time.monotonic()
+            if input_queue_value is None:
+                self.logger.log(logging.DEBUG, "Exiting the upload sender process")
+                should_exit_loop = True
+            elif isinstance(input_queue_value, dict) and input_queue_value['type'] == UploadSenderEnums.CLOSE_SHIPMENT.value:
+                # The cartons of a closed shipment are sent without waiting for a full batch
+                self.closed_shipment_ids.add(str(input_queue_value['data']['shipment_id']))
+        self.upload_journal.close()
+
+    def run(self):
+        self.send_uploads()
@@ -0,0 +1,9 @@
+from enum import Enum, unique
+
+@unique
+class UploadSenderEnums(Enum):
+    """
+    This class is used to enumerate the messages passed to the upload sender
+    """
+    NEW_UPLOAD_JOURNALED = 'new upload journaled'
+    CLOSE_SHIPMENT = 'close shipment'
@@ -1,9 +1,12 @@
 from multiprocessing import Process, Queue
 import serial
 import logging
-from time import sleep, time
+import queue
+from time import time, monotonic
 
 from weighing_scale.weighing_scale_enums import WeighingScaleEnums
+from message_bus.messages import send_message, WeightValueReadMessage
+from process_supervisor import Heartbeat
 
 class WeighingScale(Process):
     def __init__(self, queue: Queue, main_queue: Queue):
@@ -13,6 +16,7 @@ class WeighingScale(Process):
         self.weight = 0
         self.logger = logging.getLogger('weighing_scale')
         self.serial_device_1 = None
+        self.heartbeat = Heartbeat(main_queue)
 
     def read_weight(self):
         try:
@@ -23,41 +27,53 @@ class WeighingScale(Process):
                 logging.ERROR, f"There was an error while opening the port to read from the weighing scale: {err}")
             raise err
         should_exit_loop = False
+        loop_started_at = None
         while should_exit_loop is False:
-            # 50ms sleep to schedule out the process and reduce CPU usage
-            sleep(0.05)
-            if self.queue.qsize() > 0:
-                input_queue_string = self.queue.get()
-                if input_queue_string == WeighingScaleEnums.START_WEIGHING.value:
-                    #   Reset the input buffer so stale values are not read
-                    self.serial_device_1.reset_input_buffer()
-                    start_time = time()
-                    is_weight_read = False
+            # Sleep until the main process sends a command, the scale is only read after one
+            self.heartbeat.beat(loop_started_at)
+            loop_started_at = None
+            try:
+                input_queue_string = self.queue.get(timeout=self.heartbeat.get_timeout())
+            except queue.Empty:
+                continue
+            loop_started_at = monotonic()
+            if input_queue_string == WeighingScaleEnums.START_WEIGHING.value:
+                #   Reset the input buffer so stale values are not read
+                self.serial_device_1.reset_input_buffer()
+                start_time = time()
+                is_weight_read = False
 
-                    #   Keep reading for 3 seconds and until a valid weight is read
-                    while is_weight_read is False:
-                        weight_in_bytes = self.serial_device_1.readline()
-                        weight_as_string = weight_in_bytes.decode('ascii')
-                        try:
-                            self.weight = float(weight_as_string)
-                        except ValueError as err:
-                            # Not reading this data because scale is calibrating
-                            pass
+                #   Keep reading for 3 seconds and until a valid weight is read. An empty scale
+                #   is read for as long as it takes, every read times out after 0.5 seconds so
+                #   the heartbeat keeps going and the main process can stop the wait
+                while is_weight_read is False:
+                    self.heartbeat.beat()
+                    #   Another START_WEIGHING while the weight is being read is dropped
+                    try:
+                        if self.queue.get_nowait() is None:
+                            self.logger.log(
+                                logging.DEBUG, "Exiting the weighing process while waiting for a weight")
+                            should_exit_loop = True
+                            break
+                    except queue.Empty:
+                        pass
+                    weight_in_bytes = self.serial_device_1.readline()
+                    weight_as_string = weight_in_bytes.decode('ascii')
+                    try:
+                        self.weight = float(weight_as_string)
+                    except ValueError as err:
+                        # Not reading this data because scale is calibrating
+                        pass
 
-                        if self.weight > 0 and time() - start_time > 2:
-                            is_weight_read = True
-                            self.main_queue.put({
-                                'type': WeighingScaleEnums.WEIGHT_VALUE_READ.value,
-                                'data': {
-                                    'weight': self.weight
-                                }
-                            })
+                    if self.weight > 0 and time() - start_time > 2:
+                        is_weight_read = True
+                        send_message(self.main_queue, WeightValueReadMessage(self.weight))
 
-                    self.weight = 0
-                elif input_queue_string is None:
-                    self.logger.log(
-                        logging.DEBUG, "Exiting the weighing process")
-                    should_exit_loop = True
+                self.weight = 0
+            elif input_queue_string is None:
+                self.logger.log(
+                    logging.DEBUG, "Exiting the weighing process")
+                should_exit_loop = True
 
         self.serial_device_1.flush()
         self.serial_device_1.reset_input_buffer()
@@ -1,8 +1,12 @@
 from multiprocessing import Process, Queue
 import logging
+import queue
 import random
+import time
 
 from weighing_scale.weighing_scale_enums import WeighingScaleEnums
+from message_bus.messages import send_message, WeightValueReadMessage
+from process_supervisor import Heartbeat
 
 
 class WeighingScaleTest(Process):
@@ -12,27 +16,30 @@ class WeighingScaleTest(Process):
         self.main_queue = main_queue
         self.weight = 0
         self.logger = logging.getLogger('weighing_scale_test')
+        self.heartbeat = Heartbeat(main_queue)
 
     def run(self):
         should_exit_loop = False
+        loop_started_at = None
         while should_exit_loop is False:
-            if self.queue.qsize() > 0:
-                input_queue_string = self.queue.get()
-                if input_queue_string == WeighingScaleEnums.START_WEIGHING.value:
-                    is_weight_read = False
-                    while is_weight_read is False:
-                        self.weight = round(random.uniform(5.0, 10.0), 2)
-                        self.logger.log(
-                            logging.DEBUG, f"Read the weight from the scale as: {self.weight}")
-                        is_weight_read = True
-                        self.main_queue.put({
-                            'type': WeighingScaleEnums.WEIGHT_VALUE_READ.value,
-                            'data': {
-                                'weight': self.weight
-                            }
-                        })
-                    self.weight = 0
-                elif input_queue_string is None:
+            # Sleep until the main process sends a command or the next heartbeat is due
+            self.heartbeat.beat(loop_started_at)
+            loop_started_at = None
+            try:
+                input_queue_string = self.queue.get(timeout=self.heartbeat.get_timeout())
+            except queue.Empty:
+                continue
+            loop_started_at = time.monotonic()
+            if input_queue_string == WeighingScaleEnums.START_WEIGHING.value:
+                is_weight_read = False
+                while is_weight_read is False:
+                    self.weight = round(random.uniform(5.0, 10.0), 2)
                     self.logger.log(
-                        logging.DEBUG, "Exiting the weighing process")
-                    should_exit_loop = True
+                        logging.DEBUG, f"Read the weight from the scale as: {self.weight}")
+                    is_weight_read = True
+                    send_message(self.main_queue, WeightValueReadMessage(self.weight))
+                self.weight = 0
+            elif input_queue_string is None:
+                self.logger.log(
+                    logging.DEBUG, "Exiting the weighing process")
+                should_exit_loop = True